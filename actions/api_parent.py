@@ -45,39 +45,13 @@ class ApiParent(ParentAction):
     def get_visible_layers(self, as_list=False):
         """ Return string as {...} or [...] with name of table in DB of all visible layer in TOC """
 
-        visible_layer = '{'
-        if as_list is True:
-            visible_layer = '['
-        layers = self.controller.get_layers()
-        for layer in layers:
-            if self.controller.is_layer_visible(layer):
-                table_name = self.controller.get_layer_source_table_name(layer)
-                table = layer.dataProvider().dataSourceUri()
-                # TODO:: Find differences between PostgreSQL and query layers, and replace this if condition.
-                if 'SELECT row_number() over ()' in str(table) or 'srid' not in str(table):
-                    continue
-
-                visible_layer += f'"{table_name}", '
-        visible_layer = visible_layer[:-2]
-
-        if as_list is True:
-            visible_layer += ']'
-        else:
-            visible_layer += '}'
-        return visible_layer
+        return self.controller.get_visible_layers(as_list)
 
 
     def get_editable_layers(self):
         """ Return string as {...}  with name of table in DB of all editable layer in TOC """
 
-        editable_layer = '{'
-        layers = self.controller.get_layers()
-        for layer in layers:
-            if not layer.isReadOnly():
-                table_name = self.controller.get_layer_source_table_name(layer)
-                editable_layer += f'"{table_name}", '
-        editable_layer = editable_layer[:-2] + "}"
-        return editable_layer
+        return self.controller.get_editable_layers()
 
 
     def set_completer_object_api(self, completer, model, widget, list_items, max_visible=10):
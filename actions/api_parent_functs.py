@@ -8,10 +8,11 @@ or (at your option) any later version.
 from qgis.core import QgsVectorLayer
 from qgis.core import QgsExpression, QgsFeatureRequest, QgsGeometry
 from qgis.gui import QgsDateTimeEdit
-from qgis.PyQt.QtCore import Qt, QSettings, QTimer, QDate, QStringListModel
+from qgis.PyQt.QtCore import Qt, QSettings, QTimer, QDate, QSortFilterProxyModel, QStringListModel
 from qgis.PyQt.QtGui import QColor, QFontMetrics, QStandardItemModel, QStandardItem
 from qgis.PyQt.QtWidgets import QLineEdit, QSizePolicy, QWidget, QComboBox, QGridLayout, QSpacerItem, QLabel, QCheckBox
-from qgis.PyQt.QtWidgets import QCompleter, QDateEdit, QDoubleSpinBox, QFrame, QSpinBox, QToolButton
+from qgis.PyQt.QtWidgets import QAbstractItemView, QCompleter, QDateEdit, QDoubleSpinBox, QFrame, QListView, QSpinBox, \
+    QToolButton
 from qgis.PyQt.QtWidgets import QTableView, QTabWidget, QPushButton, QTextEdit, QApplication
 from qgis.PyQt.QtSql import QSqlTableModel
 
@@ -34,39 +35,13 @@ from ..core.utils.layer_tools import manage_geometry, export_layer_to_db, delete
 def get_visible_layers(as_list=False):
     """ Return string as {...} or [...] with name of table in DB of all visible layer in TOC """
 
-    visible_layer = '{'
-    if as_list is True:
-        visible_layer = '['
-    layers = global_vars.controller.get_layers()
-    for layer in layers:
-        if global_vars.controller.is_layer_visible(layer):
-            table_name = global_vars.controller.get_layer_source_table_name(layer)
-            table = layer.dataProvider().dataSourceUri()
-            # TODO:: Find differences between PostgreSQL and query layers, and replace this if condition.
-            if 'SELECT row_number() over ()' in str(table) or 'srid' not in str(table):
-                continue
-
-            visible_layer += f'"{table_name}", '
-    visible_layer = visible_layer[:-2]
-
-    if as_list is True:
-        visible_layer += ']'
-    else:
-        visible_layer += '}'
-    return visible_layer
+    return global_vars.controller.get_visible_layers(as_list)
 
 
 def get_editable_layers():
     """ Return string as {...}  with name of table in DB of all editable layer in TOC """
 
-    editable_layer = '{'
-    layers = global_vars.controller.get_layers()
-    for layer in layers:
-        if not layer.isReadOnly():
-            table_name = global_vars.controller.get_layer_source_table_name(layer)
-            editable_layer += f'"{table_name}", '
-    editable_layer = editable_layer[:-2] + "}"
-    return editable_layer
+    return global_vars.controller.get_editable_layers()
 
 
 def set_completer_object_api(completer, model, widget, list_items, max_visible=10):
@@ -1268,17 +1243,19 @@ def manage_all(dialog, widget_all, selector_vars):
     key_modifier = QApplication.keyboardModifiers()
     status = qt_tools.isChecked(dialog, widget_all)
     index = dialog.main_tab.currentIndex()
-    widget_list = dialog.main_tab.widget(index).findChildren(QCheckBox)
+    tab_name = dialog.main_tab.widget(index).objectName()
     if key_modifier == Qt.ShiftModifier:
         return
 
-    for widget in widget_list:
-        if widget_all is not None:
-            if widget == widget_all or widget.objectName() == widget_all.objectName():
-                continue
-        widget.blockSignals(True)
-        qt_tools.setChecked(dialog, widget, status)
-        widget.blockSignals(False)
+    model = selector_vars.get(f"model_{tab_name}")
+    if model is not None:
+        check_state = Qt.Checked if status else Qt.Unchecked
+        selector_vars['updating_selectors'] = True
+        for row in range(model.rowCount()):
+            item = model.item(row)
+            if item.isEnabled():
+                item.setCheckState(check_state)
+        selector_vars['updating_selectors'] = False
 
     set_selector(dialog, widget_all, False, selector_vars)
 
@@ -1286,156 +1263,182 @@ def manage_all(dialog, widget_all, selector_vars):
 def get_selector(dialog, selector_type, filter=False, widget=None, text_filter=None, current_tab=None,
                  is_setselector=None, selector_vars={}):
     """ Ask to DB for selectors and make dialog
+    Each tab shows its selectors in a list view of a checkable item model. The whole list is kept in the
+    dialog and filtered in memory by a proxy model, so typing in the filter doesn't query the DB
     :param dialog: Is a standard dialog, from file api_selectors.ui, where put widgets
     :param selector_type: list of selectors to ask DB ['exploitation', 'state', ...]
+    :param is_setselector: Result of gw_fct_setselectors. Check states of existing tabs are updated with it
     """
 
-    index = 0
     main_tab = dialog.findChild(QTabWidget, 'main_tab')
 
-    # Set filter
+    # Set filter of current tab
     if filter is not False:
-        main_tab = dialog.findChild(QTabWidget, 'main_tab')
-        text_filter = qt_tools.getWidgetText(dialog, widget)
-        if text_filter in ('null', None):
-            text_filter = ''
-
-        # Set current_tab
-        index = dialog.main_tab.currentIndex()
-        current_tab = dialog.main_tab.widget(index).objectName()
+        set_selector_filter(dialog, widget, selector_vars)
+        return True
 
-    # Profilactic control of nones
-    if text_filter is None:
-        text_filter = ''
     if is_setselector is None:
-        # Built querytext
+        # Built querytext. Filter is applied in the dialog, so all the selectors are requested
         form = f'"currentTab":"{current_tab}"'
-        extras = f'"selectorType":{selector_type}, "filterText":"{text_filter}"'
+        extras = f'"selectorType":{selector_type}, "filterText":""'
         body = create_body(form=form, extras=extras)
         json_result = global_vars.controller.get_json('gw_fct_getselectors', body)
     else:
         json_result = is_setselector
-        for x in range(dialog.main_tab.count() - 1, -1, -1):
-            dialog.main_tab.widget(x).deleteLater()
 
     if not json_result:
         return False
 
     for form_tab in json_result['body']['form']['formTabs']:
 
-        if filter and form_tab['tabName'] != str(current_tab):
-            continue
-
-        selection_mode = form_tab['selectionMode']
-
-        # Create one tab for each form_tab and add to QTabWidget
-        tab_widget = QWidget(main_tab)
-        tab_widget.setObjectName(form_tab['tabName'])
-        tab_widget.setProperty('selector_type', form_tab['selectorType'])
-        if filter:
-            main_tab.removeTab(index)
-            main_tab.insertTab(index, tab_widget, form_tab['tabLabel'])
-        else:
-            main_tab.addTab(tab_widget, form_tab['tabLabel'])
-
-        # Create a new QGridLayout and put it into tab
-        gridlayout = QGridLayout()
-        gridlayout.setObjectName("grl_" + form_tab['tabName'])
-        tab_widget.setLayout(gridlayout)
-        field = {}
-        i = 0
-
-        if 'typeaheadFilter' in form_tab:
-            label = QLabel()
-            label.setObjectName('lbl_filter')
-            label.setText('Filter:')
-            if qt_tools.getWidget(dialog, 'txt_filter_' + str(form_tab['tabName'])) is None:
-                widget = QLineEdit()
-                widget.setObjectName('txt_filter_' + str(form_tab['tabName']))
-                widget.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-                selector_vars[f"var_txt_filter_{form_tab['tabName']}"] = ''
-                widget.textChanged.connect(partial(get_selector, dialog, selector_type, filter=True,
-                                                   widget=widget, current_tab=current_tab, selector_vars=selector_vars))
-                widget.textChanged.connect(partial(manage_filter, dialog, widget, 'save', selector_vars))
-                widget.setLayoutDirection(Qt.RightToLeft)
-
-            else:
-                widget = qt_tools.getWidget(dialog, 'txt_filter_' + str(form_tab['tabName']))
-
-            field['layoutname'] = gridlayout.objectName()
-            field['layoutorder'] = i
-            i = i + 1
-            put_widgets(dialog, field, label, widget)
-            widget.setFocus()
-
-        if 'manageAll' in form_tab:
-            if (form_tab['manageAll']).lower() == 'true':
-                if qt_tools.getWidget(dialog, f"lbl_manage_all_{form_tab['tabName']}") is None:
-                    label = QLabel()
-                    label.setObjectName(f"lbl_manage_all_{form_tab['tabName']}")
-                    label.setText('Check all')
-                else:
-                    label = qt_tools.getWidget(dialog, f"lbl_manage_all_{form_tab['tabName']}")
-
-                if qt_tools.getWidget(dialog, f"chk_all_{form_tab['tabName']}") is None:
-                    widget = QCheckBox()
-                    widget.setObjectName('chk_all_' + str(form_tab['tabName']))
-                    widget.stateChanged.connect(partial(manage_all, dialog, widget, selector_vars))
-                    widget.setLayoutDirection(Qt.RightToLeft)
-
-                else:
-                    widget = qt_tools.getWidget(dialog, f"chk_all_{form_tab['tabName']}")
-                field['layoutname'] = gridlayout.objectName()
-                field['layoutorder'] = i
-                i = i + 1
-                chk_all = widget
-                put_widgets(dialog, field, label, widget)
-
-        for order, field in enumerate(form_tab['fields']):
-            label = QLabel()
-            label.setObjectName('lbl_' + field['label'])
-            label.setText(field['label'])
+        model = selector_vars.get(f"model_{form_tab['tabName']}")
+        if model is None:
+            model = add_selector_tab(dialog, main_tab, form_tab, selector_vars)
+        selector_vars['updating_selectors'] = True
+        try:
+            populate_selector_model(model, form_tab['fields'])
+        finally:
+            selector_vars['updating_selectors'] = False
 
-            widget = add_checkbox(field)
-            widget.stateChanged.connect(partial(set_selection_mode, dialog, widget, selection_mode, selector_vars))
-            widget.setLayoutDirection(Qt.RightToLeft)
+    # Set last tab used by user as current tab
+    if is_setselector is None:
+        tabname = json_result['body']['form']['currentTab']
+        tab = main_tab.findChild(QWidget, tabname)
+        if tab:
+            main_tab.setCurrentWidget(tab)
 
-            field['layoutname'] = gridlayout.objectName()
-            field['layoutorder'] = order + i
-            put_widgets(dialog, field, label, widget)
+    return True
 
-        vertical_spacer1 = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-        gridlayout.addItem(vertical_spacer1)
 
-    # Set last tab used by user as current tab
-    tabname = json_result['body']['form']['currentTab']
-    tab = main_tab.findChild(QWidget, tabname)
+def add_selector_tab(dialog, main_tab, form_tab, selector_vars):
+    """ Add tab with the widgets of @form_tab to @main_tab
+    :return: Model of the checkable items of the tab (QStandardItemModel)
+    """
 
-    if tab:
-        main_tab.setCurrentWidget(tab)
+    tab_name = form_tab['tabName']
+    selection_mode = form_tab['selectionMode']
+
+    # Create one tab for each form_tab and add to QTabWidget
+    tab_widget = QWidget(main_tab)
+    tab_widget.setObjectName(tab_name)
+    tab_widget.setProperty('selector_type', form_tab['selectorType'])
+    main_tab.addTab(tab_widget, form_tab['tabLabel'])
+
+    # Create a new QGridLayout and put it into tab
+    gridlayout = QGridLayout()
+    gridlayout.setObjectName("grl_" + tab_name)
+    tab_widget.setLayout(gridlayout)
+    field = {'layoutname': gridlayout.objectName()}
+    i = 0
+
+    model = QStandardItemModel(tab_widget)
+    proxy_model = QSortFilterProxyModel(tab_widget)
+    proxy_model.setSourceModel(model)
+    proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
+    selector_vars[f"model_{tab_name}"] = model
+    selector_vars[f"proxy_{tab_name}"] = proxy_model
+
+    if 'typeaheadFilter' in form_tab:
+        label = QLabel()
+        label.setObjectName('lbl_filter')
+        label.setText('Filter:')
+        widget = QLineEdit()
+        widget.setObjectName('txt_filter_' + str(tab_name))
+        widget.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
+        selector_vars[f"var_txt_filter_{tab_name}"] = ''
+        widget.textChanged.connect(partial(set_selector_filter, dialog, widget, selector_vars, tab_name))
+        widget.textChanged.connect(partial(manage_filter, dialog, widget, 'save', selector_vars))
+        widget.setLayoutDirection(Qt.RightToLeft)
+        field['layoutorder'] = i
+        i = i + 1
+        put_widgets(dialog, field, label, widget)
+        widget.setFocus()
+
+    if 'manageAll' in form_tab and (form_tab['manageAll']).lower() == 'true':
+        label = QLabel()
+        label.setObjectName(f"lbl_manage_all_{tab_name}")
+        label.setText('Check all')
+        widget = QCheckBox()
+        widget.setObjectName('chk_all_' + str(tab_name))
+        widget.stateChanged.connect(partial(manage_all, dialog, widget, selector_vars))
+        widget.setLayoutDirection(Qt.RightToLeft)
+        field['layoutorder'] = i
+        i = i + 1
+        put_widgets(dialog, field, label, widget)
+
+    list_view = QListView()
+    list_view.setObjectName(f"lst_{tab_name}")
+    list_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    list_view.setUniformItemSizes(True)
+    list_view.setModel(proxy_model)
+    gridlayout.addWidget(list_view, i, 0, 1, 3)
+    gridlayout.setColumnStretch(2, 1)
+
+    model.itemChanged.connect(partial(set_selection_mode, dialog, tab_name, selection_mode, selector_vars))
+
+    return model
+
+
+def populate_selector_model(model, fields):
+    """ Set items of @model with selectors @fields. Existing items are reused, only updating their check state """
+
+    items = {}
+    for row in range(model.rowCount()):
+        item = model.item(row)
+        items[item.data(Qt.UserRole)] = item
+
+    new_items = []
+    for field in fields:
+        item = items.pop(field['widgetname'], None)
+        if item is None:
+            item = QStandardItem(field['label'])
+            item.setCheckable(True)
+            item.setEditable(False)
+            item.setData(field['widgetname'], Qt.UserRole)
+            item.setData(field['columnname'], Qt.UserRole + 1)
+            new_items.append(item)
+        is_checked = 'value' in field and field['value'] in ("t", "true", True)
+        item.setCheckState(Qt.Checked if is_checked else Qt.Unchecked)
+        if 'iseditable' in field:
+            item.setEnabled(field['iseditable'])
+
+    # Remove selectors not received anymore
+    for row in range(model.rowCount() - 1, -1, -1):
+        if model.item(row).data(Qt.UserRole) in items:
+            model.removeRow(row)
+
+    for item in new_items:
+        model.appendRow(item)
+
+
+def set_selector_filter(dialog, widget, selector_vars, tab_name=None):
+    """ Filter selectors of tab @tab_name (current tab if not set) with text of @widget """
+
+    if tab_name is None:
+        index = dialog.main_tab.currentIndex()
+        tab_name = dialog.main_tab.widget(index).objectName()
+    proxy_model = selector_vars.get(f"proxy_{tab_name}")
+    if proxy_model is None:
+        return
 
-    if is_setselector is not None:
-        widget = dialog.main_tab.findChild(QLineEdit, f'txt_filter_{tabname}')
-        if widget:
-            widget.blockSignals(True)
-            index = dialog.main_tab.currentIndex()
-            tab_name = dialog.main_tab.widget(index).objectName()
-            value = selector_vars[f"var_txt_filter_{tab_name}"]
-            qt_tools.setWidgetText(dialog, widget, f'{value}')
-            widget.blockSignals(False)
+    text_filter = qt_tools.getWidgetText(dialog, widget)
+    if text_filter in ('null', None):
+        text_filter = ''
+    proxy_model.setFilterFixedString(text_filter)
 
 
-def set_selection_mode(dialog, widget, selection_mode, selector_vars):
+def set_selection_mode(dialog, tab_name, selection_mode, selector_vars, item):
     """ Manage selection mode
     :param dialog: QDialog where search all checkbox
-    :param widget: QCheckBox that has changed status (QCheckBox)
+    :param tab_name: Name of the tab of @item
     :param selection_mode: "keepPrevious", "keepPreviousUsingShift", "removePrevious" (String)
+    :param item: Item that has changed its check state (QStandardItem)
     """
 
-    # Get QCheckBox check all
-    index = dialog.main_tab.currentIndex()
-    widget_list = dialog.main_tab.widget(index).findChildren(QCheckBox)
-    tab_name = dialog.main_tab.widget(index).objectName()
+    # Check states changed by the dialog itself
+    if selector_vars.get('updating_selectors'):
+        return
+
     widget_all = dialog.findChild(QCheckBox, f'chk_all_{tab_name}')
 
     is_alone = False
@@ -1448,39 +1451,29 @@ def set_selection_mode(dialog, widget, selection_mode, selector_vars):
             widget_all.blockSignals(True)
             qt_tools.setChecked(dialog, widget_all, False)
             widget_all.blockSignals(False)
-        remove_previuos(dialog, widget, widget_all, widget_list)
+        selector_vars['updating_selectors'] = True
+        remove_previuos(selector_vars[f"model_{tab_name}"], item)
+        selector_vars['updating_selectors'] = False
 
-    set_selector(dialog, widget, is_alone, selector_vars)
+    set_selector(dialog, item, is_alone, selector_vars)
 
 
-def remove_previuos(dialog, widget, widget_all, widget_list):
-    """ Remove checks of not selected QCheckBox
-    :param dialog: QDialog
-    :param widget: QCheckBox that has changed status (QCheckBox)
-    :param widget_all: QCheckBox that handles global selection (QCheckBox)
-    :param widget_list: List of all QCheckBox in the current tab ([QCheckBox, QCheckBox, ...])
+def remove_previuos(model, item):
+    """ Remove checks of not selected items
+    :param model: Model of the items of the tab (QStandardItemModel)
+    :param item: Item that has changed its check state (QStandardItem)
     """
 
-    for checkbox in widget_list:
-        # Some selectors.ui dont have widget_all
-        if widget_all is not None:
-            if checkbox == widget_all or checkbox.objectName() == widget_all.objectName():
-                continue
-            elif checkbox.objectName() != widget.objectName():
-                checkbox.blockSignals(True)
-                qt_tools.setChecked(dialog, checkbox, False)
-                checkbox.blockSignals(False)
-
-        elif checkbox.objectName() != widget.objectName():
-            checkbox.blockSignals(True)
-            qt_tools.setChecked(dialog, checkbox, False)
-            checkbox.blockSignals(False)
+    for row in range(model.rowCount()):
+        other_item = model.item(row)
+        if other_item.data(Qt.UserRole) != item.data(Qt.UserRole) and other_item.checkState() != Qt.Unchecked:
+            other_item.setCheckState(Qt.Unchecked)
 
 
 def set_selector(dialog, widget, is_alone, selector_vars):
-    """  Send values to DB and reload selectors
+    """  Send changed value to DB and update check states of selectors with its result
     :param dialog: QDialog
-    :param widget: QCheckBox that contains the information to generate the json (QCheckBox)
+    :param widget: Item of the selector changed (QStandardItem), or QCheckBox that handles global selection
     :param is_alone: Defines if the selector is unique (True) or multiple (False) (Boolean)
     """
 
@@ -1489,14 +1482,14 @@ def set_selector(dialog, widget, is_alone, selector_vars):
     tab_name = dialog.main_tab.widget(index).objectName()
     selector_type = dialog.main_tab.widget(index).property("selector_type")
     qgis_project_add_schema = global_vars.controller.plugin_settings_value('gwAddSchema')
-    widget_all = dialog.findChild(QCheckBox, f'chk_all_{tab_name}')
 
-    if widget_all is None or (widget_all is not None and widget.objectName() != widget_all.objectName()):
+    if isinstance(widget, QStandardItem):
+        is_checked = widget.checkState() == Qt.Checked
         extras = (f'"selectorType":"{selector_type}", "tabName":"{tab_name}", '
-                  f'"id":"{widget.objectName()}", "isAlone":"{is_alone}", "value":"{widget.isChecked()}", '
+                  f'"id":"{widget.data(Qt.UserRole)}", "isAlone":"{is_alone}", "value":"{is_checked}", '
                   f'"addSchema":"{qgis_project_add_schema}"')
     else:
-        check_all = qt_tools.isChecked(dialog, widget_all)
+        check_all = qt_tools.isChecked(dialog, widget)
         extras = f'"selectorType":"{selector_type}", "tabName":"{tab_name}", "checkAll":"{check_all}",  ' \
             f'"addSchema":"{qgis_project_add_schema}"'
 
@@ -1525,10 +1518,6 @@ def set_selector(dialog, widget, is_alone, selector_vars):
 
     get_selector(dialog, f'"{selector_type}"', is_setselector=json_result, selector_vars=selector_vars)
 
-    widget_filter = qt_tools.getWidget(dialog, f"txt_filter_{tab_name}")
-    if widget_filter and qt_tools.getWidgetText(dialog, widget_filter, False, False) not in (None, ''):
-        widget_filter.textChanged.emit(widget_filter.text())
-
 
 def manage_filter(dialog, widget, action, selector_vars):
     index = dialog.main_tab.currentIndex()
@@ -5,9 +5,8 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
-from qgis.core import QgsCategorizedSymbolRenderer, QgsExpression, QgsFeatureRequest, QgsGeometry, QgsPointLocator, \
-    QgsPointXY, QgsProject, QgsRectangle, QgsRendererCategory, QgsSimpleFillSymbolLayer, QgsSnappingConfig, QgsSymbol, \
-    QgsVectorLayer
+from qgis.core import QgsExpression, QgsFeatureRequest, QgsGeometry, QgsPointLocator, QgsPointXY, QgsProject, \
+    QgsRectangle, QgsSnappingConfig, QgsVectorLayer
 from qgis.gui import QgsRubberBand
 from qgis.PyQt.QtCore import Qt, QDate, QStringListModel, QTimer
 from qgis.PyQt.QtWidgets import QGroupBox, QAbstractItemView, QTableView, QFileDialog, QApplication, QCompleter, \
@@ -15,7 +14,6 @@ from qgis.PyQt.QtWidgets import QGroupBox, QAbstractItemView, QTableView, QFileD
 from qgis.PyQt.QtGui import QIcon, QColor, QCursor, QPixmap
 from qgis.PyQt.QtSql import QSqlTableModel, QSqlQueryModel
 
-import random
 import configparser
 import os
 import re
@@ -29,6 +27,7 @@ from .. import global_vars
 from lib import qt_tools
 from ..core.utils.giswater_tools import close_dialog, open_dialog
 from ..core.utils.layer_tools import populate_vlayer, categoryze_layer, create_qml, from_postgres_to_toc
+from ..core.utils.mapzone_styles import get_mapzone_styles
 from ..lib.qgis_tools import snap_to_layer, set_snapping_mode, get_snapping_options
 from ..ui_manager import DialogTextUi
 
@@ -1084,55 +1083,8 @@ def set_style_mapzones():
     if not json_return:
         return False
 
-    for mapzone in json_return['body']['data']['mapzones']:
-
-        # Loop for each mapzone returned on json
-        lyr = global_vars.controller.get_layer_by_tablename(mapzone['layer'])
-        categories = []
-        status = mapzone['status']
-        if status == 'Disable':
-            pass
-
-        if lyr:
-            # Loop for each id returned on json
-            for id in mapzone['values']:
-                # initialize the default symbol for this geometry type
-                symbol = QgsSymbol.defaultSymbol(lyr.geometryType())
-                symbol.setOpacity(float(mapzone['opacity']))
-
-                # Setting simp
-                R = random.randint(0, 255)
-                G = random.randint(0, 255)
-                B = random.randint(0, 255)
-                if status == 'Stylesheet':
-                    try:
-                        R = id['stylesheet']['color'][0]
-                        G = id['stylesheet']['color'][1]
-                        B = id['stylesheet']['color'][2]
-                    except TypeError:
-                        R = random.randint(0, 255)
-                        G = random.randint(0, 255)
-                        B = random.randint(0, 255)
-
-                elif status == 'Random':
-                    R = random.randint(0, 255)
-                    G = random.randint(0, 255)
-                    B = random.randint(0, 255)
-
-                # Setting sytle
-                layer_style = {'color': '{}, {}, {}'.format(int(R), int(G), int(B))}
-                symbol_layer = QgsSimpleFillSymbolLayer.create(layer_style)
-
-                if symbol_layer is not None:
-                    symbol.changeSymbolLayer(0, symbol_layer)
-                category = QgsRendererCategory(id['id'], symbol, str(id['id']))
-                categories.append(category)
-
-                # apply symbol to layer renderer
-                lyr.setRenderer(QgsCategorizedSymbolRenderer(mapzone['idname'], categories))
-
-                # repaint layer
-                lyr.triggerRepaint()
+    # Apply one renderer to each mapzone layer. Layers whose style data has not changed are not repainted
+    get_mapzone_styles().set_styles(json_return['body']['data']['mapzones'])
 
 
 def manage_return_manager(json_result, sql, rubber_band=None):
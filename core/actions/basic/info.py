@@ -7,7 +7,7 @@ or (at your option) any later version.
 # -*- coding: latin-1 -*-
 from qgis.core import QgsMapToPixel, QgsVectorLayer, QgsExpression, QgsFeatureRequest, QgsPointXY
 from qgis.gui import QgsDateTimeEdit, QgsVertexMarker, QgsMapToolEmitPoint, QgsRubberBand
-from qgis.PyQt.QtCore import pyqtSignal, QDate, QObject, QRegExp, QStringListModel, Qt
+from qgis.PyQt.QtCore import pyqtSignal, QDate, QEvent, QObject, QRegExp, QStringListModel, Qt, QTimer
 from qgis.PyQt.QtGui import QColor, QRegExpValidator, QStandardItem, QStandardItemModel
 from qgis.PyQt.QtSql import QSqlTableModel
 from qgis.PyQt.QtWidgets import QAction, QAbstractItemView, QCheckBox, QComboBox, QCompleter, QDoubleSpinBox, \
@@ -52,6 +52,8 @@ class GwInfo(QObject):
 
     # :var signal_activate: emitted from def cancel_snapping_tool(self, dialog, action) in order to re-start CadApiInfo
     signal_activate = pyqtSignal()
+    # Milliseconds without editing auto-update fields before they are saved
+    auto_update_delay = 1500
 
     def __init__(self, tab_type):
         """ Class constructor """
@@ -70,6 +72,13 @@ class GwInfo(QObject):
         self.tab_type = tab_type
         self.rubber_band = QgsRubberBand(self.canvas, 0)
 
+        # Write-behind buffer of auto-update fields: {columnname: value}, saved by flush_auto_update
+        self.auto_update_json = {}
+        self.auto_update_widgets = []
+        self.auto_update_values = None
+        self.auto_update_dialog = None
+        self.auto_update_timer = None
+
 
     def get_info_from_coordinates(self, point, tab_type):
         return self.open_form(point=point, tab_type=tab_type)
@@ -92,6 +101,10 @@ class GwInfo(QObject):
         :return:
         """
 
+        # Save auto-update fields still pending of previous form
+        self.close_auto_update()
+        self.auto_update_values = None
+
         # Manage tab signal
         self.tab_element_loaded = False
         self.tab_relations_loaded = False
@@ -565,6 +578,7 @@ class GwInfo(QObject):
             self.dlg_cf.dlg_closed.connect(partial(save_settings, self.dlg_cf))
             self.dlg_cf.dlg_closed.connect(partial(self.set_vdefault_edition))
             self.dlg_cf.key_pressed.connect(partial(close_dialog, self.dlg_cf))
+        self.dlg_cf.dlg_closed.connect(self.close_auto_update)
         self.dlg_cf.dlg_closed.connect(self.disconect_signals)
         # Set title
         toolbox_cf = self.dlg_cf.findChild(QWidget, 'toolBox')
@@ -970,6 +984,7 @@ class GwInfo(QObject):
 
     def manage_docker_close(self):
 
+        self.close_auto_update()
         self.roll_back()
         self.rubber_band.reset()
         self.set_vdefault_edition()
@@ -1324,24 +1339,12 @@ class GwInfo(QObject):
         id_name = complet_result['body']['feature']['idName']
         parent_fields = complet_result['body']['data']['parentFields']
         fields_reload = ""
-        list_mandatory = []
         for field in complet_result['body']['data']['fields']:
             if p_widget and (field['widgetname'] == p_widget.objectName()):
                 if field['widgetcontrols'] and 'autoupdateReloadFields' in field['widgetcontrols']:
                     fields_reload = field['widgetcontrols']['autoupdateReloadFields']
 
-            if field['ismandatory']:
-                widget_name = 'data_' + field['columnname']
-                widget = self.dlg_cf.findChild(QWidget, widget_name)
-                widget.setStyleSheet(None)
-                value = qt_tools.getWidgetText(self.dlg_cf, widget)
-                if value in ('null', None, ''):
-                    widget.setStyleSheet("border: 1px solid red")
-                    list_mandatory.append(widget_name)
-
-        if list_mandatory:
-            msg = "Some mandatory values are missing. Please check the widgets marked in red."
-            self.controller.show_warning(msg)
+        if not self.check_mandatory(complet_result):
             return
 
         # If we create a new feature
@@ -1399,6 +1402,32 @@ class GwInfo(QObject):
             close_dialog(dialog)
 
 
+    def check_mandatory(self, complet_result):
+        """ Check that mandatory fields of @complet_result have a value. Mark in red the ones that don't
+        :return: False if some mandatory value is missing
+        """
+
+        list_mandatory = []
+        for field in complet_result['body']['data']['fields']:
+            if field['ismandatory']:
+                widget_name = 'data_' + field['columnname']
+                widget = self.dlg_cf.findChild(QWidget, widget_name)
+                if widget is None:
+                    continue
+                widget.setStyleSheet(None)
+                value = qt_tools.getWidgetText(self.dlg_cf, widget)
+                if value in ('null', None, ''):
+                    widget.setStyleSheet("border: 1px solid red")
+                    list_mandatory.append(widget_name)
+
+        if list_mandatory:
+            msg = "Some mandatory values are missing. Please check the widgets marked in red."
+            self.controller.show_warning(msg)
+            return False
+
+        return True
+
+
     def get_scale_zoom(self):
 
         scale_zoom = self.iface.mapCanvas().scale()
@@ -1478,15 +1507,161 @@ class GwInfo(QObject):
             pass
 
 
+    def queue_auto_update(self, dialog, widget):
+        """ Add value of auto-update @widget to the fields pending to be saved. Pending fields are saved
+            together when they have not been edited for a while, when a textarea loses focus or when the form
+            is closed, instead of calling gw_fct_setfields for each change of each widget """
+
+        column_name = str(widget.property('columnname'))
+        get_values(dialog, widget, self.auto_update_json, self.layer)
+        if column_name not in self.auto_update_json:
+            return
+
+        if widget in self.auto_update_widgets:
+            self.auto_update_widgets.remove(widget)
+        self.auto_update_widgets.append(widget)
+        self.auto_update_dialog = dialog
+        if self.auto_update_timer is None:
+            self.auto_update_timer = QTimer()
+            self.auto_update_timer.setSingleShot(True)
+            self.auto_update_timer.timeout.connect(self.flush_auto_update)
+        self.auto_update_timer.start(self.auto_update_delay)
+
+
+    def eventFilter(self, obj, event):
+        """ Save pending auto-update fields when one of their textareas loses focus """
+
+        if event.type() == QEvent.FocusOut and obj in self.auto_update_widgets:
+            self.flush_auto_update()
+        return super().eventFilter(obj, event)
+
+
+    def flush_auto_update(self):
+        """ Save pending auto-update fields in a single call to gw_fct_setfields.
+            As when they were saved one by one, nothing is saved while some mandatory value is missing:
+            pending fields are kept until it is filled """
+
+        if self.auto_update_timer:
+            self.auto_update_timer.stop()
+        if not self.auto_update_json:
+            return True
+
+        complet_result = self.complet_result[0]
+        try:
+            if not self.check_mandatory(complet_result):
+                return False
+        except RuntimeError:
+            # Dialog has already been deleted
+            pass
+
+        fields = self.auto_update_json
+        widgets = self.auto_update_widgets
+        self.auto_update_json = {}
+        self.auto_update_widgets = []
+        self.check_auto_update_conflicts(complet_result, fields)
+
+        fields_reload = self.get_reload_fields(complet_result, widgets)
+        feature = f'"id":"{self.feature_id}", '
+        feature += f'"featureType":"{self.feature_type}", '
+        feature += f'"tableName":"{complet_result["body"]["feature"]["tableName"]}"'
+        extras = f'"fields":{json.dumps(fields)}, "reload":"{fields_reload}"'
+        body = create_body(feature=feature, extras=extras)
+        json_result = self.controller.get_json('gw_fct_setfields', body)
+        if not json_result or "Accepted" not in json_result['status']:
+            # If json_result['status'] is Failed message from database is showed user by get_json
+            msg = "Fields not saved"
+            self.controller.show_warning(msg, parameter=", ".join(fields))
+            return False
+
+        self.auto_update_values.update(fields)
+        msg = "OK"
+        self.controller.show_message(msg, message_level=3)
+        try:
+            self.reload_fields(self.auto_update_dialog, json_result, widgets[-1])
+        except RuntimeError:
+            # Dialog has already been deleted
+            pass
+
+        return True
+
+
+    def close_auto_update(self):
+        """ Save pending auto-update fields when the form is closed. Fields that can't be saved are discarded,
+            so they are not saved into the next feature """
+
+        self.flush_auto_update()
+        self.auto_update_json = {}
+        self.auto_update_widgets = []
+
+
+    def get_reload_fields(self, complet_result, widgets):
+        """ Get fields to reload after saving auto-update @widgets, as set in their 'autoupdateReloadFields' """
+
+        widget_names = [widget.objectName() for widget in widgets]
+        fields_reload = []
+        for field in complet_result['body']['data']['fields']:
+            if field['widgetname'] in widget_names and field['widgetcontrols'] \
+                    and 'autoupdateReloadFields' in field['widgetcontrols']:
+                reload = field['widgetcontrols']['autoupdateReloadFields']
+                if reload and reload not in fields_reload:
+                    fields_reload.append(reload)
+
+        return ",".join(str(reload) for reload in fields_reload)
+
+
+    def check_auto_update_conflicts(self, complet_result, fields):
+        """ Warn user if any of @fields has been changed in the database by someone else since the form loaded
+            it (or since it was last saved from this form). User values are saved anyway
+        :return: List of column names in conflict
+        """
+
+        if self.auto_update_values is None:
+            self.auto_update_values = {}
+            for field in complet_result['body']['data']['fields']:
+                if field.get('columnname'):
+                    self.auto_update_values[field['columnname']] = field.get('value')
+
+        columns = [column for column in fields if column in self.auto_update_values]
+        if not columns:
+            return []
+
+        table_name = complet_result['body']['feature']['tableName']
+        id_name = complet_result['body']['feature']['idName']
+        sql = (f"SELECT {', '.join(columns)} FROM {table_name} "
+               f"WHERE {id_name}::text = '{self.feature_id}'")
+        row = self.controller.dao.get_row(sql, commit=True)
+        if not row:
+            return []
+
+        conflicts = []
+        for i, column in enumerate(columns):
+            if not self.is_same_value(row[i], self.auto_update_values[column]) \
+                    and not self.is_same_value(row[i], fields[column]):
+                conflicts.append(column)
+        if conflicts:
+            msg = "These fields have been changed by another user since the form was opened. They will be overwritten"
+            self.controller.show_warning(msg, parameter=", ".join(conflicts))
+
+        return conflicts
+
+
+    def is_same_value(self, value1, value2):
+        """ Compare value from database @value1 with value from form @value2 """
+
+        if value1 in (None, '') or value2 in (None, ''):
+            return value1 in (None, '') and value2 in (None, '')
+        try:
+            return float(value1) == float(value2)
+        except (TypeError, ValueError):
+            return str(value1).lower() == str(value2).lower()
+
+
     def set_auto_update_lineedit(self, field, dialog, widget):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None and field['widgettype'] != 'typeahead':
-                _json = {}
                 widget.editingFinished.connect(partial(self.clean_my_json, widget))
-                widget.editingFinished.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.editingFinished.connect(
-                    partial(self.accept, dialog, self.complet_result[0], _json, widget, True, False))
+                widget.editingFinished.connect(partial(self.queue_auto_update, dialog, widget))
             else:
                 widget.editingFinished.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
 
@@ -1501,11 +1676,10 @@ class GwInfo(QObject):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None and field['widgettype'] != 'typeahead':
-                _json = {}
                 widget.textChanged.connect(partial(self.clean_my_json, widget))
-                widget.textChanged.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.textChanged.connect(
-                    partial(self.accept, dialog, self.complet_result[0], _json, widget, True, False))
+                widget.textChanged.connect(partial(self.queue_auto_update, dialog, widget))
+                # QTextEdit has no signal editingFinished. Save pending fields when it loses focus
+                widget.installEventFilter(self)
             else:
                 widget.textChanged.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
 
@@ -1548,11 +1722,8 @@ class GwInfo(QObject):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None:
-                _json = {}
                 widget.currentIndexChanged.connect(partial(self.clean_my_json, widget))
-                widget.currentIndexChanged.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.currentIndexChanged.connect(partial(
-                    self.accept, dialog, self.complet_result[0], _json, None, True, False))
+                widget.currentIndexChanged.connect(partial(self.queue_auto_update, dialog, widget))
             else:
                 widget.currentIndexChanged.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
 
@@ -1563,11 +1734,8 @@ class GwInfo(QObject):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None:
-                _json = {}
                 widget.dateChanged.connect(partial(self.clean_my_json, widget))
-                widget.dateChanged.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.dateChanged.connect(partial(
-                    self.accept, dialog, self.complet_result[0], _json, None, True, False))
+                widget.dateChanged.connect(partial(self.queue_auto_update, dialog, widget))
             else:
                 widget.dateChanged.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
 
@@ -1578,11 +1746,8 @@ class GwInfo(QObject):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None:
-                _json = {}
                 widget.valueChanged.connect(partial(self.clean_my_json, widget))
-                widget.valueChanged.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.valueChanged.connect(partial(
-                    self.accept, dialog, self.complet_result[0], _json, None, True, False))
+                widget.valueChanged.connect(partial(self.queue_auto_update, dialog, widget))
             else:
                 widget.valueChanged.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
 
@@ -1593,11 +1758,8 @@ class GwInfo(QObject):
 
         if self.check_tab_data(dialog):
             if field['isautoupdate'] and self.new_feature_id is None:
-                _json = {}
                 widget.stateChanged.connect(partial(self.clean_my_json, widget))
-                widget.stateChanged.connect(partial(get_values, dialog, widget, _json, self.layer))
-                widget.stateChanged.connect(partial(
-                    self.accept, dialog, self.complet_result[0], _json, None, True, False))
+                widget.stateChanged.connect(partial(self.queue_auto_update, dialog, widget))
             else:
                 widget.stateChanged.connect(partial(get_values, dialog, widget, self.my_json, self.layer))
         return widget
@@ -5,9 +5,9 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
-from qgis.core import QgsPointXY
+from qgis.core import QgsApplication, QgsPointXY
 from qgis.gui import QgsRubberBand
-from qgis.PyQt.QtCore import QStringListModel, Qt
+from qgis.PyQt.QtCore import QStringListModel, Qt, QTimer
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtSql import QSqlTableModel
 from qgis.PyQt.QtWidgets import QAbstractItemView, QComboBox, QCompleter, QFileDialog, QGridLayout, QHeaderView, \
@@ -18,6 +18,7 @@ import operator
 import os
 import re
 import sys
+from collections import OrderedDict
 from functools import partial
 
 from .... import global_vars
@@ -26,6 +27,7 @@ from .info import GwInfo
 from ..edit.document import GwDocument
 from ..plan.psector import GwPsector
 from ..om.visit_manager import GwVisitManager
+from ...tasks.tsk_search import GwSearchTask
 from ....ui_manager import SearchUi, InfoGenericUi, SearchWorkcat
 from ...utils.giswater_tools import close_dialog, create_body, get_parser_value, load_settings, open_dialog, set_parser_value
 from ....actions.parent_functs import refresh_map_canvas, zoom_to_rectangle, get_max_rectangle_from_coords, set_icon, \
@@ -55,6 +57,27 @@ class GwSearch:
 
         self.rubber_band = QgsRubberBand(self.canvas)
 
+        # Searches are executed in a background task when the user stops typing
+        self.search_delay = 300
+        try:
+            self.search_delay = int(global_vars.settings.value('system_variables/search_delay'))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.exec_search)
+        self.search_request = None
+        self.search_task = None
+        self.search_id = 0
+        # Results of gw_fct_setsearch by search context and text, and max. number of rows returned by each tab
+        self.search_cache = {}
+        self.search_cache_size = 100
+        self.search_max_rows = {}
+        # Items of last search result in the same order as the rows of the completer, and indexed by display name
+        self.result_data = None
+        self.result_list = []
+        self.result_index = {}
+
 
     def init_dialog(self):
         """ Initialize dialog. Make it dockable in left dock widget area """
@@ -100,6 +123,8 @@ class GwSearch:
 
         first_tab = None
         self.lineedit_list = []
+        self.search_cache = {}
+        self.search_max_rows = {}
         for tab in complet_list["form"]:
             if first_tab is None:
                 first_tab = tab['tabName']
@@ -126,6 +151,11 @@ class GwSearch:
                 gridlayout.addWidget(widget, x, 1)
                 x += 1
 
+            # If tab have more than one QLineEdit, clear second QLineEdit when first one changes
+            line_list = tab_widget.findChildren(QLineEdit)
+            if len(line_list) == 2:
+                line_list[0].textChanged.connect(partial(self.clear_line_edit_add, line_list))
+
             vertical_spacer1 = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
             gridlayout.addItem(vertical_spacer1)
 
@@ -140,6 +170,8 @@ class GwSearch:
 
     def close_search(self):
 
+        self.search_timer.stop()
+        self.search_id += 1
         self.dlg_search = None
         self.controller.set_user_settings_value('open_search', 'false')
 
@@ -150,7 +182,6 @@ class GwSearch:
         if completer:
             model = QStringListModel()
             completer.highlighted.connect(partial(self.check_tab, completer))
-            self.make_list(completer, model, widget)
             widget.textChanged.connect(partial(self.make_list, completer, model, widget))
 
         return widget
@@ -159,10 +190,10 @@ class GwSearch:
     def check_tab(self, completer, is_add_schema=False):
 
         # We look for the index of current tab so we can search by name
-        index = self.dlg_search.main_tab.currentIndex()
+        tab_index = self.dlg_search.main_tab.currentIndex()
 
         # Get all QLineEdit for activate or we cant write when tab have more than 1 QLineEdit
-        line_list = self.dlg_search.main_tab.widget(index).findChildren(QLineEdit)
+        line_list = self.dlg_search.main_tab.widget(tab_index).findChildren(QLineEdit)
         for line_edit in line_list:
             line_edit.setReadOnly(False)
             line_edit.setStyleSheet(None)
@@ -173,20 +204,18 @@ class GwSearch:
             return
 
         # Get text from selected row
-        _key = completer.completionModel().index(row, 0).data()
-        # Search text into self.result_data: this variable contains all matching objects in the function "make_list()"
-        item = None
-        for data in self.result_data['data']:
-            if _key == data['display_name']:
-                item = data
-                break
+        index = completer.completionModel().index(row, 0)
+        _key = index.data()
+        item = self.get_result_item(completer, index, _key)
+        if item is None:
+            return
 
         # Show info in docker?
         if self.is_mincut is False:
             self.controller.init_docker()
 
         # Get selected tab name
-        tab_selected = self.dlg_search.main_tab.widget(index).objectName()
+        tab_selected = self.dlg_search.main_tab.widget(tab_index).objectName()
 
         # check for addschema
         if tab_selected == 'add_network':
@@ -288,19 +317,51 @@ class GwSearch:
 
 
     def make_list(self, completer, model, widget):
-        """ Create a list of ids and populate widget (QLineEdit) """
+        """ Create a list of ids and populate widget (QLineEdit). Executed each time the text changes:
+            results are taken from cache if possible, otherwise the search is executed in a background task
+            when the user stops typing for @search_delay milliseconds """
+
+        # Any running search is outdated from now on
+        self.search_timer.stop()
+        self.search_id += 1
+        if self.search_task:
+            self.search_task.cancel()
+            self.search_task = None
+
+        request = self.get_search_request()
+        if request is None:
+            return
+
+        # Results of gw_fct_setsearch available in cache: only gw_fct_setsearchadd must be executed
+        result = self.get_cached_search(request)
+        if result is not None:
+            request['cached'] = [('gw_fct_setsearch', result)]
+            if request['body_add'] is None:
+                self.set_search_results(completer, model, widget, request, request['cached'])
+                return
+
+        self.search_request = (completer, model, widget, request)
+        self.search_timer.start(self.search_delay)
+
+
+    def get_search_request(self):
+        """ Get body of search functions from the widgets of current tab
+        :return: Dictionary with keys 'tab', 'context', 'text', 'body', 'body_add', 'text_add', 'line_list'
+            and 'cached'
+            or None if there is nothing to search
+        """
 
         # Create 2 json, one for first QLineEdit and other for second QLineEdit
         form_search = ''
         extras_search = ''
         form_search_add = ''
         extras_search_add = ''
-        result = None
         index = self.dlg_search.main_tab.currentIndex()
+        tab_name = self.dlg_search.main_tab.widget(index).objectName()
         combo_list = self.dlg_search.main_tab.widget(index).findChildren(QComboBox)
         line_list = self.dlg_search.main_tab.widget(index).findChildren(QLineEdit)
-        form_search += f'"tabName":"{self.dlg_search.main_tab.widget(index).objectName()}"'
-        form_search_add += f'"tabName":"{self.dlg_search.main_tab.widget(index).objectName()}"'
+        form_search += f'"tabName":"{tab_name}"'
+        form_search_add += f'"tabName":"{tab_name}"'
 
         if combo_list:
             combo = combo_list[0]
@@ -313,30 +374,156 @@ class GwSearch:
                 pass
             extras_search += f'"{combo.property("columnname")}":{{"id":"{id}", "name":"{name}"}}, '
             extras_search_add += f'"{combo.property("columnname")}":{{"id":"{id}", "name":"{name}"}}, '
-        if line_list:
-            line_edit = line_list[0]
-            # If current tab have more than one QLineEdit, clear second QLineEdit
-            if len(line_list) == 2:
-                line_edit.textChanged.connect(partial(self.clear_line_edit_add, line_list))
+        if not line_list:
+            return None
+
+        line_edit = line_list[0]
+        value = qt_tools.getWidgetText(self.dlg_search, line_edit, return_string_null=False)
+        if str(value) == '':
+            return None
+
+        # Everything but the text identifies the search, so results of a shorter text can be narrowed
+        qgis_project_add_schema = self.controller.plugin_settings_value('gwAddSchema')
+        context = (tab_name, extras_search, line_edit.property("columnname"), qgis_project_add_schema)
+        extras_search += f'"{line_edit.property("columnname")}":{{"text":"{value}"}}, '
+        extras_search += f'"addSchema":"{qgis_project_add_schema}"'
+        extras_search_add += f'"{line_edit.property("columnname")}":{{"text":"{value}"}}'
+        body = create_body(form=form_search, extras=extras_search)
+
+        body_add = None
+        value_add = None
+        if len(line_list) == 2:
+            line_edit_add = line_list[1]
+            value_add = qt_tools.getWidgetText(self.dlg_search, line_edit_add)
+            if str(value_add) != 'null':
+                extras_search_add += f', "{line_edit_add.property("columnname")}":{{"text":"{value_add}"}}'
+                body_add = create_body(form=form_search_add, extras=extras_search_add)
+
+        request = {'tab': tab_name, 'context': context, 'text': str(value), 'body': body, 'body_add': body_add,
+                   'text_add': value_add, 'line_list': line_list, 'cached': []}
+        return request
+
+
+    def get_cached_search(self, request):
+        """ Get result of gw_fct_setsearch for @request from cache.
+            If the text is not cached, narrow the result of the longest cached text it starts with, provided that
+            result was complete (less rows than the max. returned by the tab) and all its items matched that text
+            on 'display_name', the only field it can be narrowed on """
+
+        results = self.search_cache.get(request['context'])
+        if not results:
+            return None
+
+        text = request['text']
+        if text in results:
+            results.move_to_end(text)
+            return results[text]
+
+        prefix = None
+        for cached_text in results:
+            if text.startswith(cached_text) and (prefix is None or len(cached_text) > len(prefix)):
+                prefix = cached_text
+        if prefix is None:
+            return None
+
+        result = results[prefix]
+        data = result['data'] or []
+        if len(data) >= self.search_max_rows.get(request['tab'], 0):
+            return None
+
+        # Server may match fields not shown in 'display_name': those results can't be narrowed here
+        prefix = prefix.lower()
+        if any(prefix not in str(item['display_name']).lower() for item in data):
+            return None
+
+        text = text.lower()
+        narrowed = [item for item in data if text in str(item['display_name']).lower()]
+
+        result = dict(result)
+        result['data'] = narrowed or {}
+        self.add_cached_search(request, result)
+        return result
+
+
+    def add_cached_search(self, request, result):
+        """ Save result of gw_fct_setsearch for @request. Each search context keeps its most recent results """
+
+        if 'data' not in result:
+            return
+
+        tab = request['tab']
+        self.search_max_rows[tab] = max(self.search_max_rows.get(tab, 0), len(result['data'] or []))
+        results = self.search_cache.setdefault(request['context'], OrderedDict())
+        results[request['text']] = result
+        results.move_to_end(request['text'])
+        if len(results) > self.search_cache_size:
+            results.popitem(last=False)
 
-            value = qt_tools.getWidgetText(self.dlg_search, line_edit, return_string_null=False)
-            if str(value) == '':
+
+    def exec_search(self):
+        """ Execute search functions of last request in a background task """
+
+        if self.search_request is None or self.dlg_search is None:
+            return
+
+        completer, model, widget, request = self.search_request
+        calls = []
+        if not request['cached']:
+            calls.append(('gw_fct_setsearch', request['body']))
+        if request['body_add'] is not None:
+            calls.append(('gw_fct_setsearchadd', request['body_add']))
+
+        for function_name, body in calls:
+            if not self.controller.check_function(function_name):
+                self.controller.show_warning("Function not found in database", parameter=function_name)
                 return
 
-            qgis_project_add_schema = self.controller.plugin_settings_value('gwAddSchema')
-            extras_search += f'"{line_edit.property("columnname")}":{{"text":"{value}"}}, '
-            extras_search += f'"addSchema":"{qgis_project_add_schema}"'
-            extras_search_add += f'"{line_edit.property("columnname")}":{{"text":"{value}"}}'
-            body = create_body(form=form_search, extras=extras_search)
-            result = self.controller.get_json('gw_fct_setsearch', body, rubber_band=self.rubber_band)
-            if not result:
+        self.search_task = GwSearchTask("Search", self, self.search_id, calls)
+        QgsApplication.taskManager().addTask(self.search_task)
+
+
+    def search_finished(self, task, status):
+        """ Manage results of @task. Results of outdated searches are discarded """
+
+        if task is self.search_task:
+            self.search_task = None
+        if not status or task.request_id != self.search_id or self.dlg_search is None:
+            return
+
+        completer, model, widget, request = self.search_request
+        results = list(request['cached'])
+        for function_name, sql, json_result in task.results:
+            if not json_result:
+                self.controller.log_warning(f"Function error: {function_name}")
+                self.controller.log_warning(sql)
+                results.append((function_name, None))
+                continue
+            result = self.controller.manage_json_result(json_result, sql, self.rubber_band)
+            if function_name == 'gw_fct_setsearch' and result:
+                self.add_cached_search(request, result)
+            results.append((function_name, result))
+
+        try:
+            self.set_search_results(completer, model, widget, request, results)
+        except RuntimeError:
+            # Widgets deleted while searching
+            pass
+
+
+    def set_search_results(self, completer, model, widget, request, results):
+        """ Populate completers with @results: list of tuples (function_name, json_result) """
+
+        line_list = request['line_list']
+        for function_name, result in results:
+            if not result or 'data' not in result:
                 return False
 
-            if result:
-                self.result_data = result
+            display_list = self.set_result_data(result)
+            if function_name == 'gw_fct_setsearchadd':
+                self.update_completer_model(completer, model, line_list[1], display_list, request['text_add'])
+                continue
 
-        # Set label visible
-        if result:
+            # Set label visible
             if self.result_data['data'] == {} and self.lbl_visible:
                 self.dlg_search.lbl_msg.setVisible(True)
                 if len(line_list) == 2:
@@ -347,31 +534,86 @@ class GwSearch:
                 self.lbl_visible = True
                 self.dlg_search.lbl_msg.setVisible(False)
 
-            # Get list of items from returned json from data base and make a list for completer
-            display_list = []
-            for data in self.result_data['data']:
-                display_list.append(data['display_name'])
-            set_completer_object_api(completer, model, widget, display_list)
+            self.update_completer_model(completer, model, widget, display_list, request['text'])
 
-        if len(line_list) == 2:
-            line_edit_add = line_list[1]
-            value = qt_tools.getWidgetText(self.dlg_search, line_edit_add)
-            if str(value) == 'null':
-                return
 
-            extras_search_add += f', "{line_edit_add.property("columnname")}":{{"text":"{value}"}}'
-            body = create_body(form=form_search_add, extras=extras_search_add)
-            result = self.controller.get_json('gw_fct_setsearchadd', body, rubber_band=self.rubber_band)
-            if not result:
-                return False
+    def set_result_data(self, result):
+        """ Set @result as current search result and index its items by display name
+        :return: List of display names, in the same order as the items
+        """
 
-            if result:
-                self.result_data = result
-                if result is not None:
-                    display_list = []
-                    for data in self.result_data['data']:
-                        display_list.append(data['display_name'])
-                    set_completer_object_api(completer, model, line_edit_add, display_list)
+        self.result_data = result
+        self.result_list = list(result['data'] or [])
+        self.result_index = {}
+        display_list = []
+        for item in self.result_list:
+            display_name = item['display_name']
+            # Several items can have the same display name: keep all of them in order
+            self.result_index.setdefault(display_name, []).append(item)
+            display_list.append(display_name)
+
+        return display_list
+
+
+    def get_result_item(self, completer, index, display_name):
+        """ Get item of current search result selected in @completer
+        :param index: Index of the selected row in the completion model of @completer
+        :param display_name: Text of the selected row
+        """
+
+        # The row of the source model is the position of the item in the result, so duplicates are told apart
+        try:
+            row = completer.completionModel().mapToSource(index).row()
+        except AttributeError:
+            row = -1
+        if 0 <= row < len(self.result_list) and self.result_list[row]['display_name'] == display_name:
+            return self.result_list[row]
+
+        items = self.result_index.get(display_name)
+        if items:
+            return items[0]
+
+        return None
+
+
+    def update_completer_model(self, completer, model, widget, display_list, text):
+        """ Set @display_list into @model changing only the rows that differ from its current ones,
+            so the completer does not have to be reset when results are similar.
+            Then show the popup with the results of @text, unless the user has left @widget or changed its text """
+
+        if widget.completer() is not completer or completer.model() is not model:
+            set_completer_object_api(completer, model, widget, display_list)
+        elif model.stringList() != display_list:
+            self.update_model_rows(model, display_list)
+
+        # Results arrive after the text changed, so the completer won't pop up on its own until the next key
+        if widget.hasFocus() and widget.text() == text:
+            completer.complete()
+
+
+    def update_model_rows(self, model, display_list):
+        """ Set @display_list into @model removing and inserting only the rows that differ """
+
+        current_list = model.stringList()
+
+        # Keep rows in common at the beginning and at the end of both lists
+        start = 0
+        max_start = min(len(current_list), len(display_list))
+        while start < max_start and current_list[start] == display_list[start]:
+            start += 1
+        end = 0
+        max_end = max_start - start
+        while end < max_end and current_list[-end - 1] == display_list[-end - 1]:
+            end += 1
+
+        num_removed = len(current_list) - start - end
+        new_items = display_list[start:len(display_list) - end]
+        if num_removed:
+            model.removeRows(start, num_removed)
+        if new_items:
+            model.insertRows(start, len(new_items))
+            for i, display_name in enumerate(new_items):
+                model.setData(model.index(start + i), display_name)
 
 
     def clear_line_edit_add(self, line_list):
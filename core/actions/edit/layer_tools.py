@@ -17,6 +17,7 @@ from random import randrange
 
 from lib import qt_tools
 from .... import global_vars
+from ...utils.layer_tools import populate_vlayer
 
 
 class GwLayerTools:
@@ -388,40 +389,7 @@ class GwLayerTools:
         :return:
         """
 
-        prov = virtual_layer.dataProvider()
-        # Enter editing mode
-        virtual_layer.startEditing()
-
-        # Add headers to layer
-        if counter > 0:
-            for key, value in list(data[layer_type]['features'][0]['properties'].items()):
-                if key == 'the_geom':
-                    continue
-                prov.addAttributes([QgsField(str(key), QVariant.String)])
-
-        for feature in data[layer_type]['features']:
-            geometry = self.get_geometry(feature)
-            if not geometry:
-                continue
-            attributes = []
-            fet = QgsFeature()
-            fet.setGeometry(geometry)
-            for key, value in feature['properties'].items():
-                if key == 'the_geom':
-                    continue
-                attributes.append(value)
-
-            fet.setAttributes(attributes)
-            prov.addFeatures([fet])
-
-        # Commit changes
-        virtual_layer.commitChanges()
-        QgsProject.instance().addMapLayer(virtual_layer, False)
-        root = QgsProject.instance().layerTreeRoot()
-        my_group = root.findGroup(group)
-        if my_group is None:
-            my_group = root.insertGroup(0, group)
-        my_group.insertLayer(0, virtual_layer)
+        populate_vlayer(virtual_layer, data, layer_type, counter, group)
 
 
     def get_geometry(self, feature):
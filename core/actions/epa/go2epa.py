@@ -17,6 +17,7 @@ from .... import global_vars
 from lib import qt_tools
 from ..epa.go2epa_options import GwGo2EpaOptions
 from ...tasks.tsk_go2epa import GwGo2EpaTask
+from ...tasks.tsk_go2epa_batch import GwGo2EpaBatchTask
 from ...admin import GwAdmin
 from ....ui_manager import Go2EpaUI, HydrologySelector, Multirow_selector
 from ...utils.giswater_tools import close_dialog, get_parser_value, load_settings, open_dialog, set_parser_value
@@ -71,6 +72,8 @@ class GwGo2Epa:
             self.dlg_go2epa.chk_exec.setText('Execute EPA software (Runs only on Windows)')
 
         self.set_completer_result(self.dlg_go2epa.txt_result_name, 'v_ui_rpt_cat_result', 'result_id')
+        self.dlg_go2epa.txt_result_name.setToolTip("Several result names separated by commas are executed in batch, "
+                                                   "writing their INP and RPT files into the folder of the INP file")
 
         if self.controller.dlg_docker:
             self.controller.manage_translation('go2epa', self.dlg_go2epa)
@@ -159,8 +162,9 @@ class GwGo2Epa:
             self.controller.show_details(msg, title="Rpt fail", inf_text=None)
             return False
 
+        result_names = "', '".join(self.get_result_names(result_name))
         sql = (f"SELECT result_id FROM rpt_cat_result "
-               f"WHERE result_id = '{result_name}' LIMIT 1")
+               f"WHERE result_id IN ('{result_names}') LIMIT 1")
         row = self.controller.get_row(sql)
         if row:
             msg = "Result name already exists, do you want overwrite?"
@@ -369,8 +373,17 @@ class GwGo2Epa:
         if status is False:
             return
 
+        # Several result names: execute them in batch
+        result_name = qt_tools.getWidgetText(self.dlg_go2epa, self.dlg_go2epa.txt_result_name, False, False)
+        result_names = self.get_result_names(result_name)
+        if len(result_names) > 1:
+            if qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_export) and not self.check_sector_selector():
+                return
+            self.go2epa_batch(result_names)
+            return
+
         # Get widgets values
-        self.result_name = qt_tools.getWidgetText(self.dlg_go2epa, self.dlg_go2epa.txt_result_name, False, False)
+        self.result_name = result_name
         self.net_geom = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_only_check)
         self.export_inp = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_export)
         self.export_subcatch = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_export_subcatch)
@@ -380,13 +393,8 @@ class GwGo2Epa:
         self.import_result = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_import_result)
 
         # Check for sector selector
-        if self.export_inp:
-            sql = "SELECT sector_id FROM selector_sector LIMIT 1"
-            row = self.controller.get_row(sql)
-            if row is None:
-                msg = "You need to select some sector"
-                self.controller.show_info_box(msg)
-                return
+        if self.export_inp and not self.check_sector_selector():
+            return
 
         # Set background task 'Go2Epa'
         description = f"Go2Epa"
@@ -395,6 +403,63 @@ class GwGo2Epa:
         QgsApplication.taskManager().triggerTask(self.task_go2epa)
 
 
+    def get_result_names(self, result_name):
+        """ Get list of result names set in @result_name, separated by commas """
+
+        return [name.strip() for name in str(result_name).split(',') if name.strip() != '']
+
+
+    def check_sector_selector(self):
+        """ Check if user has selected some sector """
+
+        sql = "SELECT sector_id FROM selector_sector LIMIT 1"
+        row = self.controller.get_row(sql)
+        if row is None:
+            msg = "You need to select some sector"
+            self.controller.show_info_box(msg)
+            return False
+
+        return True
+
+
+    def go2epa_batch(self, scenarios, folder=None, max_workers=None):
+        """ Execute Go2Epa for each one of @scenarios using options of the dialog
+        :param scenarios: List of result ids, or list of dicts with keys 'result_id' and optionally
+            'dscenario_id' (ws) or 'hydrology_id' (ud) to be set before exporting it
+        :param folder: Folder of INP and RPT files. If not set, folder of INP file of the dialog
+        """
+
+        # Get widgets values
+        self.net_geom = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_only_check)
+        self.export_inp = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_export)
+        self.export_subcatch = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_export_subcatch)
+        self.exec_epa = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_exec)
+        self.import_result = qt_tools.isChecked(self.dlg_go2epa, self.dlg_go2epa.chk_import_result)
+        if folder is None:
+            file_inp = qt_tools.getWidgetText(self.dlg_go2epa, self.dlg_go2epa.txt_file_inp)
+            if file_inp in (None, 'null'):
+                msg = "Select valid INP file"
+                self.controller.show_warning(msg, parameter=str(file_inp))
+                return
+            folder = os.path.dirname(file_inp)
+
+        if not os.path.isdir(folder):
+            self.controller.show_warning("Folder not found", parameter=folder)
+            return
+
+        # Export holds a pooled connection for the whole batch, imports need at least another one
+        if self.controller.dao.pool_size < 2:
+            msg = "Go2Epa batch needs at least 2 database connections. Please, set 'db_pool_size' of config file"
+            self.controller.show_warning(msg, parameter=self.controller.dao.pool_size)
+            return
+
+        # Set background task 'Go2Epa batch'
+        description = f"Go2Epa batch"
+        self.task_go2epa = GwGo2EpaBatchTask(description, self, scenarios, folder, max_workers)
+        QgsApplication.taskManager().addTask(self.task_go2epa)
+        QgsApplication.taskManager().triggerTask(self.task_go2epa)
+
+
     def set_completer_result(self, widget, viewname, field_name):
         """ Set autocomplete of widget 'feature_id'
             getting id's from selected @viewname
@@ -64,9 +64,11 @@ class GwMincut:
         self.layers = dict()
         self.layers_connec = None
         self.arc_group = []
-        self.hydro_list = []
-        self.deleted_list = []
-        self.connec_list = []
+        self.hydro_ids = set()
+        self.deleted_ids = set()
+        self.connec_ids = set()
+        # Index of each connec layer: {layer id: ({connec_id: feature id}, {feature id: connec_id})}
+        self.connec_index = {}
 
         # Serialize data of mincut states
         self.set_states()
@@ -94,9 +96,10 @@ class GwMincut:
     def init_mincut_canvas(self):
 
         # Create the appropriate map tool and connect the gotPoint() signal.
-        self.connec_list = []
-        self.hydro_list = []
-        self.deleted_list = []
+        self.connec_ids = set()
+        self.hydro_ids = set()
+        self.deleted_ids = set()
+        self.connec_index = {}
 
         # Refresh canvas, remove all old selections
         self.remove_selection()
@@ -876,30 +879,21 @@ class GwMincut:
     def snapping_selection_hydro(self):
         """ Snap to connec layers to add its hydrometers """
 
-        self.connec_list = []
+        self.connec_ids = set()
 
         for layer in self.layers_connec:
-            if layer.selectedFeatureCount() > 0:
-                # Get selected features of the layer
-                features = layer.selectedFeatures()
-                # Get id from all selected features
-                for feature in features:
-                    connec_id = feature.attribute("connec_id")
-                    # Add element
-                    if connec_id in self.connec_list:
-                        message = "Feature already in the list"
-                        self.controller.show_info_box(message, parameter=connec_id)
-                        return
-                    else:
-                        self.connec_list.append(connec_id)
+            # Get id from all selected features
+            for connec_id in self.get_selected_connec_ids(layer):
+                # Add element
+                if connec_id in self.connec_ids:
+                    message = "Feature already in the list"
+                    self.controller.show_info_box(message, parameter=connec_id)
+                    return
+                else:
+                    self.connec_ids.add(connec_id)
 
         # Set 'expr_filter' with features that are in the list
-        expr_filter = "\"connec_id\" IN ("
-        for i in range(len(self.connec_list)):
-            expr_filter += f"'{self.connec_list[i]}', "
-        expr_filter = expr_filter[:-2] + ")"
-        if len(self.connec_list) == 0:
-            expr_filter = "\"connec_id\" =''"
+        expr_filter = self.get_expr_filter("connec_id", self.connec_ids)
         # Check expression
         (is_valid, expr) = self.check_expression(expr_filter)  # @UnusedVariable
         if not is_valid:
@@ -911,28 +905,16 @@ class GwMincut:
     def snapping_selection_connec(self):
         """ Snap to connec layers """
 
-        self.connec_list = []
+        self.connec_ids = set()
 
         for layer in self.layers_connec:
-            if layer.selectedFeatureCount() > 0:
-                # Get selected features of the layer
-                features = layer.selectedFeatures()
-                # Get id from all selected features
-                for feature in features:
-                    connec_id = feature.attribute("connec_id")
-                    # Add element
-                    if connec_id not in self.connec_list:
-                        self.connec_list.append(connec_id)
+            # Get id from all selected features
+            self.connec_ids.update(self.get_selected_connec_ids(layer))
 
         expr_filter = None
-        if len(self.connec_list) > 0:
+        if len(self.connec_ids) > 0:
             # Set 'expr_filter' with features that are in the list
-            expr_filter = "\"connec_id\" IN ("
-            for i in range(len(self.connec_list)):
-                expr_filter += f"'{self.connec_list[i]}', "
-            expr_filter = expr_filter[:-2] + ")"
-            if len(self.connec_list) == 0:
-                expr_filter = "\"connec_id\" =''"
+            expr_filter = self.get_expr_filter("connec_id", self.connec_ids)
             # Check expression
             (is_valid, expr) = self.check_expression(expr_filter)  # @UnusedVariable
             if not is_valid:
@@ -944,7 +926,7 @@ class GwMincut:
     def add_hydrometer(self):
         """ B4-122: Hydrometer selector """
 
-        self.connec_list = []
+        self.connec_ids = set()
         result_mincut_id_text = self.dlg_mincut.result_mincut_id.text()
 
         # Check if id exist in table 'om_mincut'
@@ -1028,7 +1010,7 @@ class GwMincut:
             return
 
         # Show message if element is already in the list
-        if hydrometer_cc in self.hydro_list:
+        if hydrometer_cc in self.hydro_ids:
             message = "Selected element already in the list"
             self.controller.show_info_box(message, parameter=hydrometer_cc)
             return
@@ -1042,44 +1024,96 @@ class GwMincut:
             self.controller.show_info_box(message, parameter=hydrometer_cc)
             return
 
-        if row[0] in self.hydro_list:
+        if row[0] in self.hydro_ids:
             message = "Selected element already in the list"
             self.controller.show_info_box(message, parameter=hydrometer_cc)
             return
 
-        # Set expression filter with 'hydro_list'
-
-        if row[0] in self.deleted_list:
-            self.deleted_list.remove(row[0])
-        self.hydro_list.append(row[0])
-        expr_filter = "\"hydrometer_id\" IN ("
-        for i in range(len(self.hydro_list)):
-            expr_filter += f"'{self.hydro_list[i]}', "
-        expr_filter = expr_filter[:-2] + ")"
+        # Set expression filter with 'hydro_ids'
+        self.deleted_ids.discard(row[0])
+        self.hydro_ids.add(row[0])
+        expr_filter = self.get_expr_filter("hydrometer_id", self.hydro_ids)
 
         # Reload table
         self.reload_table_hydro(expr_filter)
 
 
-    def select_features_group_layers(self, expr):
-        """ Select features of the layers filtering by @expr """
+    def select_features_group_layers(self, connec_ids):
+        """ Select features of the layers with ids @connec_ids, and add those found to 'connec_ids' """
 
         # Iterate over all layers of type 'connec'
-        # Select features and them to 'connec_list'
         for layer in self.layers_connec:
-            it = layer.getFeatures(QgsFeatureRequest(expr))
-            # Build a list of feature id's from the previous result
-            id_list = [i.id() for i in it]
-            # Select features with these id's
-            layer.selectByIds(id_list)
-            if layer.selectedFeatureCount() > 0:
-                # Get selected features of the layer
-                features = layer.selectedFeatures()
-                for feature in features:
-                    connec_id = feature.attribute("connec_id")
-                    # Check if 'connec_id' is already in 'connec_list'
-                    if connec_id not in self.connec_list:
-                        self.connec_list.append(connec_id)
+            found_ids = self.select_connec_ids(layer, connec_ids)
+            self.connec_ids.update(found_ids)
+
+
+    def get_connec_index(self, layer):
+        """ Get indexes ({connec_id: feature id}, {feature id: connec_id}) of connec @layer.
+            They are built reading only field 'connec_id' of its features, once for each mincut """
+
+        index = self.connec_index.get(layer.id())
+        if index is not None:
+            return index
+
+        fids = {}
+        connec_ids = {}
+        idx = layer.fields().indexFromName("connec_id")
+        if idx != -1:
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes([idx])
+            for feature in layer.getFeatures(request):
+                connec_id = feature[idx]
+                fids[connec_id] = feature.id()
+                connec_ids[feature.id()] = connec_id
+
+        index = (fids, connec_ids)
+        self.connec_index[layer.id()] = index
+        return index
+
+
+    def select_connec_ids(self, layer, connec_ids):
+        """ Select features of connec @layer with ids @connec_ids
+        :return: List of ids found in the layer
+        """
+
+        fids, _ = self.get_connec_index(layer)
+        found_ids = [connec_id for connec_id in connec_ids if connec_id in fids]
+        layer.selectByIds([fids[connec_id] for connec_id in found_ids])
+        return found_ids
+
+
+    def get_selected_connec_ids(self, layer):
+        """ Get connec_id of the selected features of connec @layer """
+
+        if layer.selectedFeatureCount() == 0:
+            return []
+
+        _, connec_ids = self.get_connec_index(layer)
+        selected_ids = []
+        missing_fids = []
+        for fid in layer.selectedFeatureIds():
+            connec_id = connec_ids.get(fid)
+            if connec_id is None:
+                missing_fids.append(fid)
+            else:
+                selected_ids.append(connec_id)
+
+        # Features added after the index was built
+        if missing_fids:
+            request = QgsFeatureRequest().setFilterFids(missing_fids).setFlags(QgsFeatureRequest.NoGeometry)
+            for feature in layer.getFeatures(request):
+                selected_ids.append(feature.attribute("connec_id"))
+
+        return selected_ids
+
+
+    def get_expr_filter(self, field_name, ids):
+        """ Get expression filter of features whose @field_name is one of @ids """
+
+        if len(ids) == 0:
+            return f"\"{field_name}\" =''"
+
+        values = ", ".join(f"'{value}'" for value in ids)
+        return f"\"{field_name}\" IN ({values})"
 
 
     def select_features_connec(self):
@@ -1091,22 +1125,15 @@ class GwMincut:
                f" WHERE result_id = {result_mincut_id}")
         rows = self.controller.get_rows(sql)
         if rows:
-            expr_filter = "\"connec_id\" IN ("
-            for row in rows:
-                if row[0] not in self.connec_list and row[0] not in self.deleted_list:
-                    self.connec_list.append(row[0])
-            for connec_id in self.connec_list:
-                expr_filter += f"'{connec_id}', "
-            expr_filter = expr_filter[:-2] + ")"
-            if len(self.connec_list) == 0:
-                expr_filter = "\"connec_id\" =''"
+            self.connec_ids.update(row[0] for row in rows if row[0] not in self.deleted_ids)
+            expr_filter = self.get_expr_filter("connec_id", self.connec_ids)
             # Check expression
             (is_valid, expr) = self.check_expression(expr_filter)
             if not is_valid:
                 return
 
-            # Select features of the layers filtering by @expr
-            self.select_features_group_layers(expr)
+            # Select features of the layers with these ids
+            self.select_features_group_layers(self.connec_ids)
 
             # Reload table
             self.reload_table_connec(expr_filter)
@@ -1114,7 +1141,7 @@ class GwMincut:
 
     def select_features_hydro(self):
 
-        self.connec_list = []
+        self.connec_ids = set()
 
         # Set 'expr_filter' of connecs related with current mincut
         result_mincut_id = qt_tools.getWidgetText(self.dlg_hydro, self.result_mincut_id)
@@ -1124,40 +1151,19 @@ class GwMincut:
                f" WHERE result_id = {result_mincut_id}")
         rows = self.controller.get_rows(sql)
         if rows:
-            expr_filter = "\"connec_id\" IN ("
-            for row in rows:
-                expr_filter += f"'{row[0]}', "
-            expr_filter = expr_filter[:-2] + ")"
-            if len(self.connec_list) == 0:
-                expr_filter = "\"connec_id\" =''"
-            # Check expression
-            (is_valid, expr) = self.check_expression(expr_filter)
-            if not is_valid:
-                return
-
-            # Select features of the layers filtering by @expr
-            self.select_features_group_layers(expr)
+            # Select features of the layers with these ids
+            self.select_features_group_layers({row[0] for row in rows})
 
         # Get list of 'hydrometer_id' belonging to current result_mincut
         result_mincut_id = qt_tools.getWidgetText(self.dlg_hydro, self.result_mincut_id)
         sql = (f"SELECT hydrometer_id FROM om_mincut_hydrometer"
                f" WHERE result_id = {result_mincut_id}")
         rows = self.controller.get_rows(sql)
-
-        expr_filter = "\"hydrometer_id\" IN ("
         if rows:
-            for row in rows:
-                if row[0] not in self.hydro_list:
-                    self.hydro_list.append(row[0])
-        for hyd in self.deleted_list:
-            if hyd in self.hydro_list:
-                self.hydro_list.remove(hyd)
-        for hyd in self.hydro_list:
-            expr_filter += f"'{hyd}', "
-
-        expr_filter = expr_filter[:-2] + ")"
-        if len(self.hydro_list) == 0:
-            expr_filter = "\"hydrometer_id\" =''"
+            self.hydro_ids.update(row[0] for row in rows)
+        self.hydro_ids -= self.deleted_ids
+
+        expr_filter = self.get_expr_filter("hydrometer_id", self.hydro_ids)
         # Reload contents of table 'hydro' with expr_filter
         self.reload_table_hydro(expr_filter)
 
@@ -1182,45 +1188,28 @@ class GwMincut:
 
         # Iterate over all layers
         for layer in self.layers_connec:
-            if layer.selectedFeatureCount() > 0:
-                # Get selected features of the layer
-                features = layer.selectedFeatures()
-                for feature in features:
-                    # Append 'connec_id' into 'connec_list'
-                    selected_id = feature.attribute("connec_id")
-                    if selected_id not in self.connec_list:
-                        self.connec_list.append(selected_id)
+            # Add 'connec_id' of selected features into 'connec_ids'
+            self.connec_ids.update(self.get_selected_connec_ids(layer))
 
         # Show message if element is already in the list
-        if connec_id in self.connec_list:
+        if connec_id in self.connec_ids:
             message = "Selected element already in the list"
             self.controller.show_info_box(message, parameter=connec_id)
             return
 
         # If feature id doesn't exist in list -> add
-        self.connec_list.append(connec_id)
+        self.connec_ids.add(connec_id)
 
-        expr_filter = None
-        if len(self.connec_list) > 0:
-
-            # Set expression filter with 'connec_list'
-            expr_filter = "\"connec_id\" IN ("
-            for i in range(len(self.connec_list)):
-                expr_filter += f"'{self.connec_list[i]}', "
-            expr_filter = expr_filter[:-2] + ")"
-            if len(self.connec_list) == 0:
-                expr_filter = "\"connec_id\" =''"
-            # Check expression
-            (is_valid, expr) = self.check_expression(expr_filter)
-            if not is_valid:
-                return
+        # Set expression filter with 'connec_ids'
+        expr_filter = self.get_expr_filter("connec_id", self.connec_ids)
+        # Check expression
+        (is_valid, expr) = self.check_expression(expr_filter)
+        if not is_valid:
+            return
 
-            # Select features with previous filter
-            for layer in self.layers_connec:
-                # Build a list of feature id's and select them
-                it = layer.getFeatures(QgsFeatureRequest(expr))
-                id_list = [i.id() for i in it]
-                layer.selectByIds(id_list)
+        # Select features with these ids
+        for layer in self.layers_connec:
+            self.select_connec_ids(layer, self.connec_ids)
 
         # Reload contents of table 'connec'
         self.reload_table_connec(expr_filter)
@@ -1338,27 +1327,17 @@ class GwMincut:
         if not answer:
             return
         else:
-            for el in del_id:
-                self.connec_list.remove(el)
+            self.connec_ids.difference_update(del_id)
 
         # Select features which are in the list
-        expr_filter = "\"connec_id\" IN ("
-        for i in range(len(self.connec_list)):
-            expr_filter += f"'{self.connec_list[i]}', "
-        expr_filter = expr_filter[:-2] + ")"
-
-        if len(self.connec_list) == 0:
-            expr_filter = "connec_id=''"
+        expr_filter = self.get_expr_filter("connec_id", self.connec_ids)
 
         # Update model of the widget with selected expr_filter
-        expr = self.reload_table_connec(expr_filter)
+        self.reload_table_connec(expr_filter)
 
         # Reload selection
         for layer in self.layers_connec:
-            # Build a list of feature id's and select them
-            it = layer.getFeatures(QgsFeatureRequest(expr))
-            id_list = [i.id() for i in it]
-            layer.selectByIds(id_list)
+            self.select_connec_ids(layer, self.connec_ids)
 
         self.connect_signal_selection_changed("mincut_connec")
 
@@ -1390,18 +1369,10 @@ class GwMincut:
         if not answer:
             return
         else:
-            for el in del_id:
-                self.hydro_list.remove(el)
-                if el not in self.deleted_list:
-                    self.deleted_list.append(el)
+            self.hydro_ids.difference_update(del_id)
+            self.deleted_ids.update(del_id)
         # Select features that are in the list
-        expr_filter = "\"hydrometer_id\" IN ("
-        for i in range(len(self.hydro_list)):
-            expr_filter += f"'{self.hydro_list[i]}', "
-        expr_filter = expr_filter[:-2] + ")"
-
-        if len(self.hydro_list) == 0:
-            expr_filter = "hydrometer_id=''"
+        expr_filter = self.get_expr_filter("hydrometer_id", self.hydro_ids)
 
         # Update model of the widget with selected expr_filter
         self.reload_table_hydro(expr_filter)
@@ -1420,20 +1391,17 @@ class GwMincut:
 
         sql = (f"DELETE FROM om_mincut_{element}"
                f" WHERE result_id = {result_mincut_id};\n")
-        for element_id in self.connec_list:
+        if self.connec_ids:
+            values = ", ".join(f"('{result_mincut_id}', '{element_id}')" for element_id in self.connec_ids)
             sql += (f"INSERT INTO om_mincut_{element}"
                     f" (result_id, {element}_id) "
-                    f" VALUES ('{result_mincut_id}', '{element_id}');\n")
-            # Get hydrometer_id of selected connec
-            sql2 = (f"SELECT hydrometer_id FROM v_rtc_hydrometer"
-                    f" WHERE connec_id = '{element_id}'")
-            rows = self.controller.get_rows(sql2)
-            if rows:
-                for row in rows:
-                    # Hydrometers associated to selected connec inserted to the table om_mincut_hydrometer
-                    sql += (f"INSERT INTO om_mincut_hydrometer"
-                            f" (result_id, hydrometer_id) "
-                            f" VALUES ('{result_mincut_id}', '{row[0]}');\n")
+                    f" VALUES {values};\n")
+            # Hydrometers associated to selected connecs inserted to the table om_mincut_hydrometer
+            element_ids = ", ".join(f"'{element_id}'" for element_id in self.connec_ids)
+            sql += (f"INSERT INTO om_mincut_hydrometer"
+                    f" (result_id, hydrometer_id) "
+                    f" SELECT '{result_mincut_id}', hydrometer_id FROM v_rtc_hydrometer"
+                    f" WHERE connec_id IN ({element_ids});\n")
 
         self.sql_connec = sql
         self.dlg_mincut.btn_start.setDisabled(False)
@@ -1451,10 +1419,11 @@ class GwMincut:
 
         sql = (f"DELETE FROM om_mincut_{element}"
                f" WHERE result_id = {result_mincut_id};\n")
-        for element_id in self.hydro_list:
+        if self.hydro_ids:
+            values = ", ".join(f"('{result_mincut_id}', '{element_id}')" for element_id in self.hydro_ids)
             sql += (f"INSERT INTO om_mincut_{element}"
                     f" (result_id, {element}_id) "
-                    f" VALUES ('{result_mincut_id}', '{element_id}');\n")
+                    f" VALUES {values};\n")
 
         self.sql_hydro = sql
         self.dlg_mincut.btn_start.setDisabled(False)
@@ -7,26 +7,32 @@ or (at your option) any later version.
 # -*- coding: utf-8 -*-
 from qgis.PyQt.QtWidgets import QLabel, QPushButton, QLineEdit
 from qgis.PyQt.QtGui import QPixmap
-from qgis.PyQt.QtCore import Qt
+from qgis.core import QgsApplication
 
-import urllib.request
-import urllib.error
-import urllib.parse
 from functools import partial
 
+from ...tasks.tsk_thumbnails import GwThumbnailsTask
 from ...utils.extended_qlabel import GwExtendedQLabel
 from ...utils.giswater_tools import close_dialog, load_settings, open_dialog
+from ...utils.thumbnail_cache import get_thumbnail_cache
 from ....ui_manager import Gallery, GalleryZoom
 from .... import global_vars
 from ....actions.parent_functs import set_icon
 
 
+# Size of the thumbnails of the gallery
+THUMBNAIL_SIZE = (171, 151)
+
+
 class GwVisitGallery:
 
     def __init__(self):
         """ Class to control 'Add element' of toolbar 'edit' """
 
         self.controller = global_vars.controller
+        self.task_page = None
+        self.task_prefetch = None
+        self.task_zoom = None
 
 
     def manage_gallery(self):
@@ -38,14 +44,13 @@ class GwVisitGallery:
 
     def fill_gallery(self, visit_id, event_id):
 
-        self.img_path_list = []
         self.img_path_list1D = []
 
         # Get all pictures for event_id | visit_id
         sql = (f"SELECT value FROM om_visit_event_photo"
                f" WHERE event_id = '{event_id}' AND visit_id = '{visit_id}'")
         rows = self.controller.get_rows(sql, commit=True)
-        num = len(rows)
+        num = len(rows) if rows else 0
         for m in range(0, num):
             self.img_path_list1D.append(rows[m][0])
 
@@ -59,52 +64,15 @@ class GwVisitGallery:
         for k in range(0, limit):  # @UnusedVariable
             self.img_path_list1D.append(0)
 
-        # Inicialization of two-dimensional array
-        columns = 9
-        rows = self.num_events
-        # noinspection PyUnusedLocal
-        self.img_path_list = [[0 for x in range(columns)] for x in range(rows)]
-
-        # Convert one-dimensional array to two-dimensional array
-        # Fill self.img_path_list with values from self.img_path_list1D
-        idx = 0
-        if rows == 1:
-            for br in range(0, len(self.img_path_list1D)):
-                self.img_path_list[0][br] = self.img_path_list1D[br]
-        else:
-            for h in range(0, rows):
-                for r in range(0, columns - 1):
-                    if idx >= columns:
-                        break
-                    self.img_path_list[h][r] = self.img_path_list1D[idx]
-                    idx = idx + 1
-
         # List of pointers(in memory) of clicableLabels
         self.list_widget = []
         self.list_labels = []
 
-        # Fill first slide of gallery
         for i in range(0, 9):
             widget_name = "img_" + str(i)
             widget = self.dlg_gallery.findChild(QLabel, widget_name)
             if widget:
-                # Set image to QLabel
-
-                # Parse a URL into components
-                url = urllib.parse.urlsplit(str(self.img_path_list[0][i]))
-
-                # Check if path is URL
-                if url.scheme == "http" or url.scheme == "https":
-                    url = str(self.img_path_list[0][i])
-                    data = urllib.request.urlopen(url).read()
-                    pixmap = QPixmap()
-                    pixmap.loadFromData(data)
-                else:
-                    pixmap = QPixmap(str(self.img_path_list[0][i]))
-
-                pixmap = pixmap.scaled(171, 151, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
                 widget_extended = GwExtendedQLabel(widget)
-                widget_extended.setPixmap(pixmap)
                 widget_extended.clicked.connect(partial(self.zoom_img, i, visit_id, event_id))
                 self.list_widget.append(widget_extended)
                 self.list_labels.append(widget)
@@ -123,11 +91,15 @@ class GwVisitGallery:
         set_icon(self.btn_next, "108")
         self.btn_close = self.dlg_gallery.findChild(QPushButton, "btn_close")
         self.btn_close.clicked.connect(partial(close_dialog, self.dlg_gallery))
+        self.dlg_gallery.finished.connect(self.cancel_tasks)
 
         # If all images set in one page, disable button next
         if num <= 9:
             self.btn_next.setDisabled(True)
 
+        # Fill first slide of gallery
+        self.load_page()
+
         # Open dialog
         open_dialog(self.dlg_gallery, dlg_name='visit_gallery', maximize_button=False)
 
@@ -136,27 +108,8 @@ class GwVisitGallery:
 
         self.start_indx = self.start_indx + 1
 
-        # Clear previous
-        for i in self.list_widget:
-            i.clear()
-
         # Add new 9 images
-        for i in range(0, 9):
-
-            # Parse a URL into components
-            url = urllib.parse.urlsplit(str(self.img_path_list[self.start_indx][i]))
-
-            # Check if path is URL
-            if url.scheme == "http" or url.scheme == "https":
-                url = str(self.img_path_list[self.start_indx][i])
-                data = urllib.request.urlopen(url).read()
-                pixmap = QPixmap()
-                pixmap.loadFromData(data)
-            else:
-                pixmap = QPixmap(str(self.img_path_list[self.start_indx][i]))
-
-            pixmap = pixmap.scaled(171, 151, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            self.list_widget[i].setPixmap(pixmap)
+        self.load_page()
 
         # Control sliding buttons
         if self.start_indx > 0:
@@ -173,27 +126,8 @@ class GwVisitGallery:
 
         self.start_indx = self.start_indx - 1
 
-        # First clear previous
-        for i in self.list_widget:
-            i.clear()
-
         # Add new 9 images
-        for i in range(0, 9):
-
-            # Parse a URL into components
-            url = urllib.parse.urlsplit(str(self.img_path_list[self.start_indx][i]))
-
-            # Check if path is URL
-            if url.scheme == "http" or url.scheme == "https":
-                url = str(self.img_path_list[self.start_indx][i])
-                data = urllib.request.urlopen(url).read()
-                pixmap = QPixmap()
-                pixmap.loadFromData(data)
-            else:
-                pixmap = QPixmap(str(self.img_path_list[self.start_indx][i]))
-
-            pixmap = pixmap.scaled(171, 151, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            self.list_widget[i].setPixmap(pixmap)
+        self.load_page()
 
         # Control sliding buttons
         if self.start_indx == 0:
@@ -204,6 +138,126 @@ class GwVisitGallery:
             self.btn_next.setEnabled(True)
 
 
+    def get_page_images(self, page):
+        """ Get list of tuples (position in page, path) of the pictures of @page """
+
+        images = []
+        for i in range(0, 9):
+            indx = (page * 9) + i
+            if indx < self.num_events:
+                images.append((i, str(self.img_path_list1D[indx])))
+
+        return images
+
+
+    def load_page(self):
+        """ Set thumbnails of current page. Those not found in memory are loaded by a background task,
+            and once they are ready the thumbnails of next page are prefetched """
+
+        # Thumbnails being prefetched are kept: they may be the ones of this page
+        self.cancel_task(self.task_page)
+        self.task_page = None
+
+        # Clear previous
+        for widget in self.list_widget:
+            widget.clear()
+
+        cache = get_thumbnail_cache()
+        pending = []
+        for i, path in self.get_page_images(self.start_indx):
+            key = cache.get_key(path, THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1])
+            image = cache.get(key, memory_only=True)
+            if image is None:
+                pending.append((i, path))
+            elif i < len(self.list_widget):
+                self.list_widget[i].setPixmap(QPixmap.fromImage(image))
+
+        if not pending:
+            self.prefetch_page()
+            return
+
+        self.task_page = GwThumbnailsTask("Load gallery pictures", pending, THUMBNAIL_SIZE)
+        self.task_page.image_loaded.connect(partial(self.set_thumbnail, self.task_page))
+        self.task_page.taskCompleted.connect(self.prefetch_page)
+        QgsApplication.taskManager().addTask(self.task_page)
+
+
+    def set_thumbnail(self, task, i, image):
+        """ Set thumbnail @image in position @i of the gallery, if @task still loads current page """
+
+        if task is not self.task_page or image is None or i >= len(self.list_widget):
+            return
+
+        try:
+            self.list_widget[i].setPixmap(QPixmap.fromImage(image))
+        except RuntimeError:
+            # Dialog closed while loading
+            pass
+
+
+    def prefetch_page(self):
+        """ Load into the cache the thumbnails of next page, so that it's shown at once """
+
+        # Thumbnails of the page prefetched before are no longer the next ones
+        self.cancel_task(self.task_prefetch)
+        self.task_prefetch = None
+
+        images = self.get_page_images(self.start_indx + 1)
+        if not images:
+            return
+
+        self.task_prefetch = GwThumbnailsTask("Prefetch gallery pictures", images, THUMBNAIL_SIZE)
+        QgsApplication.taskManager().addTask(self.task_prefetch)
+
+
+    def cancel_task(self, task):
+
+        try:
+            if task and task.status() in (GwThumbnailsTask.Queued, GwThumbnailsTask.Running):
+                task.cancel()
+        except RuntimeError:
+            # Task already deleted by the task manager
+            pass
+
+
+    def cancel_tasks(self):
+
+        for task in (self.task_page, self.task_prefetch, self.task_zoom):
+            self.cancel_task(task)
+        self.task_page = None
+        self.task_prefetch = None
+        self.task_zoom = None
+
+
+    def load_zoom_image(self, indx):
+        """ Show picture @indx in the zoom dialog. Its thumbnail is shown while the full image is loaded """
+
+        self.cancel_task(self.task_zoom)
+        path = str(self.img_path_list1D[indx])
+        cache = get_thumbnail_cache()
+        image = cache.get(cache.get_key(path, THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1]), memory_only=True)
+        if image is not None:
+            self.lbl_img.setPixmap(QPixmap.fromImage(image))
+        else:
+            self.lbl_img.clear()
+
+        self.task_zoom = GwThumbnailsTask("Load gallery picture", [(indx, path)])
+        self.task_zoom.image_loaded.connect(partial(self.set_zoom_image, self.task_zoom))
+        QgsApplication.taskManager().addTask(self.task_zoom)
+
+
+    def set_zoom_image(self, task, indx, image):
+
+        if task is not self.task_zoom or image is None:
+            return
+
+        try:
+            self.lbl_img.setPixmap(QPixmap.fromImage(image))
+        except RuntimeError:
+            # Dialog closed while loading
+            pass
+
+
     def zoom_img(self, i, visit_id, event_id):
 
         handeler_index = i
@@ -212,19 +266,7 @@ class GwVisitGallery:
         load_settings(self.dlg_gallery_zoom)
         self.lbl_img = self.dlg_gallery_zoom.findChild(QLabel, "lbl_img_zoom")
 
-        # Parse a URL into components
-        url = urllib.parse.urlsplit(str(self.img_path_list[self.start_indx][i]))
-
-        # Check if path is URL
-        if url.scheme == "http" or url.scheme == "https":
-            url = str(self.img_path_list[self.start_indx][i])
-            data = urllib.request.urlopen(url).read()
-            pixmap = QPixmap()
-            pixmap.loadFromData(data)
-        else:
-            pixmap = QPixmap(str(self.img_path_list[self.start_indx][i]))
-
-        self.lbl_img.setPixmap(pixmap)
+        self.load_zoom_image((self.start_indx * 9) + i)
 
         # lbl_img.show()
         zoom_visit_id = self.dlg_gallery_zoom.findChild(QLineEdit, "visit_id")
@@ -256,19 +298,7 @@ class GwVisitGallery:
 
         indx = (self.start_indx * 9) + self.i - 1
 
-        # Parse a URL into components
-        url = urllib.parse.urlsplit(str(self.img_path_list1D[indx]))
-
-        # Check if path is URL
-        if url.scheme == "http" or url.scheme == "https":
-            url = str(self.img_path_list1D[indx])
-            data = urllib.request.urlopen(url).read()
-            pixmap = QPixmap()
-            pixmap.loadFromData(data)
-        else:
-            pixmap = QPixmap(str(self.img_path_list1D[indx]))
-
-        self.lbl_img.setPixmap(pixmap)
+        self.load_zoom_image(indx)
         self.i = self.i - 1
 
         # Control sliding buttons
@@ -283,20 +313,7 @@ class GwVisitGallery:
 
         indx = (self.start_indx * 9) + self.i + 1
 
-        # Parse a URL into components
-        url = urllib.parse.urlsplit(str(self.img_path_list1D[indx]))
-
-        # Check if path is URL
-        if url.scheme == "http" or url.scheme == "https":
-            url = str(self.img_path_list1D[indx])
-            data = urllib.request.urlopen(url).read()
-            pixmap = QPixmap()
-            pixmap.loadFromData(data)
-
-        else:
-            pixmap = QPixmap(str(self.img_path_list1D[indx]))
-
-        self.lbl_img.setPixmap(pixmap)
+        self.load_zoom_image(indx)
         self.i = self.i + 1
 
         # Control sliding buttons
@@ -305,4 +322,3 @@ class GwVisitGallery:
 
         if indx == (self.num_events - 1):
             self.btn_slideNext.setEnabled(False)
-
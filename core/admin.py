@@ -24,11 +24,14 @@ import subprocess
 import xml.etree.cElementTree as ET
 from collections import OrderedDict
 from functools import partial
+import time
 from time import sleep
 
 from lib import qt_tools
+from .admin_build import GwSchemaBuild
 from .admin_gis_project import GwAdminGisProject
 from .tasks.task import GwTask
+from .utils.inp_loader import GwInpLoader
 from ..i18n.i18n_generator import GwI18NGenerator
 from ..ui_manager import MainUi, MainDbProjectUi, MainRenameProjUi, MainProjectInfoUi, \
     MainGisProjectUi, ToolboxUi, MainFields, MainVisitClass, MainVisitParam, MainSysFields, Credentials
@@ -60,6 +63,7 @@ class GwAdmin:
         self.project_type_selected = None
         self.schema_type = None
         self.project_issample = True
+        self.inp_loader = None
 
 
     def init_sql(self, set_database_connection=False, username=None, show_dialog=True):
@@ -164,6 +168,7 @@ class GwAdmin:
         self.dev_user = self.settings.value('system_variables/devoloper_mode').upper()
         self.read_all_updates = self.settings.value('system_variables/read_all_updates').upper()
         self.dev_commit = self.settings.value('system_variables/dev_commit').upper()
+        self.schema_build = GwSchemaBuild(self.controller, self.dev_commit)
 
         # Create dialog object
         self.dlg_readsql = MainUi()
@@ -516,7 +521,7 @@ class GwAdmin:
                 return False
 
             folder = self.folderUtils + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
             folder = self.folderUtils + self.file_pattern_ftrg
@@ -545,7 +550,7 @@ class GwAdmin:
                 return False
 
             folder = self.folderSoftware + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
 
@@ -594,7 +599,7 @@ class GwAdmin:
                 return False
 
             folder = self.folderSoftware + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
 
@@ -1032,7 +1037,7 @@ class GwAdmin:
 
         if str(project_type) == 'ws' or str(project_type) == 'ud':
             folder = self.folderUtils + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
 
@@ -1042,7 +1047,7 @@ class GwAdmin:
                 return False
 
             folder = self.folderSoftware + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
 
@@ -1053,7 +1058,7 @@ class GwAdmin:
 
         else:
             folder = self.folderSoftware + self.file_pattern_fct
-            status = self.executeFiles(folder)
+            status = self.executeFiles(folder, parallel=True)
             if not status and self.dev_commit == 'FALSE':
                 return False
 
@@ -1127,7 +1132,7 @@ class GwAdmin:
             return False
 
         folder = self.folderApi + self.file_pattern_fct
-        status = self.executeFiles(folder)
+        status = self.executeFiles(folder, parallel=True)
         if not status and self.dev_commit == 'FALSE':
             return False
 
@@ -1525,6 +1530,7 @@ class GwAdmin:
             return
 
         self.controller.log_info(f"Create schema of type '{project_type}': '{project_name_schema}'")
+        self.schema_build.reset(project_name_schema, self.sql_dir)
 
         if not is_test:
             self.task1 = GwTask('Manage schema')
@@ -1632,6 +1638,7 @@ class GwAdmin:
 
     def manage_process_result(self, schema_name=None, is_test=False):
 
+        self.schema_build.log_profile()
         if not is_test:
             self.task1.setProgress(100)
         status = (self.error_count == 0)
@@ -1679,6 +1686,7 @@ class GwAdmin:
         sql = f'ALTER SCHEMA {schema} RENAME TO {self.schema}'
         status = self.controller.execute_sql(sql, commit=False)
         if status:
+            self.controller.refresh_function_catalog(schema)
             self.reload_fct_ftrg(project_type=self.project_type_selected)
             self.task1.setProgress(20)
             self.reload_fct_ftrg(project_type='api')
@@ -1732,7 +1740,8 @@ class GwAdmin:
 
     def update(self, project_type):
 
-        msg = "Are you sure to update the project schema to last version?"
+        plan = self.plan_updates(project_type)
+        msg = f"Are you sure to update the project schema to last version?\n\n{plan}"
         result = self.controller.ask_question(msg, "Info")
         if result:
             self.task1 = GwTask('Manage schema')
@@ -1771,6 +1780,7 @@ class GwAdmin:
         self.schema = schema_name
         self.locale = self.project_language
 
+        self.schema_build.reset(schema_name, self.sql_dir)
         self.task1 = GwTask('Manage schema')
         QgsApplication.taskManager().addTask(self.task1)
         self.task1.setProgress(0)
@@ -1788,6 +1798,7 @@ class GwAdmin:
         if status:
             status = self.execute_last_process(schema_name=schema_name, locale=True)
         self.task1.setProgress(100)
+        self.schema_build.log_profile()
 
         if update_changelog is False:
             status = (self.error_count == 0)
@@ -1803,6 +1814,35 @@ class GwAdmin:
         return status
 
 
+    def plan_updates(self, project_type=None, schema_name=None):
+        """ Dry run of load_updates: get files that would be executed and its estimated time, without executing them
+        :return: Text with the summary of the plan
+        """
+
+        if schema_name is None:
+            schema_name = self.get_schema_name()
+
+        self.schema = schema_name
+        self.locale = self.project_language
+        error_count = self.error_count
+        self.schema_build.reset(schema_name, self.sql_dir, dry_run=True)
+        try:
+            status = self.load_fct_ftrg(project_type=project_type)
+            if status:
+                status = self.update_30to31(project_type=project_type)
+            if status:
+                status = self.update_31to39(project_type=project_type)
+            if status:
+                self.api(project_type=project_type)
+        finally:
+            self.schema_build.dry_run = False
+            self.error_count = error_count
+
+        msg = self.schema_build.get_plan_summary()
+        self.controller.log_info(f"Update plan of schema '{schema_name}': {msg}")
+        return msg
+
+
     def get_schema_name(self):
 
         schema_name = qt_tools.getWidgetText(self.dlg_readsql, self.dlg_readsql.project_schema_name)
@@ -2338,7 +2378,11 @@ class GwAdmin:
         open_dialog(self.dlg_readsql_rename, dlg_name='main_renameproj')
 
 
-    def executeFiles(self, filedir, i18n=False, no_ct=False, log_folder=True, log_files=False):
+    def executeFiles(self, filedir, i18n=False, no_ct=False, log_folder=True, log_files=False, parallel=False):
+        """ Execute SQL files of folder @filedir. If @parallel, its files don't depend on each other
+            and can be executed concurrently when the transaction strategy allows it.
+            Only function folders are: files of trigger folders may drop or replace triggers of previous ones,
+            and take locks on the tables of the schema, so they are executed in order """
 
         if not os.path.exists(filedir):
             self.controller.log_info("Folder not found", parameter=filedir)
@@ -2355,54 +2399,79 @@ class GwAdmin:
         else:
             schema_name = self.schema.replace('"', '')
 
+        # Executed files may create or drop functions of the schema
+        self.controller.refresh_function_catalog(schema_name)
+
         self.project_epsg = str(self.project_epsg).replace('"', '')
-        if i18n:
-            for file in filelist:
-                if "utils.sql" in file:
-                    if log_files:
-                        self.controller.log_info(str(filedir + os.sep + 'utils.sql'))
-                    status = self.read_execute_file(filedir, os.sep + 'utils.sql', schema_name, self.project_epsg)
-                elif str(self.project_type_selected) + ".sql" in file:
-                    if log_files:
-                        self.controller.log_info(str(filedir + os.sep + str(self.project_type_selected) + '.sql'))
-                    status = self.read_execute_file(filedir, os.sep + str(self.project_type_selected) + '.sql',
-                        schema_name, self.project_epsg)
-                if not status and self.dev_commit == 'FALSE':
-                    return False
-        else:
-            for file in filelist:
-                if ".sql" in file:
-                    if (no_ct is True and "tablect.sql" not in file) or no_ct is False:
+        parallel = parallel and not i18n and self.schema_build.can_run_parallel()
+        stage = self.schema_build.start_stage(filedir, parallel)
+        try:
+            if i18n:
+                for file in filelist:
+                    if "utils.sql" in file:
                         if log_files:
-                            self.controller.log_info(str(filedir + os.sep + file))
-                        status = self.read_execute_file(filedir, file, schema_name, self.project_epsg)
-                        if not status and self.dev_commit == 'FALSE':
-                            return False
+                            self.controller.log_info(str(filedir + os.sep + 'utils.sql'))
+                        status = self.read_execute_file(filedir, os.sep + 'utils.sql', schema_name, self.project_epsg,
+                                                        stage)
+                    elif str(self.project_type_selected) + ".sql" in file:
+                        if log_files:
+                            self.controller.log_info(str(filedir + os.sep + str(self.project_type_selected) + '.sql'))
+                        status = self.read_execute_file(filedir, os.sep + str(self.project_type_selected) + '.sql',
+                            schema_name, self.project_epsg, stage)
+                    if not status and self.dev_commit == 'FALSE':
+                        return False
+            elif parallel:
+                filepaths = [filedir + os.sep + file for file in filelist
+                             if ".sql" in file and (no_ct is False or "tablect.sql" not in file)]
+                filepaths = [filepath for filepath in filepaths if not self.schema_build.skip_file(stage, filepath)]
+                if log_files:
+                    for filepath in filepaths:
+                        self.controller.log_info(str(filepath))
+                errors = self.schema_build.execute_files_parallel(stage, filepaths, schema_name, self.project_epsg)
+                for filepath, error in errors:
+                    self.error_count = self.error_count + 1
+                    self.controller.log_info(str("read_execute_file error"), parameter=filepath)
+                    self.controller.log_info(str('Message: ' + str(error)))
+                status = not errors
+            else:
+                for file in filelist:
+                    if ".sql" in file:
+                        if (no_ct is True and "tablect.sql" not in file) or no_ct is False:
+                            if log_files:
+                                self.controller.log_info(str(filedir + os.sep + file))
+                            status = self.read_execute_file(filedir, file, schema_name, self.project_epsg, stage)
+                            if not status and self.dev_commit == 'FALSE':
+                                return False
+        finally:
+            self.schema_build.end_stage(stage)
 
         return status
 
 
-    def read_execute_file(self, filedir, file, schema_name, project_epsg):
+    def read_execute_file(self, filedir, file, schema_name, project_epsg, stage=None):
+
+        filepath = filedir + os.sep + file
+        if stage is not None and self.schema_build.skip_file(stage, filepath):
+            return True
+        if self.schema_build.dry_run:
+            self.schema_build.plan_file(filepath)
+            return True
 
         status = False
-        f = None
+        start = time.perf_counter()
         try:
-            filepath = filedir + os.sep + file
-            f = open(filepath, 'r', encoding="utf8")
-            if f:
-                f_to_read = str(f.read().replace("SCHEMA_NAME", schema_name).replace("SRID_VALUE", project_epsg))
-                if self.dev_commit == 'TRUE':
-                    status = self.controller.execute_sql(str(f_to_read), filepath=filepath)
-                else:
-                    status = self.controller.execute_sql(str(f_to_read), commit=False, filepath=filepath)
+            f_to_read = self.schema_build.read_file(filepath, schema_name, project_epsg)
+            if self.dev_commit == 'TRUE':
+                status = self.controller.execute_sql(str(f_to_read), filepath=filepath)
+            else:
+                status = self.controller.execute_sql(str(f_to_read), commit=False, filepath=filepath)
 
-                if status is False:
-                    self.error_count = self.error_count + 1
-                    self.controller.log_info(str("read_execute_file error"), parameter=filepath)
-                    self.controller.log_info(str('Message: ' + str(self.controller.last_error)))
-                    if self.dev_commit == 'TRUE':
-                        self.controller.dao.rollback()
-                    return False
+            if status is False:
+                self.error_count = self.error_count + 1
+                self.controller.log_info(str("read_execute_file error"), parameter=filepath)
+                self.controller.log_info(str('Message: ' + str(self.controller.last_error)))
+                if self.dev_commit == 'TRUE':
+                    self.controller.dao.rollback()
 
         except Exception as e:
             self.error_count = self.error_count + 1
@@ -2412,8 +2481,8 @@ class GwAdmin:
                 self.controller.dao.rollback()
             status = False
         finally:
-            if f:
-                f.close()
+            if stage is not None:
+                self.schema_build.add_file(stage, filepath, time.perf_counter() - start, status)
             return status
 
 
@@ -2506,6 +2575,7 @@ class GwAdmin:
             sql = f'DROP SCHEMA {project_name} CASCADE;'
             status = self.controller.execute_sql(sql)
             if status:
+                self.controller.refresh_function_catalog(project_name)
                 msg = "Process finished successfully"
                 self.controller.show_info_box(msg, "Info", parameter="Delete schema")
                 self.populate_data_schema_name(self.cmb_project_type)
@@ -2514,8 +2584,6 @@ class GwAdmin:
 
     def execute_import_inp(self, accepted=False, schema_type=''):
 
-        is_test = False
-
         if accepted:
 
             # Set wait cursor
@@ -2523,50 +2591,76 @@ class GwAdmin:
             QgsApplication.taskManager().addTask(self.task1)
             self.task1.setProgress(0)
 
-            # Insert inp values into database
-            self.insert_inp_into_db(self.file_inp)
-
-            # Execute import data
-            if schema_type.lower() == 'ws':
-                function_name = 'gw_fct_import_epanet_inp'
-                useNode2arc = self.dlg_import_inp.findChild(QWidget, 'useNode2arc')
-                extras = '"parameters":{"useNode2arc":"' + str(useNode2arc.isChecked()) + '"}'
-            elif schema_type.lower() == 'ud':
-                function_name = 'gw_fct_import_swmm_inp'
-                createSubcGeom = self.dlg_import_inp.findChild(QWidget, 'createSubcGeom')
-                extras = '"parameters":{"createSubcGeom":"' + str(createSubcGeom.isChecked()) + '"}'
-            else:
-                self.error_count = self.error_count + 1
-                return
+            # Insert inp values into database. Import function is executed once they have been loaded
+            self.insert_inp_into_db(self.file_inp, partial(self.execute_import_inp_function, schema_type))
+            return
 
-            # Set progressBar ON
-            self.dlg_import_inp.progressBar.setMaximum(0)
-            self.dlg_import_inp.progressBar.setMinimum(0)
-            self.dlg_import_inp.progressBar.setVisible(True)
-            self.dlg_import_inp.progressBar.setFormat("Running function: " + str(function_name))
-            self.dlg_import_inp.progressBar.setAlignment(Qt.AlignCenter)
-            self.dlg_import_inp.progressBar.setFormat("")
-
-            body = create_body(extras=extras)
-            sql = ("SELECT " + str(function_name) + "(" + body + ")::text")
-            row = self.controller.get_row(sql, commit=False)
-            self.task1 = GwTask('Manage schema')
-            QgsApplication.taskManager().addTask(self.task1)
-            self.task1.setProgress(50)
-            if row:
-                complet_result = [json.loads(row[0], object_pairs_hook=OrderedDict)]
-                self.set_log_text(self.dlg_import_inp, complet_result[0]['body']['data'])
-            else:
-                self.error_count = self.error_count + 1
+        # Loading of inp values will be stopped. Its result is managed by function execute_import_inp_function
+        if self.inp_loader and self.inp_loader.is_running():
+            self.inp_loader.cancel()
+            return
 
-            # Manage process result
-            self.manage_process_result()
+        msg = "A rollback on schema will be done."
+        self.controller.show_info_box(msg, "Info")
+        self.controller.dao.rollback()
+        self.error_count = 0
 
-        else:
+        # Close dialog
+        self.close_dialog_admin(self.dlg_import_inp)
+        self.close_dialog_admin(self.dlg_readsql_create_project)
+
+
+    def execute_import_inp_function(self, schema_type, loader):
+        """ Execute import function of @schema_type once @loader has loaded inp values into table 'temp_csv' """
+
+        self.inp_loader = None
+        if loader.isCanceled() or loader.exception or loader.error:
             msg = "A rollback on schema will be done."
             self.controller.show_info_box(msg, "Info")
             self.controller.dao.rollback()
             self.error_count = 0
+            self.close_dialog_admin(self.dlg_import_inp)
+            self.close_dialog_admin(self.dlg_readsql_create_project)
+            return
+
+        if self.dev_user:
+            self.controller.dao.commit()
+
+        # Execute import data
+        if schema_type.lower() == 'ws':
+            function_name = 'gw_fct_import_epanet_inp'
+            useNode2arc = self.dlg_import_inp.findChild(QWidget, 'useNode2arc')
+            extras = '"parameters":{"useNode2arc":"' + str(useNode2arc.isChecked()) + '"}'
+        elif schema_type.lower() == 'ud':
+            function_name = 'gw_fct_import_swmm_inp'
+            createSubcGeom = self.dlg_import_inp.findChild(QWidget, 'createSubcGeom')
+            extras = '"parameters":{"createSubcGeom":"' + str(createSubcGeom.isChecked()) + '"}'
+        else:
+            self.error_count = self.error_count + 1
+            return
+
+        # Set progressBar ON
+        self.dlg_import_inp.progressBar.setMaximum(0)
+        self.dlg_import_inp.progressBar.setMinimum(0)
+        self.dlg_import_inp.progressBar.setVisible(True)
+        self.dlg_import_inp.progressBar.setFormat("Running function: " + str(function_name))
+        self.dlg_import_inp.progressBar.setAlignment(Qt.AlignCenter)
+        self.dlg_import_inp.progressBar.setFormat("")
+
+        body = create_body(extras=extras)
+        sql = ("SELECT " + str(function_name) + "(" + body + ")::text")
+        row = self.controller.get_row(sql, commit=False)
+        self.task1 = GwTask('Manage schema')
+        QgsApplication.taskManager().addTask(self.task1)
+        self.task1.setProgress(50)
+        if row:
+            complet_result = [json.loads(row[0], object_pairs_hook=OrderedDict)]
+            self.set_log_text(self.dlg_import_inp, complet_result[0]['body']['data'])
+        else:
+            self.error_count = self.error_count + 1
+
+        # Manage process result
+        self.manage_process_result()
 
         # Close dialog
         self.close_dialog_admin(self.dlg_import_inp)
@@ -3288,67 +3382,27 @@ class GwAdmin:
         self.folderSoftware = self.sql_dir + os.sep + self.project_type_selected + os.sep
 
 
-    def insert_inp_into_db(self, folder_path=None):
+    def insert_inp_into_db(self, folder_path=None, callback=None):
+        """ Load INP file @folder_path into temp_csv with COPY, in chunks. @callback is called when finished """
 
-        _file = open(folder_path, "r+")
-        full_file = _file.readlines()
-        sql = ""
-        progress = 0
-        target = ""
-        for row in full_file:
-            progress += 1
-            row = row.rstrip()
-            if len(row) == 0:
-                continue
-            if str(row[0]) == "[":
-                target = str(row)
-            if target in ('[TRANSECTS]', '[CONTROLS]', '[RULES]'):
-                sp_n = [row]
-            elif target in ('[EVAPORATION]', '[TEMPERATURE]'):
-                sp_n = re.split(' |\t', row, 1)
-            else:
-                if str(row[0]) != ';':
-                    list_aux = row.split("\t")
-                    dirty_list = []
-                    for x in range(0, len(list_aux)):
-                        aux = list_aux[x].split(" ")
-                        for i in range(len(aux)):
-                            dirty_list.append(aux[i])
-                else:
-                    dirty_list = [row]
-
-                for x in range(len(dirty_list) - 1, -1, -1):
-                    if dirty_list[x] == '' or "**" in dirty_list[x] or "--" in dirty_list[x] or dirty_list[x] == '; '\
-                            or dirty_list[x] == ';' or dirty_list[x] == ';\n':
-                        dirty_list.pop(x)
-                sp_n = dirty_list
-
-            if len(sp_n) > 0:
-                sql += "INSERT INTO temp_csv (fid, source, "
-                values = "VALUES(239, '" + target + "', "
-                for x in range(0, len(sp_n)):
-                    if "''" not in sp_n[x]:
-                        sql += "csv" + str(x + 1) + ", "
-                        value = "'" + sp_n[x].strip().replace("\n", "") + "', "
-                        values += value.replace("''", "null")
-                    else:
-                        sql += "csv" + str(x + 1) + ", "
-                        values = "VALUES(null, "
-                sql = sql[:-2] + ") "
-                values = values[:-2] + ");\n"
-                sql += values
-
-            if progress % 500 == 0:
-                # TODO:: Use dev_commit or dev_user?
-                self.controller.execute_sql(sql, commit=self.dev_user)
-                sql = ""
-
-        if sql != "":
-            # TODO:: Use dev_commit or dev_user?
-            self.controller.execute_sql(sql, commit=self.dev_user)
-
-        _file.close()
-        del _file
+        self.dlg_import_inp.progressBar.setMinimum(0)
+        self.dlg_import_inp.progressBar.setMaximum(100)
+        self.dlg_import_inp.progressBar.setValue(0)
+        self.dlg_import_inp.progressBar.setVisible(True)
+        self.dlg_import_inp.btn_run.setEnabled(False)
+
+        self.inp_loader = GwInpLoader(folder_path, callback=callback)
+        self.inp_loader.progressChanged.connect(self.set_import_inp_progress)
+        self.inp_loader.start()
+
+
+    def set_import_inp_progress(self, progress):
+
+        try:
+            self.dlg_import_inp.progressBar.setValue(int(progress))
+        except RuntimeError:
+            # Dialog closed while importing
+            pass
 
 
     def select_file_inp(self):
@@ -0,0 +1,345 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import global_vars
+
+
+class GwSchemaBuild:
+    """ Execute the SQL files of a schema creation or upgrade and keep the time spent by each one.
+        Folders whose files don't depend on each other (ie: function definitions) can be executed concurrently,
+        each file on a pooled connection. This is only possible when every file is committed on its own
+        (dev_commit), because pooled connections can't see what has not been committed by the main one.
+        Otherwise all files are executed one after the other in the transaction of the main connection.
+
+        Checksums of executed files are saved in table 'sys_admin_file' of the schema. Scripts of the version
+        update folders already applied with the same checksum are skipped, and upgrades can be planned
+        (dry run) to know which files would be executed and how long it would take """
+
+    checksum_table = 'sys_admin_file'
+    # Estimated time of a file never executed when there is no other timing available
+    default_file_time = 0.1
+
+    def __init__(self, controller, dev_commit, max_workers=None):
+
+        self.controller = controller
+        self.dev_commit = dev_commit
+        if max_workers is None:
+            max_workers = global_vars.settings.value('system_variables/admin_build_workers')
+        try:
+            max_workers = int(max_workers)
+        except (TypeError, ValueError):
+            max_workers = self.controller.dao.pool_size if self.controller.dao else 1
+        self.max_workers = max(1, max_workers)
+        self.lock = threading.Lock()
+        self.stages = []
+        self.start_time = None
+        self.schema_name = None
+        self.sql_dir = None
+        self.dry_run = False
+        # Files applied to the schema: {relative path: (checksum, elapsed)}
+        self.applied = {}
+        # Files executed by current build, pending to be saved: {relative path: (checksum, elapsed)}
+        self.executed = {}
+        self.plan = []
+        # Kept between builds, so that upgrading several schemas doesn't read the same files again
+        self.checksums = {}
+        self.history = {}
+
+
+    def reset(self, schema_name=None, sql_dir=None, dry_run=False):
+        """ Start a new build of @schema_name with files of @sql_dir. Timings of the previous one are discarded
+        :param dry_run: If True, files are not executed but added to the plan of the build
+        """
+
+        self.stages = []
+        self.start_time = time.perf_counter()
+        self.schema_name = schema_name.replace('"', '') if schema_name else None
+        self.sql_dir = sql_dir
+        self.dry_run = dry_run
+        self.executed = {}
+        self.plan = []
+        self.applied = self.load_applied()
+
+
+    def can_run_parallel(self):
+
+        return (self.dev_commit == 'TRUE' and self.max_workers > 1 and self.controller.dao is not None
+                and not self.dry_run)
+
+
+    def get_relative_path(self, filepath):
+
+        filepath = os.path.normpath(filepath)
+        if self.sql_dir:
+            return os.path.relpath(filepath, self.sql_dir).replace(os.sep, '/')
+        return filepath.replace(os.sep, '/')
+
+
+    def get_checksum(self, filepath):
+        """ Return md5 of the contents of @filepath. Files not modified since last call are not read again """
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        key = os.path.normpath(filepath)
+        cached = self.checksums.get(key)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        with open(filepath, 'rb') as f:
+            checksum = hashlib.md5(f.read()).hexdigest()
+        self.checksums[key] = (stat.st_mtime, stat.st_size, checksum)
+        return checksum
+
+
+    def is_skippable(self, filepath):
+        """ Check if @filepath is a script of a version update folder already applied with the same contents.
+            Files of the rest of folders (functions, triggers, constraints...) are executed in every upgrade,
+            because the updates may have dropped the objects they create """
+
+        relative_path = self.get_relative_path(filepath)
+        if '/updates/' not in f"/{relative_path}":
+            return False
+
+        applied = self.applied.get(relative_path)
+        if applied is None:
+            return False
+
+        checksum = self.get_checksum(filepath)
+        if checksum is None or checksum != applied[0]:
+            return False
+
+        return True
+
+
+    def skip_file(self, stage, filepath):
+        """ Skip @filepath, already applied. Returns True if it has been skipped """
+
+        if not self.is_skippable(filepath):
+            return False
+
+        if self.dry_run:
+            self.plan_file(filepath, skipped=True)
+        else:
+            self.add_file(stage, filepath, 0, True, skipped=True)
+        return True
+
+
+    def plan_file(self, filepath, skipped=False):
+        """ Add @filepath to the plan of a dry run build """
+
+        relative_path = self.get_relative_path(filepath)
+        estimate = 0 if skipped else self.estimate_file_time(relative_path)
+        self.plan.append((relative_path, skipped, estimate))
+
+
+    def estimate_file_time(self, relative_path):
+        """ Estimate time of @relative_path from its previous execution in this schema or in other ones """
+
+        applied = self.applied.get(relative_path)
+        if applied and applied[1] is not None:
+            return applied[1]
+        if relative_path in self.history:
+            return self.history[relative_path]
+
+        times = [value[1] for value in self.applied.values() if value[1] is not None]
+        times.extend(self.history.values())
+        if times:
+            return sum(times) / len(times)
+        return self.default_file_time
+
+
+    def get_plan_summary(self, max_files=10):
+        """ Return text with the files that a dry run build would execute and its estimated time """
+
+        pending = [item for item in self.plan if not item[1]]
+        skipped = len(self.plan) - len(pending)
+        estimate = sum(item[2] for item in pending)
+        msg = (f"{len(pending)} files to execute, {skipped} already applied. "
+               f"Estimated time: {estimate:.0f} seconds")
+        slowest = sorted(pending, key=lambda item: item[2], reverse=True)[:max_files]
+        if slowest:
+            msg += "\nSlowest files:\n"
+            for relative_path, skipped, elapsed in slowest:
+                msg += f"    {elapsed:8.2f}s  {relative_path}\n"
+
+        return msg
+
+
+    def load_applied(self):
+        """ Get files applied to the schema: {relative path: (checksum, elapsed)} """
+
+        if self.schema_name is None or self.controller.dao is None:
+            return {}
+
+        sql = f"SELECT to_regclass('{self.schema_name}.{self.checksum_table}') IS NOT NULL"
+        row = self.controller.dao.get_row(sql)
+        if not row or not row[0]:
+            return {}
+
+        sql = f"SELECT filepath, checksum, elapsed FROM {self.schema_name}.{self.checksum_table}"
+        rows = self.controller.dao.get_rows(sql)
+        if not rows:
+            return {}
+
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+
+    def save_applied(self):
+        """ Save checksums and timings of the files executed by current build, in its transaction """
+
+        if self.dry_run or not self.executed or self.schema_name is None:
+            return True
+
+        table = f"{self.schema_name}.{self.checksum_table}"
+        sql = (f"CREATE TABLE IF NOT EXISTS {table} (filepath text PRIMARY KEY, checksum text, elapsed float, "
+               f"tstamp timestamp DEFAULT now());\n"
+               f"INSERT INTO {table} (filepath, checksum, elapsed) VALUES ")
+        values = []
+        for relative_path, (checksum, elapsed) in self.executed.items():
+            relative_path = relative_path.replace("'", "''")
+            values.append(f"('{relative_path}', '{checksum}', {elapsed:.4f})")
+        sql += ", ".join(values)
+        sql += (" ON CONFLICT (filepath) DO UPDATE SET checksum = EXCLUDED.checksum, "
+                "elapsed = EXCLUDED.elapsed, tstamp = now();")
+        status = self.controller.dao.execute_sql(sql, commit=False)
+        if not status:
+            self.controller.log_warning("Error saving applied files", parameter=str(self.controller.dao.last_error))
+        self.executed = {}
+        return status
+
+
+    def start_stage(self, name, parallel=False):
+        """ Start a stage of the build: a folder whose files are executed serially or concurrently """
+
+        if self.start_time is None:
+            self.reset()
+        stage = {'name': name, 'parallel': parallel, 'start': time.perf_counter(), 'elapsed': 0, 'files': []}
+        self.stages.append(stage)
+        return stage
+
+
+    def end_stage(self, stage):
+
+        stage['elapsed'] = time.perf_counter() - stage['start']
+
+
+    def add_file(self, stage, filepath, elapsed, status, skipped=False):
+
+        with self.lock:
+            stage['files'].append((filepath, elapsed, status))
+            if skipped or not status:
+                return
+            relative_path = self.get_relative_path(filepath)
+            checksum = self.get_checksum(filepath)
+            if checksum:
+                self.executed[relative_path] = (checksum, elapsed)
+                self.history[relative_path] = elapsed
+
+
+    def read_file(self, filepath, schema_name, project_epsg):
+        """ Return contents of SQL file @filepath with the values of SCHEMA_NAME and SRID_VALUE replaced """
+
+        with open(filepath, 'r', encoding="utf8") as f:
+            return f.read().replace("SCHEMA_NAME", schema_name).replace("SRID_VALUE", project_epsg)
+
+
+    def execute_files_parallel(self, stage, filepaths, schema_name, project_epsg):
+        """ Execute @filepaths concurrently, each one on a pooled connection committed when it succeeds
+        :return: List of tuples (filepath, error) of files that failed
+        """
+
+        # Objects created by previous stages must be visible to pooled connections
+        self.controller.dao.commit()
+        errors = []
+        workers = min(self.max_workers, self.controller.dao.pool_size, len(filepaths))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(self.execute_file_pooled, stage, filepath, schema_name, project_epsg)
+                       for filepath in filepaths]
+            for future in futures:
+                filepath, error = future.result()
+                if error is not None:
+                    errors.append((filepath, error))
+
+        return errors
+
+
+    def execute_file_pooled(self, stage, filepath, schema_name, project_epsg):
+        """ Execute SQL file @filepath on a pooled connection. Executed in a worker thread """
+
+        start = time.perf_counter()
+        error = None
+        if not self.controller.checkout_thread_connection():
+            error = self.controller.dao.last_error or "Unable to get a pooled connection"
+        else:
+            status = False
+            try:
+                sql = self.read_file(filepath, schema_name, project_epsg)
+                status = self.controller.dao.execute_sql(sql, commit=False)
+                if not status:
+                    error = self.controller.dao.last_error
+            except Exception as e:
+                error = e
+            finally:
+                self.controller.release_thread_connection(commit=status)
+
+        self.add_file(stage, filepath, time.perf_counter() - start, error is None)
+        return filepath, error
+
+
+    def get_profile(self, max_files=10):
+        """ Return text with the time spent by the build, its stages and its slowest files.
+            Critical path is the minimum time the build would need with unlimited workers:
+            the sum of the files of serial stages plus the slowest file of each parallel stage """
+
+        if not self.stages:
+            return ""
+
+        total = time.perf_counter() - self.start_time
+        files = [item for stage in self.stages for item in stage['files']]
+        files_time = sum(item[1] for item in files)
+        critical_path = 0
+        for stage in self.stages:
+            times = [item[1] for item in stage['files']]
+            if stage['parallel']:
+                critical_path += max(times, default=0)
+            else:
+                critical_path += sum(times)
+
+        msg = (f"Schema build: {total:.1f}s, {len(files)} files ({files_time:.1f}s executing SQL), "
+               f"{len(self.stages)} folders, critical path {critical_path:.1f}s\n")
+        msg += "Slowest folders:\n"
+        for stage in sorted(self.stages, key=lambda stage: stage['elapsed'], reverse=True)[:max_files]:
+            mode = "parallel" if stage['parallel'] else "serial"
+            msg += f"    {stage['elapsed']:8.2f}s  {len(stage['files']):4} files  {mode:8}  {stage['name']}\n"
+        msg += "Slowest files:\n"
+        for filepath, elapsed, status in sorted(files, key=lambda item: item[1], reverse=True)[:max_files]:
+            error = "" if status else "  (error)"
+            msg += f"    {elapsed:8.2f}s  {os.path.normpath(filepath)}{error}\n"
+
+        return msg
+
+
+    def log_profile(self):
+        """ Log profile of current build and save the files it has applied """
+
+        if self.dry_run:
+            return
+
+        msg = self.get_profile()
+        if msg:
+            self.controller.log_info(msg)
+        self.save_applied()
+        self.start_time = None
@@ -74,6 +74,9 @@ class LoadProject(QObject):
         # Set PostgreSQL parameter 'search_path'
         self.controller.set_search_path(layer_source['schema'])
 
+        # Schema version may have changed since last time it was loaded. Reload its function catalog
+        self.controller.refresh_function_catalog(self.schema_name)
+
         # Check if schema exists
         self.schema_exists = self.controller.check_schema(self.schema_name)
         if not self.schema_exists:
@@ -86,6 +86,10 @@ class GwNotifyTools:
 
     def wait_notifications(self):
 
+        # Notifications arrive on the main connection, so this thread must use it
+        dao = self.controller.dao
+        if dao:
+            dao.main_conn_threads.add(threading.get_ident())
         try:
             if self.conn_failed:
                 for channel_name in self.list_channels:
@@ -98,7 +102,6 @@ class GwNotifyTools:
             thread.start()
 
             # Check if any notification to process
-            dao = self.controller.dao
             dao.get_poll()
 
             last_paiload = None
@@ -117,6 +120,9 @@ class GwNotifyTools:
 
         except AttributeError:
             self.conn_failed = True
+        finally:
+            if dao:
+                dao.main_conn_threads.discard(threading.get_ident())
 
 
     def execute_functions(self, complet_result):
@@ -12,7 +12,7 @@ import platform
 from functools import partial
 
 from .utils.giswater_tools import load_settings, open_dialog, save_settings, close_dialog
-from .utils.layer_tools import add_temp_layer, from_postgres_to_toc, create_qml
+from .utils.layer_tools import add_temp_layer, close_temp_layer_streams, from_postgres_to_toc, create_qml
 from .. import global_vars
 from ..actions.parent_functs import get_plugin_version, hide_void_groupbox
 from ..actions.api_parent_functs import create_body
@@ -89,12 +89,15 @@ class GwProjectCheck:
         extras += f', "osVersion":"{platform.system()} {platform.release()}"'
         extras += f', {fields_to_insert}'
         body = create_body(extras=extras)
-        result = self.controller.get_json('gw_fct_audit_check_project', body)
+        # Features of result layers are fetched in pages when they are added to the TOC
+        result = self.controller.get_json_stream('gw_fct_audit_check_project', body)
         try:
             if not result or (result['body']['variables']['hideForm'] == True):
+                close_temp_layer_streams(result)
                 return result
         except KeyError as e:
             self.controller.log_warning(f"EXCEPTION: {type(e).__name__}, {e}")
+            close_temp_layer_streams(result)
             return result
 
         # Show dialog with audit check project result
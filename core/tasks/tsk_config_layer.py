@@ -9,6 +9,13 @@ from qgis.core import QgsEditorWidgetSetup, QgsFieldConstraints
 from qgis.PyQt.QtCore import pyqtSignal
 from qgis.core import QgsTask
 
+import hashlib
+import json
+import os
+import time
+
+from ... import global_vars
+
 
 class GwConfigLayerTask(QgsTask):
     """ This shows how to subclass QgsTask """
@@ -22,10 +29,22 @@ class GwConfigLayerTask(QgsTask):
         self.controller = controller
         self.message = None
         self.available_layers = None
+        self.feature_layers = []
+        # Table names of the layers in TOC, and the ones of current schema. Read in the main thread
+        self.loaded_tables = set()
+        self.schema_tables = []
         self.get_layers = True
         self.project_type = None
         self.schema_name = None
         self.qgis_project_infotype = None
+        self.layers_config = {}
+        # Configuration of the fields of each layer saved on disk, valid while version and checksum don't change
+        # and for @cache_ttl seconds
+        self.cache = None
+        self.cache_path = None
+        self.version = None
+        self.checksum = None
+        self.cache_ttl = self.get_cache_ttl()
 
 
     def run(self):
@@ -33,18 +52,37 @@ class GwConfigLayerTask(QgsTask):
         self.controller.log_info(f"Task started: {self.description()}")
 
         self.setProgress(0)
-        if self.get_layers:
-            # self.controller.log_info("get_layers_to_config")
-            self.get_layers_to_config()
-        self.set_layer_config(self.available_layers)
+        # Use a dedicated database connection so GUI queries are not blocked by this task.
+        # Never use the main connection from this thread: if no pooled connection is available, give up
+        if not self.controller.checkout_thread_connection():
+            self.exception = self.controller.dao.last_error
+            return False
+        try:
+            if self.get_layers:
+                # self.controller.log_info("get_layers_to_config")
+                self.get_layers_to_config()
+            if self.check_cache():
+                self.controller.log_info("Layer configuration is up to date")
+                self.layers_config = {}
+            else:
+                self.get_layers_config(self.available_layers)
+                self.save_cache()
+        except Exception as e:
+            self.exception = e
+            return False
+        finally:
+            self.controller.release_thread_connection()
         self.setProgress(100)
 
-        return True
+        return not self.isCanceled()
 
 
     def finished(self, result):
 
         if result:
+            # Layers are modified in the main thread
+            self.set_form_suppress(self.feature_layers)
+            self.set_layer_config(self.available_layers)
             self.controller.log_info(f"Task finished: {self.description()}")
             return
 
@@ -66,6 +104,26 @@ class GwConfigLayerTask(QgsTask):
         self.schema_name = schema_name
         self.qgis_project_infotype = qgis_project_infotype
         self.get_layers = get_layers
+        self.set_loaded_tables()
+        self.load_cache()
+
+
+    def set_loaded_tables(self):
+        """ Get table names of the layers in TOC, so the task doesn't access them from its thread """
+
+        self.loaded_tables = set()
+        self.schema_tables = []
+        for layer in self.controller.get_layers():
+            table_name = self.controller.get_layer_source_table_name(layer)
+            if not table_name:
+                continue
+            self.loaded_tables.add(table_name)
+            layer_source = self.controller.get_layer_source(layer)
+            # Filter to take only the layers of the current schema
+            if 'schema' in layer_source:
+                schema = layer_source['schema']
+                if schema and schema.replace('"', '') == self.schema_name:
+                    self.schema_tables.append(table_name)
 
 
     def get_layers_to_config(self):
@@ -78,19 +136,9 @@ class GwConfigLayerTask(QgsTask):
               f"WHERE child_layer IN ("
               f"     SELECT table_name FROM information_schema.tables"
               f"     WHERE table_schema = '{schema_name}')")
-        rows = self.controller.get_rows(sql)
-        self.available_layers = [layer[0] for layer in rows]
-
-        self.set_form_suppress(self.available_layers)
-        all_layers_toc = self.controller.get_layers()
-        for layer in all_layers_toc:
-            layer_source = self.controller.get_layer_source(layer)
-            # Filter to take only the layers of the current schema
-            if 'schema' in layer_source:
-                schema = layer_source['schema']
-                if schema and schema.replace('"', '') == self.schema_name:
-                    table_name = f"{self.controller.get_layer_source_table_name(layer)}"
-                    self.available_layers.append(table_name)
+        rows = self.controller.get_rows(sql) or []
+        self.feature_layers = [layer[0] for layer in rows]
+        self.available_layers = self.feature_layers + self.schema_tables
 
 
     def set_form_suppress(self, layers_list):
@@ -104,6 +152,173 @@ class GwConfigLayerTask(QgsTask):
             layer.setEditFormConfig(config)
 
 
+    def get_layers_config(self, layers):
+        """ Get form configuration of @layers. Function gw_fct_getinfofromid is executed for all of them
+            in the same query, and results are fetched from a server-side cursor """
+
+        self.controller.log_info("Start get_layers_config")
+
+        self.layers_config = {}
+        layers = [layer_name for layer_name in dict.fromkeys(layers) if layer_name in self.loaded_tables]
+        if not layers:
+            return
+
+        if not self.controller.check_function('gw_fct_getinfofromid'):
+            self.controller.log_warning("Function not found in database", parameter='gw_fct_getinfofromid')
+            return
+
+        values = ""
+        for layer_name in layers:
+            feature = '"tableName":"' + str(layer_name) + '", "id":"", "isLayer":true'
+            extras = f'"infoType":"{self.qgis_project_infotype}"'
+            body = self.create_body(feature=feature, extras=extras)
+            values += f"('{layer_name}', {body}::json), "
+        sql = (f"SELECT v.layer_name, gw_fct_getinfofromid(v.body) "
+               f"FROM (VALUES {values[:-2]}) AS v(layer_name, body)")
+
+        total_layers = len(layers)
+        for row in self.controller.dao.get_rows_iter(sql, itersize=10):
+            if self.isCanceled():
+                return
+            self.layers_config[row[0]] = self.get_fields(row[1])
+            self.setProgress((len(self.layers_config) * 100) / total_layers)
+
+        # If function fails for any layer, get configuration of each layer separately
+        if self.controller.dao.last_error:
+            self.controller.log_warning("Error getting configuration of all layers",
+                                        parameter=str(self.controller.dao.last_error))
+            self.controller.dao.rollback()
+            self.layers_config = {}
+            for layer_number, layer_name in enumerate(layers, 1):
+                if self.isCanceled():
+                    return
+                feature = '"tableName":"' + str(layer_name) + '", "id":"", "isLayer":true'
+                extras = f'"infoType":"{self.qgis_project_infotype}"'
+                body = self.create_body(feature=feature, extras=extras)
+                row = self.controller.dao.get_row(f"SELECT gw_fct_getinfofromid({body});", commit=True)
+                if row:
+                    self.layers_config[layer_name] = self.get_fields(row[0])
+                self.setProgress((layer_number * 100) / total_layers)
+
+        self.controller.log_info("Finish get_layers_config")
+
+
+    def get_fields(self, complet_result):
+        """ Get configuration of the fields from the result of gw_fct_getinfofromid """
+
+        if not complet_result:
+            return None
+
+        # self.controller.log_info(str(complet_result))
+        if not 'body' in complet_result:
+            self.controller.log_info("Not 'body'")
+            return None
+        if not 'data' in complet_result['body']:
+            self.controller.log_info("Not 'data'")
+            return None
+
+        return complet_result['body']['data']['fields']
+
+
+    def load_cache(self):
+        """ Read configuration of layer fields saved by a previous execution for this database, schema and user """
+
+        self.cache = None
+        credentials = self.controller.credentials or {}
+        key = (f"{credentials.get('host')}|{credentials.get('port')}|{credentials.get('db')}|"
+               f"{self.controller.current_user}|{self.schema_name}|{self.qgis_project_infotype}")
+        main_folder = os.path.join(os.path.expanduser("~"), self.controller.plugin_name)
+        cache_folder = os.path.join(main_folder, "cache", "layer_config")
+        self.cache_path = os.path.join(cache_folder, f"{hashlib.md5(key.encode()).hexdigest()}.json")
+        if not os.path.exists(self.cache_path):
+            return False
+
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as cache_file:
+                self.cache = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            self.controller.log_warning(f"Error reading layer configuration cache: {e}")
+            return False
+
+        return True
+
+
+    def set_layer_config_from_cache(self):
+        """ Set configuration of layer fields saved in cache, without querying database.
+            Must be called from the main thread. The task checks afterwards if it's still valid """
+
+        if not self.cache:
+            return False
+
+        self.layers_config = self.cache['layers']
+        self.set_layer_config(list(self.layers_config))
+        self.layers_config = {}
+
+        return True
+
+
+    def get_cache_ttl(self):
+        """ Get seconds the cache is valid for. Its value (hours) is set in 'layer_config_cache_ttl' of config file """
+
+        ttl = global_vars.settings.value('system_variables/layer_config_cache_ttl')
+        try:
+            return float(ttl) * 3600
+        except (TypeError, ValueError):
+            return 24 * 3600
+
+
+    def get_cache_checksum(self):
+        """ Get version of the schema and checksum of table 'config_form_fields' """
+
+        sql = "SELECT giswater FROM sys_version ORDER BY id DESC LIMIT 1"
+        row = self.controller.dao.get_row(sql)
+        version = row[0] if row else None
+        sql = "SELECT md5(COALESCE(string_agg(t::text, ',' ORDER BY t::text), '')) FROM config_form_fields t"
+        row = self.controller.dao.get_row(sql)
+        checksum = row[0] if row else None
+        if self.controller.dao.last_error:
+            self.controller.dao.rollback()
+
+        return version, checksum
+
+
+    def check_cache(self):
+        """ Check if configuration saved in cache is still valid for all available layers """
+
+        self.version, self.checksum = self.get_cache_checksum()
+        if not self.cache or self.checksum is None:
+            return False
+        if self.cache.get('version') != self.version or self.cache.get('checksum') != self.checksum:
+            return False
+
+        # Combo values come from catalogs not covered by the checksum: configuration expires after a while anyway
+        if time.time() - self.cache.get('time', 0) > self.cache_ttl:
+            return False
+
+        return all(layer_name in self.cache['layers'] for layer_name in self.available_layers
+                   if layer_name in self.loaded_tables)
+
+
+    def save_cache(self):
+        """ Save configuration of layer fields, with the version and checksum it was computed with """
+
+        if self.checksum is None or self.isCanceled():
+            return False
+
+        layers = {layer_name: fields for layer_name, fields in self.layers_config.items() if fields is not None}
+        cache = {'version': self.version, 'checksum': self.checksum, 'time': time.time(), 'layers': layers}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(cache, cache_file)
+        except OSError as e:
+            self.controller.log_warning(f"Error writing layer configuration cache: {e}")
+            return False
+
+        self.cache = cache
+        return True
+
+
     def set_layer_config(self, layers):
         """ Set layer fields configured according to client configuration.
             At the moment manage:
@@ -113,136 +328,126 @@ class GwConfigLayerTask(QgsTask):
 
         msg_failed = ""
         msg_key = ""
-        total_layers = len(layers)
-        layer_number = 0
-        for layer_name in layers:
-
-            if self.isCanceled():
-                return False
+        for layer_name in dict.fromkeys(layers):
 
             layer = self.controller.get_layer_by_tablename(layer_name)
             if not layer:
                 continue
 
-            layer_number = layer_number + 1
-            self.setProgress((layer_number * 100) / total_layers)
-
-            feature = '"tableName":"' + str(layer_name) + '", "id":"", "isLayer":true'
-            extras = f'"infoType":"{self.qgis_project_infotype}"'
-            body = self.create_body(feature=feature, extras=extras)
-            complet_result = self.controller.get_json('gw_fct_getinfofromid', body, log_sql=False)
-            if not complet_result:
+            fields = self.layers_config.get(layer_name)
+            if fields is None:
                 continue
 
-            # self.controller.log_info(str(complet_result))
-            if not 'body' in complet_result:
-                self.controller.log_info("Not 'body'")
-                continue
-            if not 'data' in complet_result['body']:
-                self.controller.log_info("Not 'data'")
-                continue
+            self.set_fields_config(layer, fields)
 
-            # self.controller.log_info(complet_result['body']['data']['fields'])
-            for field in complet_result['body']['data']['fields']:
-                valuemap_values = {}
+        if msg_failed != "":
+            self.controller.show_exceptions_msg("Execute failed.", msg_failed)
 
-                # Get column index
-                fieldIndex = layer.fields().indexFromName(field['columnname'])
+        if msg_key != "":
+            self.controller.show_exceptions_msg("Key on returned json from ddbb is missed.", msg_key)
 
-                # Hide selected fields according table config_api_form_fields.hidden
-                if 'hidden' in field:
-                    self.set_column_visibility(layer, field['columnname'], field['hidden'])
+        self.controller.log_info("Finish set_layer_config")
 
-                # Set alias column
-                if field['label']:
-                    layer.setFieldAlias(fieldIndex, field['label'])
 
-                # multiline: key comes from widgecontrol but it's used here in order to set false when key is missing
-                if field['widgettype'] == 'text':
-                    self.set_column_multiline(layer, field, fieldIndex)
+    def set_fields_config(self, layer, fields):
+        """ Set configuration of @fields into @layer. Form and attribute table configurations are set only once """
 
-                # widgetcontrols
-                if 'widgetcontrols' in field:
+        form_config = layer.editFormConfig()
+        table_config = layer.attributeTableConfig()
+        columns = table_config.columns()
 
-                    # Set field constraints
-                    if field['widgetcontrols'] and 'setQgisConstraints' in field['widgetcontrols']:
-                        if field['widgetcontrols']['setQgisConstraints'] is True:
-                            layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintNotNull,
-                                QgsFieldConstraints.ConstraintStrengthSoft)
-                            layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintUnique,
-                                QgsFieldConstraints.ConstraintStrengthHard)
+        for field in fields:
+            valuemap_values = {}
 
-                if 'ismandatory' in field and not field['ismandatory']:
-                    layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintNotNull,
-                        QgsFieldConstraints.ConstraintStrengthSoft)
+            # Get column index
+            fieldIndex = layer.fields().indexFromName(field['columnname'])
 
-                # Manage editability
-                self.set_read_only(layer, field, fieldIndex)
+            # Hide selected fields according table config_api_form_fields.hidden
+            if 'hidden' in field:
+                self.set_column_visibility(columns, field['columnname'], field['hidden'])
 
-                # delete old values on ValueMap
-                editor_widget_setup = QgsEditorWidgetSetup('ValueMap', {'map': valuemap_values})
-                layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+            # Set alias column
+            if field['label']:
+                layer.setFieldAlias(fieldIndex, field['label'])
 
-                # Manage new values in ValueMap
-                if field['widgettype'] == 'combo':
-                    if 'comboIds' in field:
-                        # Set values
-                        for i in range(0, len(field['comboIds'])):
-                            valuemap_values[field['comboNames'][i]] = field['comboIds'][i]
-                    # Set values into valueMap
-                    editor_widget_setup = QgsEditorWidgetSetup('ValueMap', {'map': valuemap_values})
-                    layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
-                elif field['widgettype'] == 'check':
-                    config = {'CheckedState': 'true', 'UncheckedState': 'false'}
-                    editor_widget_setup = QgsEditorWidgetSetup('CheckBox', config)
-                    layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
-                elif field['widgettype'] == 'datetime':
-                    config = {'allow_null': True,
-                              'calendar_popup': True,
-                              'display_format': 'yyyy-MM-dd',
-                              'field_format': 'yyyy-MM-dd',
-                              'field_iso_format': False}
-                    editor_widget_setup = QgsEditorWidgetSetup('DateTime', config)
-                    layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
-                else:
-                    editor_widget_setup = QgsEditorWidgetSetup('TextEdit', {'IsMultiline': 'True'})
-                    layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+            # multiline: key comes from widgecontrol but it's used here in order to set false when key is missing
+            if field['widgettype'] == 'text':
+                self.set_column_multiline(layer, field, fieldIndex)
 
-        if msg_failed != "":
-            self.controller.show_exceptions_msg("Execute failed.", msg_failed)
+            # widgetcontrols
+            if 'widgetcontrols' in field:
 
-        if msg_key != "":
-            self.controller.show_exceptions_msg("Key on returned json from ddbb is missed.", msg_key)
+                # Set field constraints
+                if field['widgetcontrols'] and 'setQgisConstraints' in field['widgetcontrols']:
+                    if field['widgetcontrols']['setQgisConstraints'] is True:
+                        layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintNotNull,
+                            QgsFieldConstraints.ConstraintStrengthSoft)
+                        layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintUnique,
+                            QgsFieldConstraints.ConstraintStrengthHard)
 
-        self.controller.log_info("Finish set_layer_config")
+            if 'ismandatory' in field and not field['ismandatory']:
+                layer.setFieldConstraint(fieldIndex, QgsFieldConstraints.ConstraintNotNull,
+                    QgsFieldConstraints.ConstraintStrengthSoft)
+
+            # Manage editability
+            self.set_read_only(form_config, field, fieldIndex)
+
+            # delete old values on ValueMap
+            editor_widget_setup = QgsEditorWidgetSetup('ValueMap', {'map': valuemap_values})
+            layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+
+            # Manage new values in ValueMap
+            if field['widgettype'] == 'combo':
+                if 'comboIds' in field:
+                    # Set values
+                    for i in range(0, len(field['comboIds'])):
+                        valuemap_values[field['comboNames'][i]] = field['comboIds'][i]
+                # Set values into valueMap
+                editor_widget_setup = QgsEditorWidgetSetup('ValueMap', {'map': valuemap_values})
+                layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+            elif field['widgettype'] == 'check':
+                config = {'CheckedState': 'true', 'UncheckedState': 'false'}
+                editor_widget_setup = QgsEditorWidgetSetup('CheckBox', config)
+                layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+            elif field['widgettype'] == 'datetime':
+                config = {'allow_null': True,
+                          'calendar_popup': True,
+                          'display_format': 'yyyy-MM-dd',
+                          'field_format': 'yyyy-MM-dd',
+                          'field_iso_format': False}
+                editor_widget_setup = QgsEditorWidgetSetup('DateTime', config)
+                layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
+            else:
+                editor_widget_setup = QgsEditorWidgetSetup('TextEdit', {'IsMultiline': 'True'})
+                layer.setEditorWidgetSetup(fieldIndex, editor_widget_setup)
 
+        # Set layer config
+        layer.setEditFormConfig(form_config)
+        table_config.setColumns(columns)
+        layer.setAttributeTableConfig(table_config)
 
-    def set_read_only(self, layer, field, field_index):
-        """ Set field readOnly according to client configuration into config_api_form_fields (field 'iseditable') """
 
-        # Get layer config
-        config = layer.editFormConfig()
+    def set_read_only(self, config, field, field_index):
+        """ Set field readOnly according to client configuration into config_api_form_fields (field 'iseditable')
+        :param config: Form configuration of the layer (QgsEditFormConfig)
+        """
+
         try:
             # Set field editability
             config.setReadOnly(field_index, not field['iseditable'])
         except KeyError:
             pass
-        finally:
-            # Set layer config
-            layer.setEditFormConfig(config)
 
 
-    def set_column_visibility(self, layer, col_name, hidden):
-        """ Hide selected fields according table config_api_form_fields.hidden """
+    def set_column_visibility(self, columns, col_name, hidden):
+        """ Hide selected fields according table config_api_form_fields.hidden
+        :param columns: Columns of the attribute table configuration of the layer
+        """
 
-        config = layer.attributeTableConfig()
-        columns = config.columns()
         for column in columns:
             if column.name == str(col_name):
                 column.hidden = hidden
                 break
-        config.setColumns(columns)
-        layer.setAttributeTableConfig(config)
 
 
     def set_column_multiline(self, layer, field, fieldIndex):
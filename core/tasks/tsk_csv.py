@@ -0,0 +1,160 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+
+import csv
+import os
+
+from ... import global_vars
+from ...dao.pg_dao import PgCopyReader, copy_escape
+
+
+class GwCsvTask(QgsTask):
+    """ Load rows of a CSV file into table 'temp_csv' with COPY ... FROM STDIN.
+        The file is read as it is sent to the server, so it's never loaded into memory """
+
+    fake_progress = pyqtSignal()
+
+    def __init__(self, description, path, encoding, delimiter, fid, readheader, callback=None):
+        """
+        :param path: Path of the CSV file
+        :param fid: Value of field 'fid' of the inserted rows
+        :param readheader: If False, first row of the file is skipped (it's the header)
+        :param callback: Function called from the main thread when the task finishes, with the task as parameter
+        """
+
+        super().__init__(description, QgsTask.CanCancel)
+        self.exception = None
+        self.controller = global_vars.controller
+        self.path = path
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.fid = fid
+        self.readheader = readheader
+        self.callback = callback
+        self.file_size = 0
+        self.read_size = 0
+        self.num_rows = 0
+        self.error = None
+        self.copy_size = 65536
+
+
+    def run(self):
+
+        self.controller.log_info(f"Task started: {self.description()}")
+        self.setProgress(0)
+
+        # COPY must be executed in a connection of this thread
+        if not self.controller.checkout_thread_connection():
+            self.error = (self.controller.dao.last_error, None)
+            return False
+
+        status = False
+        try:
+            status = self.copy_csv()
+        except Exception as e:
+            self.exception = e
+        finally:
+            self.controller.release_thread_connection(commit=status and not self.isCanceled())
+
+        return status and not self.isCanceled()
+
+
+    def finished(self, result):
+
+        if self.exception:
+            self.controller.log_info(f"Task aborted: {self.description()}")
+            self.controller.log_warning(f"Exception: {self.exception}")
+            self.controller.show_warning("EXCEPTION: " + str(self.exception))
+        elif self.error:
+            self.controller.manage_exception_db(self.error[0], self.error[1])
+        elif result:
+            self.controller.log_info(f"Task finished: {self.description()} ({self.num_rows} rows)")
+
+        if self.callback:
+            self.callback(self)
+
+
+    def cancel(self):
+
+        self.controller.show_info(f"Task canceled: {self.description()}")
+        super().cancel()
+
+
+    def copy_csv(self):
+        """ Load rows of the CSV file into table 'temp_csv' """
+
+        num_columns = self.get_num_columns()
+        if not num_columns:
+            return False
+
+        columns = ", ".join(f"csv{x + 1}" for x in range(num_columns))
+        sql = f"COPY temp_csv (fid, {columns}) FROM STDIN"
+        self.file_size = os.path.getsize(self.path)
+        with open(self.path, 'r', encoding=self.encoding) as csvfile:
+            reader = PgCopyReader(self.get_copy_lines(csvfile, num_columns), self.copy_progress)
+            error = self.controller.dao.copy_expert(sql, reader, self.copy_size)
+        if error:
+            self.error = (error, sql)
+            return False
+
+        return self.exception is None
+
+
+    def get_num_columns(self):
+        """ Get number of columns csv1, csv2... of table 'temp_csv' """
+
+        sql = ("SELECT count(*) FROM information_schema.columns "
+               "WHERE table_schema = current_schema() AND table_name = 'temp_csv' "
+               "AND column_name ~ '^csv[0-9]+$'")
+        row = self.controller.dao.get_row(sql)
+        if self.controller.dao.last_error:
+            self.error = (self.controller.dao.last_error, sql)
+            return None
+
+        return row[0] if row else None
+
+
+    def get_copy_lines(self, csvfile, num_columns):
+        """ Generator of rows of the opened CSV file encoded as lines of COPY text format.
+            Values are stripped and empty values are NULL. Rows shorter than the table are padded with NULL """
+
+        readheader = self.readheader
+        for row in csv.reader(self.count_read_size(csvfile), delimiter=self.delimiter):
+            if self.isCanceled():
+                return
+            if readheader is False:
+                readheader = True
+                continue
+            if len(row) == 0:
+                continue
+
+            if len(row) > num_columns:
+                # Stop COPY. Error will be managed once it has finished
+                self.exception = ValueError(f"Row {self.num_rows + 1} has {len(row)} columns. "
+                                            f"Table 'temp_csv' has {num_columns}")
+                return
+            values = [copy_escape(value.strip().replace("\n", "") or None) for value in row]
+            values.extend(["\\N"] * (num_columns - len(row)))
+            self.num_rows += 1
+            yield f"{self.fid}\t" + "\t".join(values) + "\n"
+
+
+    def count_read_size(self, csvfile):
+        """ Iterate over lines of @csvfile counting characters read """
+
+        for line in csvfile:
+            self.read_size += len(line)
+            yield line
+
+
+    def copy_progress(self, rows):
+
+        if self.file_size:
+            self.setProgress(min(100, (self.read_size * 100) / self.file_size))
@@ -8,12 +8,14 @@ or (at your option) any later version.
 from qgis.PyQt.QtCore import pyqtSignal
 from qgis.core import QgsTask
 
-import re
 import os
 import subprocess
+import time
 
 from ... import global_vars
 from ..utils.layer_tools import add_temp_layer
+from ..utils.rpt_tools import get_rpt_targets, read_rpt_rows, rpt_row_to_json
+from ...dao.pg_dao import PgCopyReader, copy_escape
 
 
 class GwGo2EpaTask(QgsTask):
@@ -31,7 +33,13 @@ class GwGo2EpaTask(QgsTask):
         self.message = None
         self.common_msg = ""
         self._file = None
+        self.epa_process = None
         self.fid = 140
+        self.rpt_table = "temp_go2epa_rpt"
+        self.rpt_error = None
+        self.copy_size = 65536
+        self.inp_table = "temp_go2epa_inp"
+        self.inp_itersize = 5000
         self.set_variables_from_go2epa()
         # self.progressChanged.connect(self.progress_changed)
 
@@ -51,22 +59,37 @@ class GwGo2EpaTask(QgsTask):
         self.net_geom = self.go2epa.net_geom
         self.export_subcatch = self.go2epa.export_subcatch
 
+        # Write INP file from a server-side cursor instead of getting it inside the result of the function
+        stream_inp = global_vars.settings.value('system_variables/go2epa_stream_inp')
+        self.stream_inp = self.export_inp and str(stream_inp).upper() == 'TRUE'
+
 
     def run(self):
 
-        if not self.exec_function_pg2epa():
+        # Use a dedicated database connection so GUI queries are not blocked by this task.
+        # Never use the main connection from this thread: if no pooled connection is available, give up
+        if not self.controller.checkout_thread_connection():
+            self.error_msg = f"Unable to get a database connection: {self.controller.dao.last_error}"
             return False
+        try:
+            if not self.exec_function_pg2epa():
+                return False
 
-        if self.export_inp:
-            self.export_to_inp()
+            if self.export_inp:
+                self.export_to_inp()
 
-        if self.exec_epa:
-            self.execute_epa()
+            # Results of a failed simulation are not imported
+            if self.exec_epa and not self.execute_epa():
+                return False
 
-        if self.import_result:
-            self.import_rpt()
+            if self.import_result:
+                self.import_rpt()
 
-        return True
+            return True
+        finally:
+            if self.stream_inp:
+                self.controller.execute_sql(f"DROP TABLE IF EXISTS {self.inp_table};")
+            self.controller.release_thread_connection()
 
 
     def finished(self, result):
@@ -114,6 +137,8 @@ class GwGo2EpaTask(QgsTask):
 
         self.controller.show_info(f"Task canceled: {self.description()}")
         self.close_file()
+        if self.epa_process and self.epa_process.poll() is None:
+            self.epa_process.terminate()
         super().cancel()
 
 
@@ -141,7 +166,10 @@ class GwGo2EpaTask(QgsTask):
         extras += f', "dumpSubcatch":"{self.export_subcatch}"'
         body = self.create_body(extras=extras)
         function_name = 'gw_fct_pg2epa_main'
-        json_result = self.controller.get_json(function_name, body)
+        if self.stream_inp:
+            json_result = self.exec_function_pg2epa_stream(function_name, body)
+        else:
+            json_result = self.controller.get_json(function_name, body)
         if json_result is None:
             return False
 
@@ -152,6 +180,33 @@ class GwGo2EpaTask(QgsTask):
         return True
 
 
+    def exec_function_pg2epa_stream(self, function_name, body):
+        """ Execute @function_name keeping its result in temporal table @inp_table.
+            Return the result without its INP file rows, which are read later by fill_inp_file_stream """
+
+        if not self.controller.check_function(function_name):
+            self.controller.show_warning("Function not found in database", parameter=function_name)
+            return None
+
+        sql = (f"DROP TABLE IF EXISTS {self.inp_table}; "
+               f"CREATE TEMP TABLE {self.inp_table} AS SELECT {function_name}({body})::jsonb AS result;")
+        if not self.controller.execute_sql(sql):
+            return None
+
+        sql = (f"SELECT result #- '{{body,file}}', jsonb_typeof(result->'body'->'file') = 'array', "
+               f"jsonb_array_length(CASE WHEN jsonb_typeof(result->'body'->'file') = 'array' "
+               f"THEN result->'body'->'file' ELSE '[]' END) "
+               f"FROM {self.inp_table}")
+        row = self.controller.get_row(sql)
+        if not row or not row[0]:
+            self.controller.log_warning(f"Function error: {function_name}")
+            return None
+
+        self.inp_has_file = bool(row[1])
+        self.inp_rows = row[2]
+        return self.controller.manage_json_result(row[0], sql)
+
+
     def export_to_inp(self):
 
         if self.isCanceled():
@@ -160,10 +215,15 @@ class GwGo2EpaTask(QgsTask):
         self.controller.log_info(f"Create inp file into POSTGRESQL")
 
         # Get values from complet_result['body']['file'] and insert into INP file
-        if 'file' not in self.complet_result['body']:
-            return
+        if self.stream_inp:
+            if not self.inp_has_file:
+                return
+            self.fill_inp_file_stream(self.file_inp)
+        else:
+            if 'file' not in self.complet_result['body']:
+                return
+            self.fill_inp_file(self.file_inp, self.complet_result['body']['file'])
 
-        self.fill_inp_file(self.file_inp, self.complet_result['body']['file'])
         self.message = self.complet_result['message']['text']
         self.common_msg += "Export INP finished. "
 
@@ -181,26 +241,46 @@ class GwGo2EpaTask(QgsTask):
         self.close_file(file1)
 
 
+    def fill_inp_file_stream(self, folder_path=None):
+        """ Write INP file reading its rows from a server-side cursor over temporal table @inp_table """
+
+        self.controller.log_info(f"Write inp file (stream): {folder_path}")
+
+        sql = (f"SELECT value->>'text' FROM {self.inp_table}, "
+               f"jsonb_array_elements(result->'body'->'file') WITH ORDINALITY AS rows(value, position) "
+               f"WHERE value->>'text' IS NOT NULL ORDER BY position")
+        file1 = open(folder_path, "w", buffering=1048576)
+        try:
+            for row_number, row in enumerate(self.controller.get_rows_iter(sql, self.inp_itersize)):
+                file1.write(row[0].rstrip() + "\n")
+                if row_number % self.inp_itersize == 0:
+                    if self.isCanceled():
+                        break
+                    if self.inp_rows:
+                        self.setProgress((row_number * 100) / self.inp_rows)
+        finally:
+            self.close_file(file1)
+
+
     def execute_epa(self):
+        """ Execute EPA software with INP and RPT files. Return True if it has written the RPT file """
 
         if self.isCanceled():
-            return
+            return False
 
         self.controller.log_info(f"Execute EPA software")
 
         if self.file_rpt == "null":
             message = "You have to set this parameter"
             self.controller.show_warning(message, parameter="RPT file")
-            return
+            self.error_msg = f"{message}: RPT file"
+            return False
 
         msg = "INP file not found"
-        if self.file_inp is not None:
-            if not os.path.exists(self.file_inp):
-                self.controller.show_warning(msg, parameter=str(self.file_inp))
-                return
-        else:
+        if self.file_inp is None or not os.path.exists(self.file_inp):
             self.controller.show_warning(msg, parameter=str(self.file_inp))
-            return
+            self.error_msg = f"{msg}: {self.file_inp}"
+            return False
 
         # Set file to execute
         opener = None
@@ -210,14 +290,34 @@ class GwGo2EpaTask(QgsTask):
             opener = f"{self.plugin_dir}/epa/ud_swmm50022.exe"
 
         if opener is None:
-            return
+            self.error_msg = f"EPA software not available for project type: {self.project_type}"
+            return False
 
-        if os.path.exists(opener):
-            subprocess.call([opener, self.file_inp, self.file_rpt], shell=False)
-            self.common_msg += "EPA model finished. "
-        else:
+        if not os.path.exists(opener):
             msg = "File not found"
             self.controller.show_warning(msg, parameter=opener)
+            self.error_msg = f"{msg}: {opener}"
+            return False
+
+        # Keep the process, so it can be terminated if the task is canceled
+        start_time = time.time()
+        self.epa_process = subprocess.Popen([opener, self.file_inp, self.file_rpt], shell=False)
+        return_code = self.epa_process.wait()
+        self.epa_process = None
+        if self.isCanceled():
+            return False
+        if return_code != 0:
+            self.error_msg = f"EPA software failed with exit code {return_code}"
+            self.controller.show_warning(self.error_msg)
+            return False
+        # RPT file of a previous execution is not valid (allow for coarse modification times of some file systems)
+        if not os.path.exists(self.file_rpt) or os.path.getmtime(self.file_rpt) < start_time - 2:
+            self.error_msg = f"EPA software has not written RPT file: {self.file_rpt}"
+            self.controller.show_warning(self.error_msg)
+            return False
+
+        self.common_msg += "EPA model finished. "
+        return True
 
 
     def import_rpt(self):
@@ -226,124 +326,78 @@ class GwGo2EpaTask(QgsTask):
         self.controller.log_info(f"Import rpt file........: {self.file_rpt}")
 
         self.rpt_result = None
-        self.json_rpt = None
         status = False
         try:
-            # Call import function
+            # Load rows of the file into temporal table and call import function
             status = self.read_rpt_file(self.file_rpt)
-            if not status:
-                return False
-            status = self.exec_import_function()
+            if status:
+                status = self.exec_import_function()
         except Exception as e:
             self.error_msg = str(e)
         finally:
+            self.controller.execute_sql(f"DROP TABLE IF EXISTS {self.rpt_table};")
             return status
 
 
     def read_rpt_file(self, folder_path=None):
-
-        self._file = open(folder_path, "r+")
-        full_file = self._file.readlines()
-        progress = 0
+        """ Parse RPT file and load its rows as JSON into temporal table @rpt_table using COPY """
 
         # Create dict with sources
         sql = f"SELECT tablename, target FROM config_fprocess WHERE fid = {self.fid};"
         rows = self.controller.get_rows(sql)
-        sources = {}
-        for row in rows:
-            json_elem = row[1].replace('{', '').replace('}', '')
-            item = json_elem.split(',')
-            for i in item:
-                sources[i.strip()] = row[0].strip()
-
-        # While we don't find a match with the target, target and col40 must be null
-        target = "null"
-        col40 = "null"
-        json_rpt = ""
-        row_count = sum(1 for rows in full_file)
-
-        for line_number, row in enumerate(full_file):
-
-            if self.isCanceled():
-                return False
+        if not rows:
+            return False
+        targets = get_rpt_targets(rows)
 
-            progress += 1
-            if '**' in row or '--' in row:
-                continue
-
-            row = row.rstrip()
-            dirty_list = row.split(' ')
-
-            # Clean unused items
-            for x in range(len(dirty_list) - 1, -1, -1):
-                if dirty_list[x] == '':
-                    dirty_list.pop(x)
-
-            sp_n = []
-            if len(dirty_list) > 0:
-                for x in range(0, len(dirty_list)):
-                    if bool(re.search('[0-9][-]\d{1,2}[.]]*', str(dirty_list[x]))):
-                        last_index = 0
-                        i = 0
-                        for i, c in enumerate(dirty_list[x]):
-                            if "-" == c:
-                                json_elem = dirty_list[x][last_index:i]
-                                last_index = i
-                                sp_n.append(json_elem)
-
-                        json_elem = dirty_list[x][last_index:i]
-                        sp_n.append(json_elem)
-
-                    elif bool(re.search('(\d\..*\.\d)', str(dirty_list[x]))):
-                        if 'Version' not in dirty_list and 'VERSION' not in dirty_list:
-                            self.controller.log_info(f"Error near line {line_number+1} -> {dirty_list}")
-                            message = ("The rpt file has a heavy inconsistency. "
-                                       "As a result it's not posible to import it. "
-                                       "Columns are overlaped one againts other, this is a not valid simulation. "
-                                       "Please ckeck and fix it before continue")
-                            self.controller.show_message(message, 1)
-                            return False
-                    else:
-                        sp_n.append(dirty_list[x])
-
-            # Find strings into dict and set target column
-            for k, v in sources.items():
-                try:
-                    if k in (f'{sp_n[0]} {sp_n[1]}', f'{sp_n[0]}'):
-                        target = "'" + v + "'"
-                        _time = re.compile('^([012]?[0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]$')
-                        if _time.search(sp_n[3]):
-                            col40 = "'" + sp_n[3] + "'"
-                except IndexError:
-                    pass
-                except Exception as e:
-                    self.controller.log_info(type(e).__name__)
-
-            if len(sp_n) > 0:
-                json_elem = f'"target": "{target}", "col40": "{col40}", '
-                for x in range(0, len(sp_n)):
-                    json_elem += f'"col{x + 1}":'
-                    if "''" not in sp_n[x]:
-                        value = '"' + sp_n[x].strip().replace("\n", "") + '", '
-                        value = value.replace("''", "null")
-                    else:
-                        value = 'null, '
-                    json_elem += value
-
-                json_elem = '{' + str(json_elem[:-2]) + '}, '
-                json_rpt += json_elem
-
-            # Update progress bar
-            if progress % 1000 == 0:
-                self.setProgress((line_number * 100) / row_count)
-
-        # Manage JSON
-        json_rpt = '[' + str(json_rpt[:-2]) + ']'
-        self.json_rpt = json_rpt
+        sql = (f"DROP TABLE IF EXISTS {self.rpt_table}; "
+               f"CREATE TEMP TABLE {self.rpt_table} (id serial PRIMARY KEY, row_json json);")
+        if not self.controller.execute_sql(sql):
+            return False
 
-        self.close_file()
+        self.rpt_error = None
+        self.rpt_size = os.path.getsize(folder_path)
+        self.rpt_read_size = 0
+        self._file = open(folder_path, "r")
+        try:
+            reader = PgCopyReader(self.get_rpt_lines(targets), self.rpt_progress)
+            sql = f"COPY {self.rpt_table} (row_json) FROM STDIN"
+            status = self.controller.copy_expert(sql, reader, self.copy_size)
+        finally:
+            self.close_file()
 
-        return True
+        if self.isCanceled():
+            return False
+
+        if self.rpt_error:
+            self.controller.log_info(str(self.rpt_error))
+            message = ("The rpt file has a heavy inconsistency. "
+                       "As a result it's not posible to import it. "
+                       "Columns are overlaped one againts other, this is a not valid simulation. "
+                       "Please ckeck and fix it before continue")
+            self.controller.show_message(message, 1)
+            return False
+
+        return status
+
+
+    def get_rpt_lines(self, targets):
+        """ Generator of rows of the opened RPT file encoded as lines of COPY text format """
+
+        try:
+            for read_size, target, col40, values in read_rpt_rows(self._file, targets):
+                if self.isCanceled():
+                    return
+                self.rpt_read_size = read_size
+                yield copy_escape(rpt_row_to_json(target, col40, values)) + "\n"
+        except ValueError as e:
+            # Stop COPY. Error will be managed once it has finished
+            self.rpt_error = e
+
+
+    def rpt_progress(self, rows):
+
+        if self.rpt_size:
+            self.setProgress((self.rpt_read_size * 100) / self.rpt_size)
 
 
     def create_body(self, form='', feature='', filter_fields='', extras=None):
@@ -363,13 +417,31 @@ class GwGo2EpaTask(QgsTask):
         return body
 
 
+    def check_import_file_table(self):
+        """ Check if import functions of current schema read the RPT rows from the table set in 'fileTable' """
+
+        schema_name = self.controller.schema_name.replace('"', '')
+        sql = ("SELECT 1 FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+               "WHERE n.nspname = %s AND p.proname IN ('gw_fct_rpt2pg_main', 'gw_fct_rpt2pg_import_rpt') "
+               "AND p.prosrc LIKE '%%fileTable%%' LIMIT 1")
+        row = self.controller.get_row(sql, params=[schema_name], log_info=False)
+
+        return bool(row)
+
+
     def exec_import_function(self):
         """ Call function gw_fct_rpt2pg_main """
 
-        extras = f'"resultId":"{self.result_name}"'
-        if self.json_rpt:
-            extras += f', "file": {self.json_rpt}'
-        body = self.create_body(extras=extras)
+        # Rows of the file are not sent again: schemas able to read the temporal table get its name,
+        # otherwise its rows are aggregated into key 'file' by the server
+        if self.check_import_file_table():
+            extras = f'"resultId":"{self.result_name}", "fileTable":"{self.rpt_table}"'
+            body = self.create_body(extras=extras)
+        else:
+            extras = f'"resultId":"{self.result_name}", "file": []'
+            body = self.create_body(extras=extras)
+            body = (f"jsonb_set({body}::jsonb, '{{data,file}}', "
+                    f"(SELECT COALESCE(jsonb_agg(row_json::jsonb ORDER BY id), '[]') FROM {self.rpt_table}))::json")
         function_name = 'gw_fct_rpt2pg_main'
         json_result = self.controller.get_json(function_name, body, log_sql=False)
         if json_result is None:
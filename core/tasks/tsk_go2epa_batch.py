@@ -0,0 +1,268 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from ... import global_vars
+from .tsk_go2epa import GwGo2EpaTask
+
+
+class GwGo2EpaBatchTask(QgsTask):
+    """ Run Go2Epa for a list of scenarios as a pipeline:
+        exports are executed one after the other because they depend on the selectors of current user,
+        while EPA software and import of results of already exported scenarios run concurrently """
+
+    fake_progress = pyqtSignal()
+
+    def __init__(self, description, go2epa, scenarios, folder, max_workers=None):
+        """
+        :param go2epa: Object GwGo2Epa with options of the dialog (export, execute, import...)
+        :param scenarios: List of result ids, or list of dicts with keys 'result_id' and optionally
+            'dscenario_id' (list of demand scenarios, ws) or 'hydrology_id' (ud)
+        :param folder: Folder where INP and RPT files named as the result id will be written
+        :param max_workers: Max. number of scenarios executing EPA software or importing results at the same time
+        """
+
+        super().__init__(description, QgsTask.CanCancel)
+        self.exception = None
+        self.controller = global_vars.controller
+        self.go2epa = go2epa
+        self.folder = folder
+        self.scenarios = []
+        for scenario in scenarios:
+            if not isinstance(scenario, dict):
+                scenario = {'result_id': str(scenario)}
+            self.scenarios.append(scenario)
+
+        if max_workers is None:
+            max_workers = global_vars.settings.value('system_variables/go2epa_batch_workers')
+        try:
+            max_workers = int(max_workers)
+        except (TypeError, ValueError):
+            max_workers = os.cpu_count() or 1
+        # One pooled connection is used by this task to export the scenarios, the rest by the workers.
+        # Pool must have at least 2 connections (see GwGo2Epa.go2epa_batch)
+        self.max_workers = max(1, min(max_workers, self.controller.dao.pool_size - 1))
+
+        self.project_type = go2epa.project_type
+        self.results = {}
+        # Tasks of the scenarios being processed, canceled along with this one
+        self.scenario_tasks = []
+        self.steps_done = 0
+        self.steps_lock = threading.Lock()
+        self.prev_selectors = None
+
+
+    def run(self):
+
+        self.controller.log_info(f"Task started: {self.description()} ({len(self.scenarios)} scenarios, "
+                                 f"{self.max_workers} workers)")
+        self.setProgress(0)
+
+        # Exports use the connection of this thread, while each worker checks out its own one.
+        # Never use the main connection from this thread: if no pooled connection is available, give up
+        if not self.controller.checkout_thread_connection():
+            self.exception = self.controller.dao.last_error
+            return False
+        self.save_selectors()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for scenario in self.scenarios:
+                    if self.isCanceled():
+                        break
+                    result_id = scenario['result_id']
+                    timings = {'export': 0, 'epa': 0, 'import': 0}
+                    self.results[result_id] = {'status': 'Running', 'error': None, 'timings': timings}
+                    task = self.create_scenario_task(result_id)
+                    self.scenario_tasks.append(task)
+                    if self.exec_export(scenario, task):
+                        executor.submit(self.exec_epa_and_import, result_id, task)
+        except Exception as e:
+            self.exception = e
+            return False
+        finally:
+            self.restore_selectors()
+            self.controller.release_thread_connection()
+
+        return not self.isCanceled()
+
+
+    def finished(self, result):
+
+        msg = ""
+        for result_id, values in self.results.items():
+            timings = values['timings']
+            msg += (f"{result_id}: {values['status']} (export {timings['export']:.1f}s, "
+                    f"EPA {timings['epa']:.1f}s, import {timings['import']:.1f}s)\n")
+            if values['error']:
+                msg += f"    {values['error']}\n"
+        self.controller.log_info(f"Task finished: {self.description()}\n{msg}")
+
+        if self.exception:
+            self.controller.log_info(f"Task aborted: {self.description()}")
+            self.controller.log_warning(f"Exception: {self.exception}")
+            raise self.exception
+
+        self.controller.show_info_box("Go2Epa batch finished", inf_text=msg)
+        self.go2epa.check_result_id()
+
+
+    def cancel(self):
+
+        self.controller.show_info(f"Task canceled: {self.description()}")
+        super().cancel()
+        # Stop reading of files and EPA software of the scenarios already started
+        for task in list(self.scenario_tasks):
+            if not task.isCanceled():
+                task.cancel()
+
+
+    def create_scenario_task(self, result_id):
+        """ Create a GwGo2EpaTask (not added to task manager) with the options of the dialog for @result_id """
+
+        go2epa = SimpleNamespace(
+            dlg_go2epa=self.go2epa.dlg_go2epa, result_name=result_id,
+            file_inp=os.path.join(self.folder, f"{result_id}.inp"),
+            file_rpt=os.path.join(self.folder, f"{result_id}.rpt"),
+            export_inp=self.go2epa.export_inp, exec_epa=self.go2epa.exec_epa,
+            import_result=self.go2epa.import_result, project_type=self.project_type,
+            plugin_dir=self.go2epa.plugin_dir, net_geom=self.go2epa.net_geom,
+            export_subcatch=self.go2epa.export_subcatch)
+
+        return GwGo2EpaTask(f"Go2Epa {result_id}", go2epa)
+
+
+    def exec_export(self, scenario, task):
+        """ Set selectors of @scenario and export it. Executed in the thread of this task """
+
+        result_id = scenario['result_id']
+        start = time.perf_counter()
+        try:
+            self.set_selectors(scenario)
+            status = task.exec_function_pg2epa()
+            if status and task.export_inp:
+                task.export_to_inp()
+        except Exception as e:
+            task.error_msg = str(e)
+            status = False
+        finally:
+            if task.stream_inp:
+                self.controller.execute_sql(f"DROP TABLE IF EXISTS {task.inp_table};")
+        self.results[result_id]['timings']['export'] = time.perf_counter() - start
+
+        if not status:
+            self.results[result_id]['status'] = 'Failed'
+            self.results[result_id]['error'] = task.error_msg or "Error executing gw_fct_pg2epa_main"
+            # Steps of EPA software and import are skipped
+            self.step_finished(3)
+            return False
+
+        self.step_finished()
+        return True
+
+
+    def exec_epa_and_import(self, result_id, task):
+        """ Execute EPA software and import its results. Executed in a worker thread """
+
+        timings = self.results[result_id]['timings']
+        # Steps of this scenario not finished yet: EPA software and import. Skipped ones are counted as finished
+        steps_left = 2
+        try:
+            if task.exec_epa and not self.isCanceled():
+                start = time.perf_counter()
+                status = task.execute_epa()
+                timings['epa'] = time.perf_counter() - start
+                if not status and not self.isCanceled():
+                    self.results[result_id]['status'] = 'Failed'
+                    self.results[result_id]['error'] = task.error_msg or "Error executing EPA software"
+                    return
+            self.step_finished()
+            steps_left -= 1
+
+            if task.import_result and not self.isCanceled():
+                start = time.perf_counter()
+                if not self.controller.checkout_thread_connection():
+                    self.results[result_id]['status'] = 'Failed'
+                    self.results[result_id]['error'] = f"Unable to get a database connection: " \
+                                                       f"{self.controller.dao.last_error}"
+                    return
+                try:
+                    status = task.import_rpt()
+                finally:
+                    self.controller.release_thread_connection()
+                timings['import'] = time.perf_counter() - start
+                if not status and not self.isCanceled():
+                    self.results[result_id]['status'] = 'Failed'
+                    self.results[result_id]['error'] = task.error_msg or "Error importing RPT file"
+                    return
+            self.step_finished()
+            steps_left -= 1
+
+            if self.isCanceled():
+                self.results[result_id]['status'] = 'Canceled'
+            else:
+                self.results[result_id]['status'] = 'Finished'
+
+        except Exception as e:
+            self.results[result_id]['status'] = 'Failed'
+            self.results[result_id]['error'] = str(e)
+        finally:
+            if steps_left:
+                self.step_finished(steps_left)
+
+
+    def step_finished(self, steps=1):
+
+        # Each scenario has 3 steps: export, EPA software and import. Workers finish them concurrently
+        with self.steps_lock:
+            self.steps_done += steps
+            progress = (self.steps_done * 100) / (len(self.scenarios) * 3)
+        self.setProgress(progress)
+
+
+    def save_selectors(self):
+        """ Save demand scenarios (ws) or hydrology (ud) selected by current user """
+
+        if self.project_type == 'ws':
+            sql = "SELECT dscenario_id FROM selector_inp_demand WHERE cur_user = current_user"
+        else:
+            sql = "SELECT hydrology_id FROM selector_inp_hydrology WHERE cur_user = current_user"
+        rows = self.controller.get_rows(sql, log_info=False)
+        self.prev_selectors = [row[0] for row in rows] if rows else []
+
+
+    def restore_selectors(self):
+
+        if self.prev_selectors is None:
+            return
+        if self.project_type == 'ws':
+            self.set_selectors({'dscenario_id': self.prev_selectors})
+        elif self.prev_selectors:
+            self.set_selectors({'hydrology_id': self.prev_selectors[0]})
+
+
+    def set_selectors(self, scenario):
+        """ Set demand scenarios (ws) or hydrology (ud) of @scenario for current user """
+
+        if self.project_type == 'ws' and 'dscenario_id' in scenario:
+            sql = "DELETE FROM selector_inp_demand WHERE cur_user = current_user;\n"
+            for dscenario_id in scenario['dscenario_id']:
+                sql += (f"INSERT INTO selector_inp_demand (dscenario_id, cur_user) "
+                        f"VALUES ('{dscenario_id}', current_user);\n")
+            self.controller.execute_sql(sql)
+        elif self.project_type == 'ud' and 'hydrology_id' in scenario:
+            sql = (f"DELETE FROM selector_inp_hydrology WHERE cur_user = current_user;\n"
+                   f"INSERT INTO selector_inp_hydrology (hydrology_id, cur_user) "
+                   f"VALUES ('{scenario['hydrology_id']}', current_user);")
+            self.controller.execute_sql(sql)
@@ -0,0 +1,70 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+
+from ... import global_vars
+
+
+class GwSearchTask(QgsTask):
+    """ Execute search functions (gw_fct_setsearch, gw_fct_setsearchadd) in a pooled connection,
+        so typing in the search dialog never waits for the database """
+
+    fake_progress = pyqtSignal()
+
+    def __init__(self, description, search, request_id, calls):
+        """
+        :param search: Object GwSearch that receives the results in its method search_finished
+        :param request_id: Sequence number of the request. Results of older requests are discarded by @search
+        :param calls: List of tuples (function_name, body) executed one after the other
+        """
+
+        super().__init__(description, QgsTask.CanCancel)
+        self.exception = None
+        self.controller = global_vars.controller
+        self.search = search
+        self.request_id = request_id
+        self.calls = calls
+        self.results = []
+        self.error = None
+
+
+    def run(self):
+
+        # Never use the main connection from this thread: if no pooled connection is available, give up
+        if not self.controller.checkout_thread_connection():
+            return False
+
+        try:
+            for function_name, body in self.calls:
+                if self.isCanceled():
+                    return False
+                sql = f"SELECT {function_name}({body});"
+                row = self.controller.dao.get_row(sql, commit=True)
+                if self.controller.dao.last_error:
+                    self.error = (self.controller.dao.last_error, sql)
+                    return False
+                json_result = row[0] if row else None
+                self.results.append((function_name, sql, json_result))
+        except Exception as e:
+            self.exception = e
+            return False
+        finally:
+            self.controller.release_thread_connection()
+
+        return not self.isCanceled()
+
+
+    def finished(self, result):
+
+        # Executed in the main thread: GUI and rubber band can be updated safely
+        if self.exception:
+            self.controller.log_warning(f"Exception: {self.exception}")
+        elif self.error and not self.isCanceled():
+            self.controller.manage_exception_db(self.error[0], self.error[1])
+        self.search.search_finished(self, result)
@@ -0,0 +1,130 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QBuffer, QByteArray, QIODevice, QSize
+from qgis.PyQt.QtGui import QImageReader
+from qgis.core import QgsTask
+
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from ... import global_vars
+from ..utils.thumbnail_cache import get_thumbnail_cache
+
+
+class GwThumbnailsTask(QgsTask):
+    """ Fetch and decode images (local files or HTTP URLs) out of the GUI thread.
+        Each image is notified with signal image_loaded as soon as it's ready, as a QImage
+        (QPixmap must be created in the GUI thread). Thumbnails are saved in the thumbnail cache """
+
+    fake_progress = pyqtSignal()
+    image_loaded = pyqtSignal(int, object)
+
+    def __init__(self, description, images, size=None, max_workers=4, timeout=30):
+        """
+        :param images: List of tuples (index, path). Index is sent with signal image_loaded
+        :param size: Tuple (width, height) of thumbnails. If None, images are loaded at full resolution
+            and not cached
+        :param max_workers: Max. number of images fetched at the same time
+        :param timeout: Seconds to wait for HTTP responses
+        """
+
+        super().__init__(description, QgsTask.CanCancel)
+        self.exception = None
+        self.controller = global_vars.controller
+        self.images = images
+        self.size = size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = get_thumbnail_cache() if size else None
+        self.errors = []
+        self.num_loaded = 0
+        self.lock = threading.Lock()
+
+
+    def run(self):
+
+        if not self.images:
+            return True
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.images))) as executor:
+                for index, path in self.images:
+                    executor.submit(self.load_image, index, path)
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return not self.isCanceled()
+
+
+    def finished(self, result):
+
+        if self.exception:
+            self.controller.log_info(f"Task aborted: {self.description()}")
+            self.controller.log_warning(f"Exception: {self.exception}")
+        for path, error in self.errors:
+            self.controller.log_warning(f"Error loading image {path}: {error}")
+
+
+    def load_image(self, index, path):
+        """ Load image @path and emit it with @index. Executed in a worker thread """
+
+        if self.isCanceled():
+            return
+
+        try:
+            key = None
+            image = None
+            if self.cache:
+                key = self.cache.get_key(path, self.size[0], self.size[1])
+                image = self.cache.get(key)
+            if image is None:
+                image = self.read_image(path)
+                if self.cache and image is not None:
+                    self.cache.put(key, image)
+        except Exception as e:
+            self.errors.append((path, e))
+            image = None
+
+        with self.lock:
+            self.num_loaded += 1
+            self.setProgress((self.num_loaded * 100) / len(self.images))
+        if not self.isCanceled():
+            self.image_loaded.emit(index, image)
+
+
+    def read_image(self, path):
+        """ Fetch and decode image @path. Thumbnails are decoded at their final size, which for JPEG files
+            avoids decoding the whole image """
+
+        url = urllib.parse.urlsplit(str(path))
+        if url.scheme in ("http", "https"):
+            data = urllib.request.urlopen(str(path), timeout=self.timeout).read()
+            if self.isCanceled():
+                return None
+            buffer = QBuffer()
+            buffer.setData(QByteArray(data))
+            buffer.open(QIODevice.ReadOnly)
+            reader = QImageReader(buffer)
+        else:
+            reader = QImageReader(str(path))
+
+        if self.size:
+            reader.setScaledSize(QSize(self.size[0], self.size[1]))
+            reader.setQuality(100)
+        image = reader.read()
+        if image.isNull():
+            self.errors.append((path, reader.errorString()))
+            return None
+
+        if self.size and (image.width(), image.height()) != tuple(self.size):
+            image = image.scaled(self.size[0], self.size[1], Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+        return image
@@ -5,6 +5,7 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+from qgis.core import QgsApplication
 from qgis.PyQt.QtCore import QPoint, Qt
 from qgis.PyQt.QtWidgets import QAction, QApplication, QMenu
 from qgis.PyQt.QtGui import QCursor
@@ -29,6 +30,7 @@ class GwAddChildLayerButton(GwParentAction):
         self.qgis_project_infotype = self.project_vars['infotype']
         self.qgis_project_add_schema = self.project_vars['add_schema']
         self.available_layers = None
+        self.task_get_layers = None
         self.config_layers()
 
 
@@ -111,10 +113,11 @@ class GwAddChildLayerButton(GwParentAction):
         # Set project layers with gw_fct_getinfofromid: This process takes time for user
         # Set background task 'ConfigLayerFields'
         description = f"ConfigLayerFields"
-        task_get_layers = GwConfigLayerTask(description, self.controller)
-        task_get_layers.set_params(self.project_type, self.schema_name, self.qgis_project_infotype)
-        # QgsApplication.taskManager().addTask(task_get_layers)
-        # QgsApplication.taskManager().triggerTask(task_get_layers)
+        self.task_get_layers = GwConfigLayerTask(description, self.controller)
+        self.task_get_layers.set_params(self.project_type, self.schema_name, self.qgis_project_infotype)
+        # Configuration saved by last execution is set right away. Task will update it if it has changed
+        self.task_get_layers.set_layer_config_from_cache()
+        QgsApplication.taskManager().addTask(self.task_get_layers)
 
         return True
 
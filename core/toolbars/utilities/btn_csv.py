@@ -5,6 +5,7 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+from qgis.core import QgsApplication
 from qgis.PyQt.QtGui import QStandardItem, QStandardItemModel
 from qgis.PyQt.QtWidgets import QFileDialog
 
@@ -20,6 +21,7 @@ from ....ui_manager import CsvUi
 from .... import global_vars
 from ....actions.parent_functs import create_body
 from ...utils.layer_tools import populate_info_text
+from ...tasks.tsk_csv import GwCsvTask
 
 
 class GwCSVButton(GwParentAction):
@@ -114,7 +116,6 @@ class GwCSVButton(GwParentAction):
     def write_csv(self, dialog, temp_tablename):
         """ Write csv in postgres and call gw_fct_utils_csv2pg function """
         self.save_settings_values()
-        insert_status = True
         if not self.validate_params(dialog):
             return
 
@@ -125,17 +126,23 @@ class GwCSVButton(GwParentAction):
         delimiter = self.get_delimiter(dialog)
         _unicode = qt_tools.getWidgetText(dialog, dialog.cmb_unicode_list)
 
-        try:
-            with open(path, 'r', encoding=_unicode) as csvfile:
-                insert_status = self.insert_into_db(dialog, csvfile, delimiter, _unicode)
-                csvfile.close()
-                del csvfile
-        except Exception as e:
-            self.controller.show_warning("EXCEPTION: " + str(e))
+        self.insert_into_db(dialog, path, delimiter, _unicode, partial(self.execute_import, dialog, label_aux))
+
 
-        if insert_status is False:
+    def execute_import(self, dialog, label_aux, task):
+        """ Call import function once the CSV file has been loaded into temp_csv by @task """
+
+        try:
+            dialog.btn_accept.setEnabled(True)
+        except RuntimeError:
+            # Dialog closed while importing
+            dialog = None
+        if task.exception or task.error or task.isCanceled():
+            if dialog:
+                dialog.progressBar.setVisible(False)
             return
 
+        fid_aux = task.fid
         extras = f'"importParam":"{label_aux}"'
         extras += f', "fid":"{fid_aux}"'
         body = create_body(extras=extras)
@@ -144,7 +151,7 @@ class GwCSVButton(GwParentAction):
         if not result:
             return
         else:
-            if result['status'] == "Accepted":
+            if result['status'] == "Accepted" and dialog:
                 populate_info_text(dialog, result['body']['data'])
             msg = result['message']['text']
             self.controller.show_info_box(msg)
@@ -256,51 +263,30 @@ class GwCSVButton(GwParentAction):
         return delimiter
 
 
-    def insert_into_db(self, dialog, csvfile, delimiter, _unicode):
+    def insert_into_db(self, dialog, path, delimiter, _unicode, callback=None):
+        """ Load CSV file @path into temp_csv with COPY in a background task. @callback is called when finished """
 
-        sql = ""
-        progress = 0
         dialog.progressBar.setVisible(True)
-        dialog.progressBar.setValue(progress)
-        # counts rows in csvfile, using var "row_count" to do progressbar
-        # noinspection PyUnusedLocal
-        row_count = sum(1 for rows in csvfile)
-        if row_count > 20:
-            row_count -= 20
-        dialog.progressBar.setMaximum(row_count)  # -20 for see 100% complete progress
-        csvfile.seek(0)  # Position the cursor at position 0 of the file
-        reader = csv.reader(csvfile, delimiter=delimiter)
+        dialog.progressBar.setMaximum(100)
+        dialog.progressBar.setValue(0)
+        dialog.btn_accept.setEnabled(False)
         fid_aux = qt_tools.get_item_data(dialog, dialog.cmb_import_type, 0)
         readheader = qt_tools.get_item_data(dialog, dialog.cmb_import_type, 4)
-        for row in reader:
-            if readheader is False:
-                readheader = True
-                continue
-            if len(row) > 0:
-                sql += "INSERT INTO temp_csv (fid, "
-                values = f"VALUES({fid_aux}, "
-                for x in range(0, len(row)):
-                    sql += f"csv{x + 1}, "
-                    value = f"$$" + row[x].strip().replace("\n", "") + "$$, "
-                    value = str(value)
-                    values += value.replace("$$$$", "null")
-                sql = sql[:-2] + ") "
-                values = values[:-2] + ");\n"
-                sql += values
-                progress += 1
-            dialog.progressBar.setValue(progress)
-
-            if progress % 500 == 0:
-                status = self.controller.execute_sql(sql)
-                if not status:
-                    return False
-                sql = ""
-        if sql != "":
-            status = self.controller.execute_sql(sql)
-            if not status:
-                return False
 
-        return True
+        description = "Import CSV"
+        self.task_csv = GwCsvTask(description, path, _unicode, delimiter, fid_aux, readheader, callback)
+        self.task_csv.progressChanged.connect(partial(self.set_progress, dialog))
+        QgsApplication.taskManager().addTask(self.task_csv)
+        QgsApplication.taskManager().triggerTask(self.task_csv)
+
+
+    def set_progress(self, dialog, progress):
+
+        try:
+            dialog.progressBar.setValue(int(progress))
+        except RuntimeError:
+            # Dialog closed while importing
+            pass
 
 
     def get_path(self, dialog):
@@ -0,0 +1,173 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal, QObject, QTimer
+
+import os
+from itertools import islice
+
+from ... import global_vars
+from ...dao.pg_dao import PgCopyReader, copy_escape
+from .inp_tools import read_inp_rows
+
+
+class GwInpLoader(QObject):
+    """ Load lines of an INP file into table 'temp_csv' with COPY ... FROM STDIN.
+        Sections are parsed as the file is sent to the server, so it's never loaded into memory.
+        Rows are loaded using the main connection, because the schema where they are inserted may have been created
+        in the current transaction, which pooled connections can't see. psycopg2 connections can't be shared between
+        threads, so the file is loaded from the GUI thread in chunks of @chunk_rows rows, each one with its own COPY,
+        letting the event loop run between them. It is neither committed nor rolled back here """
+
+    progressChanged = pyqtSignal(float)
+
+    def __init__(self, path, fid=239, callback=None, chunk_rows=20000):
+        """
+        :param path: Path of the INP file
+        :param fid: Value of field 'fid' of the inserted rows
+        :param callback: Function called when loading finishes, with the loader as parameter
+        :param chunk_rows: Number of rows loaded by each COPY
+        """
+
+        super().__init__()
+        self.controller = global_vars.controller
+        self.path = path
+        self.fid = fid
+        self.callback = callback
+        self.chunk_rows = chunk_rows
+        self.exception = None
+        self.error = None
+        self.file_size = 0
+        self.read_size = 0
+        self.num_rows = 0
+        self.copy_size = 65536
+        self.sql = None
+        self.inp_file = None
+        self.lines = None
+        self.timer = None
+        self.running = False
+        self.canceled = False
+
+
+    def start(self):
+        """ Start loading the file. Chunks are loaded each time the event loop is idle """
+
+        self.controller.log_info(f"Loading INP file: {self.path}")
+        self.progressChanged.emit(0)
+        num_columns = self.get_num_columns()
+        if not num_columns:
+            self.finish()
+            return
+
+        try:
+            self.file_size = os.path.getsize(self.path)
+            self.inp_file = open(self.path, 'r')
+        except OSError as e:
+            self.exception = e
+            self.finish()
+            return
+
+        columns = ", ".join(f"csv{x + 1}" for x in range(num_columns))
+        self.sql = f"COPY temp_csv (fid, source, {columns}) FROM STDIN"
+        self.lines = self.get_copy_lines(self.inp_file, num_columns)
+        self.running = True
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.load_chunk)
+        self.timer.start(0)
+
+
+    def is_running(self):
+        return self.running
+
+
+    def cancel(self):
+        """ Stop loading the file. Callback is called with the loader canceled """
+
+        if not self.running:
+            return
+        self.controller.show_info(f"Loading of INP file canceled: {self.path}")
+        self.canceled = True
+
+
+    def isCanceled(self):
+        return self.canceled
+
+
+    def load_chunk(self):
+        """ Load next chunk of rows with COPY """
+
+        if self.canceled:
+            self.finish()
+            return
+
+        lines = list(islice(self.lines, self.chunk_rows))
+        if self.exception or not lines:
+            self.finish()
+            return
+
+        error = self.controller.dao.copy_expert(self.sql, PgCopyReader(lines), self.copy_size)
+        if error:
+            self.error = (error, self.sql)
+            self.finish()
+            return
+
+        if self.file_size:
+            self.progressChanged.emit(min(100, (self.read_size * 100) / self.file_size))
+
+
+    def finish(self):
+
+        self.running = False
+        if self.timer:
+            self.timer.stop()
+            self.timer = None
+        if self.inp_file:
+            self.inp_file.close()
+            self.inp_file = None
+
+        if self.exception:
+            self.controller.log_warning(f"Exception: {self.exception}")
+            self.controller.show_warning("EXCEPTION: " + str(self.exception))
+        elif self.error:
+            self.controller.manage_exception_db(self.error[0], self.error[1])
+        elif not self.canceled:
+            self.progressChanged.emit(100)
+            self.controller.log_info(f"INP file loaded: {self.path} ({self.num_rows} rows)")
+
+        if self.callback:
+            self.callback(self)
+
+
+    def get_num_columns(self):
+        """ Get number of columns csv1, csv2... of table 'temp_csv' """
+
+        sql = ("SELECT count(*) FROM information_schema.columns "
+               "WHERE table_schema = current_schema() AND table_name = 'temp_csv' "
+               "AND column_name ~ '^csv[0-9]+$'")
+        row = self.controller.dao.get_row(sql)
+        if self.controller.dao.last_error:
+            self.error = (self.controller.dao.last_error, sql)
+            return None
+
+        return row[0] if row else None
+
+
+    def get_copy_lines(self, inp_file, num_columns):
+        """ Generator of lines of the opened INP file encoded as lines of COPY text format.
+            Lines with fewer values than columns of the table are padded with NULL """
+
+        for read_size, target, values in read_inp_rows(inp_file):
+            self.read_size = read_size
+            if len(values) > num_columns:
+                # Stop loading. Error will be managed once the current chunk has been loaded
+                self.exception = ValueError(f"Line of section {target} has {len(values)} values. "
+                                            f"Table 'temp_csv' has {num_columns} columns: {values}")
+                return
+            line = [copy_escape(value) for value in values]
+            line.extend(["\\N"] * (num_columns - len(values)))
+            self.num_rows += 1
+            yield f"{self.fid}\t{copy_escape(target)}\t" + "\t".join(line) + "\n"
@@ -0,0 +1,67 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import re
+
+
+# Sections whose lines are imported as a whole, without splitting them into values
+INP_WHOLE_SECTIONS = ('[TRANSECTS]', '[CONTROLS]', '[RULES]')
+# Sections whose lines are split only by their first blank space or tab
+INP_FIRST_SPLIT_SECTIONS = ('[EVAPORATION]', '[TEMPERATURE]')
+# Tokens discarded from the lines of the rest of sections
+INP_DISCARDED_TOKENS = ('', '; ', ';', ';\n')
+
+re_blank = re.compile(' |\t')
+
+
+def split_inp_row(row, target):
+    """ Split @row of section @target of an INP file into its values
+    :param row: Line of the file without trailing blank spaces
+    :param target: Header of current section (ie: '[JUNCTIONS]')
+    :return: List of values of the line. Empty list if the line has to be skipped
+    """
+
+    if target in INP_WHOLE_SECTIONS:
+        return [row]
+
+    if target in INP_FIRST_SPLIT_SECTIONS:
+        return re_blank.split(row, 1)
+
+    if row[0] == ';':
+        tokens = [row]
+    else:
+        tokens = re_blank.split(row)
+
+    return [token for token in tokens
+            if token not in INP_DISCARDED_TOKENS and '**' not in token and '--' not in token]
+
+
+def read_inp_rows(inp_file):
+    """ Parse lines of opened @inp_file one by one, without loading the whole file into memory
+    :param inp_file: File object of the INP file opened in text mode
+    :return: Generator of tuples (read_size, target, values)
+        read_size: Number of characters read from the file so far
+        target: Header of current section (ie: '[JUNCTIONS]'). Empty string before the first one
+        values: List of values of the line (None if value is null)
+    """
+
+    target = ""
+    read_size = 0
+    for row in inp_file:
+
+        read_size += len(row)
+        row = row.rstrip()
+        if not row:
+            continue
+
+        if row[0] == '[':
+            target = row
+
+        sp_n = split_inp_row(row, target)
+        if sp_n:
+            values = [None if "''" in value else value.strip() or None for value in sp_n]
+            yield read_size, target, values
@@ -6,13 +6,15 @@ or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
 from qgis.core import QgsCategorizedSymbolRenderer, QgsDataSourceUri, QgsFeature, QgsField, QgsGeometry, QgsFillSymbol,\
-    QgsMarkerSymbol, QgsLayerTreeLayer, QgsLineSymbol, QgsProject, QgsRectangle, QgsRendererCategory, \
+    QgsMarkerSymbol, QgsLayerTreeLayer, QgsLineSymbol, QgsPointXY, QgsProject, QgsRectangle, QgsRendererCategory, \
     QgsSymbol, QgsVectorLayer, QgsVectorLayerExporter
-from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtCore import QTimer, QVariant
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtWidgets import QPushButton, QTabWidget
 
+import json
 import os
+from functools import partial
 from random import randrange
 import sys
 
@@ -21,6 +23,9 @@ from lib import qt_tools
 from ... import global_vars
 
 
+# Number of features added to a memory layer in each call to its data provider
+FEATURES_BATCH_SIZE = 10000
+
 
 def get_uri():
     """ Set the component parts of a RDBMS data source URI
@@ -183,11 +188,17 @@ def add_temp_layer(dialog, data, layer_name, force_tab=True, reset_text=True, ta
                 key = 'values'
             elif 'features' in data[k]:
                 key = 'features'
+            elif 'featuresStream' in data[k]:
+                key = 'featuresStream'
             else:
                 continue
-            counter = len(data[k][key])
-            if counter > 0:
+            if key == 'featuresStream':
+                counter = data[k][key]['count']
+                if counter == 0:
+                    global_vars.controller.close_json_stream(data[k][key]['resultId'], k)
+            else:
                 counter = len(data[k][key])
+            if counter > 0:
                 geometry_type = data[k]['geometryType']
                 try:
                     if not layer_name:
@@ -204,28 +215,44 @@ def add_temp_layer(dialog, data, layer_name, force_tab=True, reset_text=True, ta
                     populate_vlayer_old(v_layer, data, k, counter, group)
                 elif key == 'features':
                     populate_vlayer(v_layer, data, k, counter, group)
-                if 'qmlPath' in data[k] and data[k]['qmlPath']:
-                    qml_path = data[k]['qmlPath']
-                    load_qml(v_layer, qml_path)
-                elif 'category_field' in data[k] and data[k]['category_field']:
-                    cat_field = data[k]['category_field']
-                    size = data[k]['size'] if 'size' in data[k] and data[k]['size'] else 2
-                    color_values = {'NEW': QColor(0, 255, 0), 'DUPLICATED': QColor(255, 0, 0),
-                                    'EXISTS': QColor(240, 150, 0)}
-                    categoryze_layer(v_layer, cat_field, size, color_values)
-                else:
-                    if geometry_type == 'Point':
-                        v_layer.renderer().symbol().setSize(3.5)
-                        v_layer.renderer().symbol().setColor(QColor("red"))
-                    elif geometry_type == 'LineString':
-                        v_layer.renderer().symbol().setWidth(1.5)
-                        v_layer.renderer().symbol().setColor(QColor("red"))
-                    v_layer.renderer().symbol().setOpacity(0.7)
+                elif key == 'featuresStream':
+                    # Categories can only be set when all features are loaded
+                    on_finished = None
+                    if 'category_field' in data[k] and data[k]['category_field']:
+                        on_finished = partial(set_temp_layer_style, v_layer, data[k], geometry_type)
+                    populate_vlayer_stream(v_layer, data, k, group, on_finished)
+                set_temp_layer_style(v_layer, data[k], geometry_type)
                 temp_layers_added.append(v_layer)
                 global_vars.iface.layerTreeView().refreshLayerSymbology(v_layer.id())
     return {'text_result': text_result, 'temp_layers_added': temp_layers_added}
 
 
+def set_temp_layer_style(v_layer, layer_data, geometry_type):
+    """ Set style of a temporal layer added by add_temp_layer
+    :param v_layer: Memory QgsVectorLayer (QgsVectorLayer)
+    :param layer_data: Json of the layer with optional keys 'qmlPath', 'category_field' and 'size'
+    :param geometry_type: Point, LineString... (string)
+    """
+
+    if 'qmlPath' in layer_data and layer_data['qmlPath']:
+        qml_path = layer_data['qmlPath']
+        load_qml(v_layer, qml_path)
+    elif 'category_field' in layer_data and layer_data['category_field']:
+        cat_field = layer_data['category_field']
+        size = layer_data['size'] if 'size' in layer_data and layer_data['size'] else 2
+        color_values = {'NEW': QColor(0, 255, 0), 'DUPLICATED': QColor(255, 0, 0),
+                        'EXISTS': QColor(240, 150, 0)}
+        categoryze_layer(v_layer, cat_field, size, color_values)
+    else:
+        if geometry_type == 'Point':
+            v_layer.renderer().symbol().setSize(3.5)
+            v_layer.renderer().symbol().setColor(QColor("red"))
+        elif geometry_type == 'LineString':
+            v_layer.renderer().symbol().setWidth(1.5)
+            v_layer.renderer().symbol().setColor(QColor("red"))
+        v_layer.renderer().symbol().setOpacity(0.7)
+
+
 def set_layers_visible(layers):
     """ Set layers visibles in the canvas
     :param layers: list of layer names
@@ -375,33 +402,102 @@ def populate_vlayer(virtual_layer, data, layer_type, counter, group='GW Temporal
     """
 
     prov = virtual_layer.dataProvider()
-    # Enter editing mode
-    virtual_layer.startEditing()
+    features = data[layer_type]['features']
 
-    # Add headers to layer
+    # Add headers to layer, typed from the values of the features
+    field_names = []
     if counter > 0:
-        for key, value in list(data[layer_type]['features'][0]['properties'].items()):
-            if key == 'the_geom':
-                continue
-            prov.addAttributes([QgsField(str(key), QVariant.String)])
+        field_names = [key for key in features[0]['properties'] if key != 'the_geom']
+        fields = [QgsField(str(key), get_field_type(features, key)) for key in field_names]
+        prov.addAttributes(fields)
+        virtual_layer.updateFields()
+
+    add_features(virtual_layer, features, field_names)
+
+    QgsProject.instance().addMapLayer(virtual_layer, False)
+    root = QgsProject.instance().layerTreeRoot()
+    my_group = root.findGroup(group)
+    if my_group is None:
+        my_group = root.insertGroup(0, group)
+    my_group.insertLayer(0, virtual_layer)
 
-    for feature in data[layer_type]['features']:
+
+def add_features(virtual_layer, features, field_names):
+    """ Add GeoJson @features to memory layer in batches of FEATURES_BATCH_SIZE features
+    :param virtual_layer: Memory QgsVectorLayer (QgsVectorLayer)
+    :param features: List of features (GeoJson)
+    :param field_names: Names of the properties to add, in the same order as the fields of the layer (list)
+    :return: Number of features added (integer)
+    """
+
+    prov = virtual_layer.dataProvider()
+    fields = virtual_layer.fields()
+    string_fields = [fields.field(name).type() == QVariant.String for name in field_names]
+    num_features = 0
+    batch = []
+    for feature in features:
         geometry = get_geometry(feature)
         if not geometry:
             continue
-        attributes = []
-        fet = QgsFeature()
+        fet = QgsFeature(fields)
         fet.setGeometry(geometry)
-        for key, value in feature['properties'].items():
-            if key == 'the_geom':
-                continue
+        properties = feature['properties']
+        attributes = []
+        for name, is_string in zip(field_names, string_fields):
+            value = properties.get(name)
+            if is_string and isinstance(value, (dict, list)):
+                value = json.dumps(value)
             attributes.append(value)
-
         fet.setAttributes(attributes)
-        prov.addFeatures([fet])
+        batch.append(fet)
+        if len(batch) >= FEATURES_BATCH_SIZE:
+            prov.addFeatures(batch)
+            num_features += len(batch)
+            batch = []
+
+    if batch:
+        prov.addFeatures(batch)
+        num_features += len(batch)
+    virtual_layer.updateExtents()
+
+    return num_features
+
+
+def populate_vlayer_stream(virtual_layer, data, layer_type, group='GW Temporal Layers', on_finished=None):
+    """ Populate memory layer with the features of a result of DaoController.get_json_stream.
+        The first page of features is added before returning, so the layer is drawn immediately.
+        Next pages are fetched from a server-side cursor and added while the event loop keeps running
+    :param virtual_layer: Memory QgsVectorLayer (QgsVectorLayer)
+    :param data: Json with key 'featuresStream' in @layer_type
+    :param layer_type: point, line or polygon (string)
+    :param group: group to which we want to add the layer (string)
+    :param on_finished: Function called when all features have been added
+    """
+
+    controller = global_vars.controller
+    result_id = data[layer_type]['featuresStream']['resultId']
+    sql = (f"SELECT feature FROM temp_gw_result, "
+           f"jsonb_array_elements(result #> '{{body,data,{layer_type},features}}') AS feature "
+           f"WHERE id = {result_id}")
+    # Fields are typed from all the features, not only from the ones of the first page
+    field_types = get_stream_field_types(result_id, layer_type)
+    rows = controller.get_rows_iter(sql, itersize=FEATURES_BATCH_SIZE, withhold=True)
+
+    features = get_features_page(rows)
+    field_names = []
+    if features:
+        field_names = [key for key in features[0]['properties'] if key != 'the_geom']
+        if field_types is None:
+            # Types of all the features are unknown: if there are more pages, no value can be lost as String
+            if len(features) < FEATURES_BATCH_SIZE:
+                field_types = {key: get_field_type(features, key) for key in field_names}
+            else:
+                field_types = {}
+        fields = [QgsField(str(key), field_types.get(key, QVariant.String)) for key in field_names]
+        virtual_layer.dataProvider().addAttributes(fields)
+        virtual_layer.updateFields()
+        add_features(virtual_layer, features, field_names)
 
-    # Commit changes
-    virtual_layer.commitChanges()
     QgsProject.instance().addMapLayer(virtual_layer, False)
     root = QgsProject.instance().layerTreeRoot()
     my_group = root.findGroup(group)
@@ -409,29 +505,158 @@ def populate_vlayer(virtual_layer, data, layer_type, counter, group='GW Temporal
         my_group = root.insertGroup(0, group)
     my_group.insertLayer(0, virtual_layer)
 
+    def add_next_page():
+        try:
+            page = get_features_page(rows)
+            if page:
+                add_features(virtual_layer, page, field_names)
+                virtual_layer.triggerRepaint()
+                QTimer.singleShot(0, add_next_page)
+                return
+        except RuntimeError:
+            # Layer removed while loading
+            rows.close()
+            controller.close_json_stream(result_id, layer_type)
+            return
+        controller.close_json_stream(result_id, layer_type)
+        if on_finished:
+            on_finished()
+
+    if len(features) < FEATURES_BATCH_SIZE:
+        rows.close()
+        controller.close_json_stream(result_id, layer_type)
+    else:
+        QTimer.singleShot(0, add_next_page)
+
+
+def get_stream_field_types(result_id, layer_type):
+    """ Get type of the fields of all the features of a result of DaoController.get_json_stream,
+        with the same rules as get_field_type, from the JSON types of their values in the server
+    :return: {field name: QVariant.Type}, or None if they can't be read
+    """
+
+    sql = (f"SELECT p.key, array_agg(DISTINCT jsonb_typeof(p.value)) FILTER (WHERE jsonb_typeof(p.value) <> 'null'), "
+           f"bool_and(p.value::text ~ '^-?[0-9]+$') FILTER (WHERE jsonb_typeof(p.value) = 'number') "
+           f"FROM temp_gw_result, "
+           f"jsonb_array_elements(result #> '{{body,data,{layer_type},features}}') AS feature, "
+           f"jsonb_each(feature->'properties') AS p "
+           f"WHERE id = {result_id} "
+           f"GROUP BY p.key")
+    rows = global_vars.controller.get_rows(sql, log_info=False)
+    if rows is None:
+        return None
+
+    field_types = {}
+    for key, json_types, is_integer in rows:
+        json_types = set(json_types or [])
+        if json_types == {'boolean'}:
+            field_types[key] = QVariant.Bool
+        elif json_types == {'number'}:
+            field_types[key] = QVariant.LongLong if is_integer else QVariant.Double
+        else:
+            field_types[key] = QVariant.String
+
+    return field_types
+
+
+def close_temp_layer_streams(json_result):
+    """ Delete from the server the features of a result of DaoController.get_json_stream not added to any layer
+    :param json_result: Response of the function executed (json)
+    """
+
+    try:
+        data = json_result['body']['data']
+    except (KeyError, TypeError):
+        return
+
+    for key in ('point', 'line', 'polygon'):
+        if key in data and 'featuresStream' in data[key]:
+            global_vars.controller.close_json_stream(data[key]['featuresStream']['resultId'])
+
+
+def get_features_page(rows):
+    """ Get next FEATURES_BATCH_SIZE features from generator @rows of DaoController.get_rows_iter
+    :return: List of features (GeoJson)
+    """
+
+    features = []
+    for row in rows:
+        features.append(row[0])
+        if len(features) >= FEATURES_BATCH_SIZE:
+            break
+
+    return features
+
+
+def get_field_type(features, key):
+    """ Get type of field @key from all the not null values of GeoJson @features, so no value is lost by
+        a type guessed from the first ones: integers mixed with decimals are Double, any other mix is String
+    :return: QVariant.Bool, QVariant.LongLong, QVariant.Double or QVariant.String (QVariant.Type)
+    """
+
+    field_type = None
+    for feature in features:
+        value = feature['properties'].get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value_type = QVariant.Bool
+        elif isinstance(value, int):
+            value_type = QVariant.LongLong
+        elif isinstance(value, float):
+            value_type = QVariant.Double
+        else:
+            return QVariant.String
+
+        if field_type is None or field_type == value_type:
+            field_type = value_type
+        elif {field_type, value_type} == {QVariant.LongLong, QVariant.Double}:
+            field_type = QVariant.Double
+        else:
+            return QVariant.String
+
+    return field_type if field_type is not None else QVariant.String
+
 
 def get_geometry(feature):
-    """ Get coordinates from GeoJson and return QGsGeometry
+    """ Get coordinates from GeoJson and return QGsGeometry, built directly from the coordinate arrays
     :param feature: feature to get geometry type and coordinates (GeoJson)
     :return: Geometry of the feature (QgsGeometry)
-    functions  called in -> getattr(self, f"get_{feature['geometry']['type'].lower()}")(feature)
-        def get_point(self, feature)
-        get_linestring(self, feature)
-        get_multilinestring(self, feature)
-        get_polygon(self, feature)
-        get_multipolygon(self, feature)
     """
 
     try:
-        coordinates = getattr(sys.modules[__name__], f"get_{feature['geometry']['type'].lower()}")(feature)
         type_ = feature['geometry']['type']
-        geometry = f"{type_}{coordinates}"
-        return QgsGeometry.fromWkt(geometry)
-    except AttributeError as e:
+        coordinates = feature['geometry']['coordinates']
+        if type_ == 'Point':
+            return QgsGeometry.fromPointXY(QgsPointXY(coordinates[0], coordinates[1]))
+        elif type_ == 'MultiPoint':
+            return QgsGeometry.fromMultiPointXY(get_points_xy(coordinates))
+        elif type_ == 'LineString':
+            return QgsGeometry.fromPolylineXY(get_points_xy(coordinates))
+        elif type_ == 'MultiLineString':
+            return QgsGeometry.fromMultiPolylineXY([get_points_xy(line) for line in coordinates])
+        elif type_ == 'Polygon':
+            return QgsGeometry.fromPolygonXY([get_points_xy(ring) for ring in coordinates])
+        elif type_ == 'MultiPolygon':
+            return QgsGeometry.fromMultiPolygonXY(
+                [[get_points_xy(ring) for ring in polygon] for polygon in coordinates])
+
+        # Other geometry types are converted to WKT
+        coordinates = getattr(sys.modules[__name__], f"get_{type_.lower()}")(feature)
+        return QgsGeometry.fromWkt(f"{type_}{coordinates}")
+    except (AttributeError, TypeError) as e:
         global_vars.controller.log_info(f"{type(e).__name__} --> {e}")
         return None
 
 
+def get_points_xy(coordinates):
+    """ Get list of QgsPointXY from a list of GeoJson positions
+    :param coordinates: List of positions [x, y] (list)
+    :return: (list of QgsPointXY)
+    """
+    return [QgsPointXY(c[0], c[1]) for c in coordinates]
+
+
 def get_point(feature):
     """ Manage feature geometry when is Point
     :param feature: feature to get geometry type and coordinates (GeoJson)
@@ -0,0 +1,116 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.core import QgsCategorizedSymbolRenderer, QgsRendererCategory, QgsSimpleFillSymbolLayer, QgsSymbol
+from qgis.PyQt.QtGui import QColor
+
+import hashlib
+import json
+import random
+
+from ... import global_vars
+
+
+class GwMapzoneStyles:
+    """ Apply the styles returned by 'gw_fct_getstylemapzones' to the mapzone layers.
+        Categories of each layer are built in one pass from a symbol template, and the layer gets one renderer
+        and one repaint. Random colours are kept by mapzone, so they don't change every time styles are applied.
+        Layers whose style data has not changed since it was applied are not touched """
+
+    # Custom property of the layer with the signature of the style data applied to it
+    signature_property = 'gw_mapzone_style'
+
+    def __init__(self):
+
+        # Colours of mapzones without stylesheet: {(layer, idname, id): (R, G, B)}
+        self.colors = {}
+
+
+    def set_styles(self, mapzones):
+        """ Apply style of each item of @mapzones to its layer. Return number of layers restyled """
+
+        num_layers = 0
+        for mapzone in mapzones:
+            if self.set_style(mapzone):
+                num_layers += 1
+
+        return num_layers
+
+
+    def set_style(self, mapzone):
+        """ Apply style of @mapzone to its layer. Return True if its renderer has been replaced """
+
+        lyr = global_vars.controller.get_layer_by_tablename(mapzone['layer'])
+        if not lyr or not mapzone['values']:
+            return False
+
+        signature = self.get_signature(mapzone)
+        renderer = lyr.renderer()
+        if (lyr.customProperty(self.signature_property) == signature
+                and isinstance(renderer, QgsCategorizedSymbolRenderer)
+                and renderer.classAttribute() == mapzone['idname']):
+            return False
+
+        # Initialize the template symbol for this geometry type, cloned by each category
+        template = QgsSymbol.defaultSymbol(lyr.geometryType())
+        template.setOpacity(float(mapzone['opacity']))
+        symbol_layer = QgsSimpleFillSymbolLayer.create({'color': '0, 0, 0'})
+        if symbol_layer is not None:
+            template.changeSymbolLayer(0, symbol_layer)
+
+        categories = []
+        for value in mapzone['values']:
+            R, G, B = self.get_color(mapzone, value)
+            symbol = template.clone()
+            symbol.setColor(QColor(int(R), int(G), int(B)))
+            categories.append(QgsRendererCategory(value['id'], symbol, str(value['id'])))
+
+        # Apply renderer to layer and repaint it once
+        lyr.setRenderer(QgsCategorizedSymbolRenderer(mapzone['idname'], categories))
+        lyr.setCustomProperty(self.signature_property, signature)
+        lyr.triggerRepaint()
+        return True
+
+
+    def get_color(self, mapzone, value):
+        """ Return colour (R, G, B) of mapzone @value: the one of its stylesheet if status is 'Stylesheet' and it
+            has one, otherwise a random colour kept for the following calls """
+
+        if mapzone['status'] == 'Stylesheet':
+            try:
+                color = value['stylesheet']['color']
+                return color[0], color[1], color[2]
+            except (TypeError, KeyError):
+                pass
+
+        key = (mapzone['layer'], mapzone['idname'], str(value['id']))
+        color = self.colors.get(key)
+        if color is None:
+            color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+            self.colors[key] = color
+
+        return color
+
+
+    def get_signature(self, mapzone):
+        """ Return md5 of the style data of @mapzone """
+
+        data = json.dumps(mapzone, sort_keys=True, default=str)
+        return hashlib.md5(data.encode()).hexdigest()
+
+
+mapzone_styles = None
+
+
+def get_mapzone_styles():
+    """ Get mapzone styles shared by all the actions that apply them """
+
+    global mapzone_styles
+    if mapzone_styles is None:
+        mapzone_styles = GwMapzoneStyles()
+
+    return mapzone_styles
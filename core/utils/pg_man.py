@@ -5,11 +5,9 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
-from qgis.core import QgsSymbol, QgsRendererCategory, QgsCategorizedSymbolRenderer, QgsSimpleFillSymbolLayer
-
-import random
 from collections import OrderedDict
 
+from .mapzone_styles import get_mapzone_styles
 from ..models.sys_feature_cat import SysFeatureCat
 
 
@@ -48,56 +46,8 @@ class PgMan:
         if not json_return:
             return False
 
-        for mapzone in json_return['body']['data']['mapzones']:
-
-            # self.controller.log_info(f"Mapzone: ({mapzone})")
-            # Loop for each mapzone returned on json
-            lyr = self.controller.get_layer_by_tablename(mapzone['layer'])
-            categories = []
-            status = mapzone['status']
-            if status == 'Disable':
-                pass
-
-            if lyr:
-                # Loop for each id returned on json
-                for id in mapzone['values']:
-                    # initialize the default symbol for this geometry type
-                    symbol = QgsSymbol.defaultSymbol(lyr.geometryType())
-                    symbol.setOpacity(float(mapzone['opacity']))
-
-                    # Setting simp
-                    R = random.randint(0, 255)
-                    G = random.randint(0, 255)
-                    B = random.randint(0, 255)
-                    if status == 'Stylesheet':
-                        try:
-                            R = id['stylesheet']['color'][0]
-                            G = id['stylesheet']['color'][1]
-                            B = id['stylesheet']['color'][2]
-                        except TypeError:
-                            R = random.randint(0, 255)
-                            G = random.randint(0, 255)
-                            B = random.randint(0, 255)
-
-                    elif status == 'Random':
-                        R = random.randint(0, 255)
-                        G = random.randint(0, 255)
-                        B = random.randint(0, 255)
-
-                    # Setting sytle
-                    layer_style = {'color': '{}, {}, {}'.format(int(R), int(G), int(B))}
-                    symbol_layer = QgsSimpleFillSymbolLayer.create(layer_style)
-
-                    if symbol_layer is not None:
-                        symbol.changeSymbolLayer(0, symbol_layer)
-                    category = QgsRendererCategory(id['id'], symbol, str(id['id']))
-                    categories.append(category)
-
-                    # apply symbol to layer renderer
-                    lyr.setRenderer(QgsCategorizedSymbolRenderer(mapzone['idname'], categories))
-
-                    # repaint layer
-                    lyr.triggerRepaint()
+        # Apply one renderer to each mapzone layer. Layers whose style data has not changed are not repainted
+        get_mapzone_styles().set_styles(json_return['body']['data']['mapzones'])
 
 
     def manage_feature_cat(self):
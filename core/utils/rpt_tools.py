@@ -0,0 +1,109 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import json
+import re
+
+
+# Two numbers written together without blank space (ie: '0.45-12.30')
+re_overlap_negative = re.compile(r'[0-9][-]\d{1,2}[.]]*')
+# Two numbers overlapped one against the other (ie: '1234.56789.12')
+re_overlap_decimal = re.compile(r'(\d\..*\.\d)')
+re_time = re.compile(r'^([012]?[0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]$')
+
+
+def get_rpt_targets(rows):
+    """ Get dictionary of section headers and their target table from @rows of table 'config_fprocess'
+    :param rows: List of rows with fields (tablename, target)
+    :return: {header: (order, tablename)}. When several headers match the same line, the last one wins
+    """
+
+    targets = {}
+    order = 0
+    for row in rows:
+        json_elem = row[1].replace('{', '').replace('}', '')
+        for item in json_elem.split(','):
+            order += 1
+            targets[item.strip()] = (order, row[0].strip())
+
+    return targets
+
+
+def split_overlapped_negatives(token):
+    """ Split @token where it has numbers together separated only by their minus sign """
+
+    values = []
+    last_index = 0
+    for i, c in enumerate(token):
+        if c == '-':
+            values.append(token[last_index:i])
+            last_index = i
+    values.append(token[last_index:])
+
+    return values
+
+
+def read_rpt_rows(rpt_file, targets):
+    """ Parse lines of opened @rpt_file one by one, without loading the whole file into memory
+    :param rpt_file: File object of the RPT file opened in text mode
+    :param targets: Section headers from function get_rpt_targets
+    :return: Generator of tuples (read_size, target, col40, values)
+        read_size: Number of characters read from the file so far
+        target: Target table of current section between single quotes or 'null'
+        col40: Time of current section between single quotes or 'null'
+        values: List of values of the line (None if value is null)
+    :raise ValueError: If the file has overlapped columns
+    """
+
+    # While we don't find a match with the target, target and col40 must be null
+    target = "null"
+    col40 = "null"
+    read_size = 0
+    for line_number, row in enumerate(rpt_file, 1):
+
+        read_size += len(row)
+        if '**' in row or '--' in row:
+            continue
+
+        dirty_list = [item for item in row.rstrip().split(' ') if item != '']
+        if not dirty_list:
+            continue
+
+        sp_n = []
+        for item in dirty_list:
+            if '-' in item and re_overlap_negative.search(item):
+                sp_n.extend(split_overlapped_negatives(item))
+            elif item.count('.') > 1 and re_overlap_decimal.search(item):
+                if 'Version' not in dirty_list and 'VERSION' not in dirty_list:
+                    raise ValueError(f"Error near line {line_number} -> {dirty_list}")
+            else:
+                sp_n.append(item)
+
+        # Find section header and set target column
+        if len(sp_n) > 1:
+            found = targets.get(f'{sp_n[0]} {sp_n[1]}')
+            single = targets.get(sp_n[0])
+            if single and (found is None or single[0] > found[0]):
+                found = single
+            if found:
+                target = "'" + found[1] + "'"
+                if len(sp_n) > 3 and re_time.search(sp_n[3]):
+                    col40 = "'" + sp_n[3] + "'"
+
+        if sp_n:
+            values = [None if "''" in value else value.strip() for value in sp_n]
+            yield read_size, target, col40, values
+
+
+def rpt_row_to_json(target, col40, values):
+    """ Return JSON text of a row returned by function read_rpt_rows """
+
+    row = {'target': target, 'col40': col40}
+    for x, value in enumerate(values, 1):
+        row[f'col{x}'] = value
+
+    return json.dumps(row)
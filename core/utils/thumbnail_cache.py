@@ -0,0 +1,168 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtGui import QImage
+
+import hashlib
+import os
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+from ... import global_vars
+
+
+class GwThumbnailCache:
+    """ Thumbnails of images kept in memory and on disk, both bounded and evicting the least recently used ones.
+        It's used from the threads of the tasks that load images, so all operations are locked """
+
+    def __init__(self, folder, max_disk_size=50 * 1048576, max_memory_items=200):
+        """
+        :param folder: Folder where thumbnails are saved
+        :param max_disk_size: Max. size in bytes of the thumbnails saved on disk
+        :param max_memory_items: Max. number of thumbnails kept in memory
+        """
+
+        self.folder = folder
+        self.max_disk_size = max_disk_size
+        self.max_memory_items = max_memory_items
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        # Files of the folder ordered by last use: {filename: size}. Loaded on first use
+        self.disk_files = None
+        self.disk_size = 0
+
+
+    def get_key(self, path, width, height):
+        """ Get key of the thumbnail of @path with size @width x @height.
+            Local files are identified also by their modification time, so that they are updated if changed """
+
+        key = f"{path}|{width}x{height}"
+        url = urllib.parse.urlsplit(str(path))
+        if url.scheme not in ("http", "https"):
+            try:
+                stat = os.stat(path)
+                key += f"|{stat.st_mtime}|{stat.st_size}"
+            except OSError:
+                return None
+
+        return hashlib.md5(key.encode()).hexdigest()
+
+
+    def get(self, key, memory_only=False):
+        """ Return thumbnail QImage of @key, or None if it's not cached """
+
+        if key is None:
+            return None
+
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+                return image
+            if memory_only:
+                return None
+
+            self.load_disk_files()
+            filename = f"{key}.jpg"
+            if filename not in self.disk_files:
+                return None
+            filepath = os.path.join(self.folder, filename)
+            image = QImage(filepath)
+            if image.isNull():
+                self.remove_disk_file(filename)
+                return None
+            try:
+                os.utime(filepath)
+            except OSError:
+                pass
+            self.disk_files.move_to_end(filename)
+            self.add_memory(key, image)
+            return image
+
+
+    def put(self, key, image):
+        """ Save thumbnail QImage @image of @key in memory and on disk """
+
+        if key is None or image is None or image.isNull():
+            return
+
+        with self.lock:
+            self.add_memory(key, image)
+            self.load_disk_files()
+            filename = f"{key}.jpg"
+            filepath = os.path.join(self.folder, filename)
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                if not image.save(filepath, "JPG", 85):
+                    return
+                size = os.path.getsize(filepath)
+            except OSError as e:
+                global_vars.controller.log_warning(f"Error saving thumbnail: {e}")
+                return
+
+            self.disk_size += size - self.disk_files.pop(filename, 0)
+            self.disk_files[filename] = size
+            while self.disk_size > self.max_disk_size and len(self.disk_files) > 1:
+                self.remove_disk_file(next(iter(self.disk_files)))
+
+
+    def add_memory(self, key, image):
+
+        self.memory[key] = image
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+
+    def load_disk_files(self):
+        """ List thumbnails saved on disk by previous sessions, ordered by their last use """
+
+        if self.disk_files is not None:
+            return
+
+        self.disk_files = OrderedDict()
+        self.disk_size = 0
+        if not os.path.exists(self.folder):
+            return
+
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, filename, size in sorted(files):
+            self.disk_files[filename] = size
+            self.disk_size += size
+
+
+    def remove_disk_file(self, filename):
+
+        self.disk_size -= self.disk_files.pop(filename, 0)
+        try:
+            os.remove(os.path.join(self.folder, filename))
+        except OSError:
+            pass
+
+
+thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    """ Get thumbnail cache shared by all galleries. Its size (MB) is set in 'thumbnail_cache_size' of config file """
+
+    global thumbnail_cache
+    if thumbnail_cache is None:
+        max_disk_size = global_vars.settings.value('system_variables/thumbnail_cache_size')
+        try:
+            max_disk_size = int(max_disk_size) * 1048576
+        except (TypeError, ValueError):
+            max_disk_size = 50 * 1048576
+        main_folder = os.path.join(os.path.expanduser("~"), global_vars.controller.plugin_name)
+        thumbnail_cache = GwThumbnailCache(os.path.join(main_folder, "cache", "thumbnails"), max_disk_size)
+
+    return thumbnail_cache
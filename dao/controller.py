@@ -28,7 +28,7 @@ from lib import os_tools, qt_tools
 from ..ui_manager import DialogTextUi, DockerUi
 from ..actions.parent_functs import manage_return_manager, manage_layer_manager, manage_actions
 from ..lib.qgis_tools import qgis_get_layer_by_tablename, qgis_get_layer_source, qgis_get_layer_source_table_name, \
-    qgis_get_layer_primary_key, qgis_get_layers
+    qgis_get_layer_primary_key, qgis_get_layers, qgis_get_visible_layers, qgis_get_editable_layers
 from ..core.utils.giswater_tools import get_parser_value, set_parser_value
 
 
@@ -61,6 +61,9 @@ class DaoController:
         self.show_docker = None
         self.prev_maptool = None
         self.gw_infotools = None
+        self.function_catalog = {}
+        # Results of get_json_stream kept in the server: {result id: geometry keys whose features are not loaded}
+        self.json_streams = {}
 
         if create_logger:
             self.set_logger(logger_name)
@@ -153,6 +156,7 @@ class DaoController:
         self.last_error = None
         self.logged = False
         self.current_user = None
+        self.refresh_function_catalog()
 
         self.layer_source, not_version = self.get_layer_source_from_credentials()
         if self.layer_source:
@@ -364,6 +368,7 @@ class DaoController:
         # Connect to Database
         self.dao = PgDao()
         self.dao.set_params(host, port, db, user, pwd, sslmode)
+        self.set_pool_size()
         status = self.dao.init_db()
         if not status:
             message = "Database connection error. Please open plugin log file to get more details"
@@ -398,6 +403,7 @@ class DaoController:
         # Connect to Database
         self.dao = PgDao()
         self.dao.set_conn_string(conn_string)
+        self.set_pool_size()
         status = self.dao.init_db()
         if not status:
             message = "Database connection error (PgDao). Please open plugin log file to get more details"
@@ -408,6 +414,45 @@ class DaoController:
         return status
 
 
+    def set_pool_size(self):
+        """ Set maximum number of pooled connections used by background tasks (config file) """
+
+        pool_size = self.settings.value('system_variables/db_pool_size')
+        try:
+            if pool_size not in (None, ''):
+                self.dao.pool_size = max(1, int(pool_size))
+        except ValueError:
+            self.log_warning("Parameter 'db_pool_size' is not valid", parameter=pool_size)
+
+
+    def checkout_thread_connection(self):
+        """ Get a database connection of the pool for current thread. Must be released with
+            release_thread_connection. If no connection is available, the caller must give up: queries of threads
+            other than the GUI one fail without a connection of their own """
+
+        if self.dao is None:
+            return False
+
+        status = self.dao.checkout_conn()
+        if not status:
+            self.log_warning("Unable to get a pooled connection", parameter=str(self.dao.last_error))
+
+        return status
+
+
+    def release_thread_connection(self, commit=True):
+        """ Return database connection of current thread to the pool """
+
+        if self.dao is None:
+            return False
+
+        status = self.dao.checkin_conn(commit)
+        if not status:
+            self.log_warning("Error releasing pooled connection", parameter=str(self.dao.last_error))
+
+        return status
+
+
     def check_db_connection(self):
         """ Check database connection. Reconnect if needed """
 
@@ -629,6 +674,18 @@ class DaoController:
         return rows
 
 
+    def get_rows_iter(self, sql, itersize=2000, log_sql=False, params=None, withhold=False):
+        """ Execute SQL and return a generator of its rows, fetched in blocks of @itersize from a server-side cursor.
+            Check its result in log tables, and show it to the user """
+
+        sql = self.get_sql(sql, log_sql, params)
+        for row in self.dao.get_rows_iter(sql, itersize, withhold):
+            yield row
+        self.last_error = self.dao.last_error
+        if self.last_error:
+            self.manage_exception_db(self.last_error, sql)
+
+
     def execute_sql(self, sql, log_sql=False, log_error=False, commit=True, filepath=None):
         """ Execute SQL. Check its result in log tables, and show it to the user """
 
@@ -661,6 +718,20 @@ class DaoController:
         return value
 
 
+    def copy_expert(self, sql, file, size=8192, log_sql=False):
+        """ Execute COPY statement @sql reading from or writing to @file. Check its result and show it to the user """
+
+        if log_sql:
+            self.log_info(sql, stack_level_increase=1)
+        error = self.dao.copy_expert(sql, file, size)
+        self.last_error = error
+        if error:
+            self.manage_exception_db(error, sql)
+            return False
+
+        return True
+
+
     def execute_insert_or_update(self, tablename, unique_field, unique_value, fields, values, commit=True):
         """ Execute INSERT or UPDATE sentence. Used for PostgreSQL database versions <9.5 """
 
@@ -807,9 +878,85 @@ class DaoController:
         if log_result:
             self.log_info(json_result, stack_level_increase=1)
 
+        return self.manage_json_result(json_result, sql, rubber_band, is_notify)
+
+
+    def get_json_stream(self, function_name, parameters=None, schema_name=None, log_sql=False, is_notify=False,
+                        rubber_band=None):
+        """ Manage execution API function like get_json, but keeping the features of the result
+            (body.data.point|line|polygon.features) in temporary table 'temp_gw_result' of the server.
+            Each of these keys gets 'featuresStream' instead of 'features', so add_temp_layer fetches the features
+            in pages from a server-side cursor and the client never has the whole result in memory
+        :return: Response of the function executed without features (json)
+        """
+
+        # Check if function exists
+        row = self.check_function(function_name, schema_name)
+        if not row:
+            self.show_warning("Function not found in database", parameter=function_name)
+            return None
+
+        if schema_name:
+            function_name = f"{schema_name}.{function_name}"
+        sql = (f"CREATE TEMP TABLE IF NOT EXISTS temp_gw_result (id serial PRIMARY KEY, result jsonb);\n"
+               f"INSERT INTO temp_gw_result (result) SELECT {function_name}({parameters or ''})::jsonb RETURNING id;")
+        row = self.execute_returning(sql, log_sql=log_sql)
+        if not row:
+            return None
+        result_id = row[0]
+
+        geometry_keys = ('point', 'line', 'polygon')
+        fields = "result"
+        for key in geometry_keys:
+            fields += f" #- '{{body,data,{key},features}}'"
+        for key in geometry_keys:
+            features = f"result #> '{{body,data,{key},features}}'"
+            fields += (f", CASE WHEN jsonb_typeof({features}) = 'array' "
+                       f"THEN jsonb_array_length({features}) END")
+        sql = f"SELECT {fields} FROM temp_gw_result WHERE id = {result_id}"
+        row = self.get_row(sql, log_sql=log_sql, commit=True)
+        if not row or not row[0]:
+            self.log_warning(f"Function error: {function_name}")
+            self.log_warning(sql)
+            self.execute_sql(f"DELETE FROM temp_gw_result WHERE id = {result_id}")
+            return None
+
+        json_result = row[0]
+        self.json_streams[result_id] = set()
+        for key, count in zip(geometry_keys, row[1:]):
+            if count is None:
+                continue
+            json_result['body']['data'][key]['featuresStream'] = {'resultId': result_id, 'count': count}
+            self.json_streams[result_id].add(key)
+        if not self.json_streams[result_id]:
+            self.close_json_stream(result_id)
+
+        return self.manage_json_result(json_result, sql, rubber_band, is_notify)
+
+
+    def close_json_stream(self, result_id, key=None):
+        """ Delete result of get_json_stream from the server once features of all its keys have been loaded
+        :param key: Geometry key (point, line or polygon) whose features are loaded. If None, delete result anyway
+        """
+
+        keys = self.json_streams.get(result_id)
+        if keys is None:
+            return
+        if key is not None:
+            keys.discard(key)
+            if keys:
+                return
+
+        del self.json_streams[result_id]
+        self.execute_sql(f"DELETE FROM temp_gw_result WHERE id = {result_id}")
+
+
+    def manage_json_result(self, json_result, sql=None, rubber_band=None, is_notify=False):
+        """ Manage json returned by an API function: exceptions, layer styles and actions """
+
         # If failed, manage exception
         if 'status' in json_result and json_result['status'] == 'Failed':
-            self.manage_exception_api(json_result, sql, is_notify=is_notify)
+            self.manage_exception_api(json_result, sql, stack_level_increase=1, is_notify=is_notify)
             return json_result
 
         try:
@@ -937,7 +1084,7 @@ class DaoController:
 
 
     def get_layer_by_tablename(self, tablename, show_warning=False, log_info=False):
-        """ Iterate over all layers and get the one with selected @tablename """
+        """ Get the first layer in TOC with selected @tablename. Layers are indexed by (schema, table) """
 
         return qgis_get_layer_by_tablename(tablename, show_warning, log_info)
 
@@ -1240,20 +1387,62 @@ class DaoController:
 
 
     def check_function(self, function_name, schema_name=None, commit=True):
-        """ Check if @function_name exists in selected schema """
+        """ Check if @function_name exists in selected schema.
+            Look for it in the function catalog of the schema, loading it the first time """
 
         if schema_name is None:
             schema_name = self.schema_name
 
         schema_name = schema_name.replace('"', '')
+        catalog = self.function_catalog.get(schema_name)
+        if catalog is None:
+            catalog = self.load_function_catalog(schema_name, commit)
+        if catalog and function_name.lower() in catalog:
+            return (function_name, )
+
+        # Function may have been created after loading the catalog
         sql = ("SELECT routine_name FROM information_schema.routines "
                "WHERE lower(routine_schema) = %s "
                "AND lower(routine_name) = %s")
         params = [schema_name, function_name]
         row = self.get_row(sql, params=params, commit=commit)
+        if row and catalog is not None:
+            catalog.add(function_name.lower())
         return row
 
 
+    def load_function_catalog(self, schema_name=None, commit=True):
+        """ Load names of all functions of @schema_name into the function catalog """
+
+        if schema_name is None:
+            schema_name = self.schema_name
+
+        schema_name = schema_name.replace('"', '')
+        sql = ("SELECT DISTINCT(lower(routine_name)) FROM information_schema.routines "
+               "WHERE lower(routine_schema) = %s")
+        params = [schema_name]
+        rows = self.get_rows(sql, log_info=False, params=params, commit=commit)
+        if rows is None and self.last_error:
+            return None
+
+        catalog = set()
+        if rows:
+            catalog = {row[0] for row in rows}
+        self.function_catalog[schema_name] = catalog
+
+        return catalog
+
+
+    def refresh_function_catalog(self, schema_name=None):
+        """ Invalidate function catalog of @schema_name (or of all schemas if not set).
+            It will be loaded again at next call of check_function """
+
+        if schema_name is None:
+            self.function_catalog = {}
+        else:
+            self.function_catalog.pop(schema_name.replace('"', ''), None)
+
+
     def check_table(self, tablename, schemaname=None):
         """ Check if selected table exists in selected schema """
 
@@ -1452,11 +1641,26 @@ class DaoController:
         return qgis_get_layers()
 
 
+    def get_visible_layers(self, as_list=False):
+        """ Return string as {...} or [...] with name of table in DB of all visible layer in TOC """
+
+        return qgis_get_visible_layers(as_list)
+
+
+    def get_editable_layers(self):
+        """ Return string as {...}  with name of table in DB of all editable layer in TOC """
+
+        return qgis_get_editable_layers()
+
+
     def set_search_path(self, schema_name):
         """ Set parameter search_path for current QGIS project """
 
         sql = f"SET search_path = {schema_name}, public;"
         self.execute_sql(sql)
+        # Pooled connections will set the same search_path when checked out
+        if self.dao:
+            self.dao.search_path = f"{schema_name}, public"
 
 
     def set_path_from_qfiledialog(self, qtextedit, path):
@@ -7,12 +7,43 @@ or (at your option) any later version.
 # -*- coding: utf-8 -*-
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import threading
+import uuid
 
 
 class PgDao(object):
 
     def __init__(self):
+
+        # Errors are stored by thread, so a background task cannot overwrite the error of a GUI query
+        self.local = threading.local()
         self.last_error = None
+        # Only the thread that creates the DAO (GUI thread) can use the main connection, besides the threads
+        # of the notify poller, which listens on it
+        self.main_thread_id = threading.get_ident()
+        self.main_conn_threads = set()
+
+        # Pool of connections used by threads that have checked out their own connection.
+        # The main connection (self.conn) is always kept outside the pool
+        self.pool = None
+        self.pool_size = 4
+        self.pool_timeout = 30
+        self.pool_semaphore = None
+        self.pool_lock = threading.Lock()
+        self.thread_conns = {}
+        self.search_path = None
+        self.conn_search_paths = {}
+
+
+    @property
+    def last_error(self):
+        return getattr(self.local, 'last_error', None)
+
+
+    @last_error.setter
+    def last_error(self, value):
+        self.local.last_error = value
 
 
     def init_db(self):
@@ -33,6 +64,7 @@ class PgDao(object):
 
         try:
             status = True
+            self.close_pool()
             if self.cursor:
                 self.cursor.close()
             if self.conn:
@@ -46,18 +78,170 @@ class PgDao(object):
         return status
 
 
+    def init_pool(self, pool_size=None):
+        """ Initializes pool of connections used by background threads """
+
+        if pool_size:
+            self.pool_size = int(pool_size)
+
+        try:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(0, self.pool_size, self.conn_string)
+                    self.pool_semaphore = threading.BoundedSemaphore(self.pool_size)
+            status = True
+        except psycopg2.DatabaseError as e:
+            self.last_error = e
+            status = False
+        return status
+
+
+    def close_pool(self):
+        """ Close all connections of the pool """
+
+        with self.pool_lock:
+            if self.pool is None:
+                return
+            for item in self.thread_conns.values():
+                if not item['cursor'].closed:
+                    item['cursor'].close()
+            self.thread_conns = {}
+            self.conn_search_paths = {}
+            self.pool.closeall()
+            self.pool = None
+            self.pool_semaphore = None
+
+
+    def checkout_conn(self):
+        """ Assign a connection of the pool to current thread until checkin_conn is called.
+            Waits up to @pool_timeout seconds if all connections are in use """
+
+        thread_id = threading.get_ident()
+        item = self.thread_conns.get(thread_id)
+        if item:
+            item['count'] += 1
+            return True
+
+        if self.pool is None and not self.init_pool():
+            return False
+
+        self.last_error = None
+        if not self.pool_semaphore.acquire(timeout=self.pool_timeout):
+            self.last_error = psycopg2.pool.PoolError(f"No connection available after {self.pool_timeout} seconds")
+            return False
+
+        try:
+            conn = self.pool.getconn(key=thread_id)
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            # Pooled connections keep their search_path between checkouts: only set it when it has changed
+            if self.search_path and self.conn_search_paths.get(id(conn)) != self.search_path:
+                cursor.execute(f"SET search_path = {self.search_path};")
+                conn.commit()
+                self.conn_search_paths[id(conn)] = self.search_path
+        except Exception as e:
+            self.last_error = e
+            self.pool_semaphore.release()
+            return False
+
+        with self.pool_lock:
+            self.thread_conns[thread_id] = {'conn': conn, 'cursor': cursor, 'count': 1}
+
+        return True
+
+
+    def checkin_conn(self, commit=True):
+        """ Return connection of current thread to the pool """
+
+        thread_id = threading.get_ident()
+        item = self.thread_conns.get(thread_id)
+        if item is None:
+            return True
+
+        item['count'] -= 1
+        if item['count'] > 0:
+            return True
+
+        status = True
+        conn = item['conn']
+        try:
+            if not conn.closed:
+                if commit:
+                    conn.commit()
+                else:
+                    conn.rollback()
+        except Exception as e:
+            self.last_error = e
+            status = False
+        finally:
+            with self.pool_lock:
+                del self.thread_conns[thread_id]
+                if not item['cursor'].closed:
+                    item['cursor'].close()
+                if conn.closed:
+                    self.conn_search_paths.pop(id(conn), None)
+                if self.pool:
+                    self.pool.putconn(conn, key=thread_id, close=bool(conn.closed))
+                    self.pool_semaphore.release()
+
+        return status
+
+
+    def get_conn(self):
+        """ Return connection checked out by current thread or, in the GUI thread, the main one """
+
+        item = self.thread_conns.get(threading.get_ident())
+        if item:
+            return item['conn']
+        self.check_main_thread()
+        return self.conn
+
+
+    def get_cursor(self):
+        """ Return cursor of the connection checked out by current thread or, in the GUI thread, the main one """
+
+        item = self.thread_conns.get(threading.get_ident())
+        if item:
+            return item['cursor']
+        self.check_main_thread()
+        return self.cursor
+
+
+    def check_main_thread(self):
+        """ Raise an error if current thread is not allowed to use the main connection. psycopg2 connections
+            can't be shared with the GUI thread and the notify poller, so other threads must check out their own """
+
+        thread_id = threading.get_ident()
+        if thread_id != self.main_thread_id and thread_id not in self.main_conn_threads:
+            raise psycopg2.InterfaceError("No database connection checked out by current thread")
+
+
     def check_cursor(self):
         """ Check if cursor is closed """
 
-        if self.cursor.closed:
-            self.init_db()
+        item = self.thread_conns.get(threading.get_ident())
+        if item:
+            if item['conn'].closed:
+                self.pool.putconn(item['conn'], key=threading.get_ident(), close=True)
+                item['conn'] = self.pool.getconn(key=threading.get_ident())
+                item['cursor'] = item['conn'].cursor(cursor_factory=psycopg2.extras.DictCursor)
+                if self.search_path:
+                    item['cursor'].execute(f"SET search_path = {self.search_path};")
+                    item['conn'].commit()
+            elif item['cursor'].closed:
+                item['cursor'] = item['conn'].cursor(cursor_factory=psycopg2.extras.DictCursor)
+        else:
+            self.check_main_thread()
+            if self.cursor.closed:
+                self.init_db()
 
 
     def cursor_execute(self, sql):
-        """ Check if cursor is closed before execution """
+        """ Check if cursor is closed before execution. Return cursor used """
 
         self.check_cursor()
-        self.cursor.execute(sql)
+        cursor = self.get_cursor()
+        cursor.execute(sql)
+        return cursor
 
 
     def get_poll(self):
@@ -106,7 +290,7 @@ class PgDao(object):
 
         query = sql
         try:
-            query = self.cursor.mogrify(sql, params)
+            query = self.get_cursor().mogrify(sql, params)
         except Exception as e:
             self.last_error = e
         finally:
@@ -119,8 +303,8 @@ class PgDao(object):
         self.last_error = None
         rows = None
         try:
-            self.cursor_execute(sql)
-            rows = self.cursor.fetchall()
+            cursor = self.cursor_execute(sql)
+            rows = cursor.fetchall()
             if commit:
                 self.commit()
         except Exception as e:
@@ -131,14 +315,39 @@ class PgDao(object):
             return rows
 
 
+    def get_rows_iter(self, sql, itersize=2000, withhold=False):
+        """ Get multiple rows from selected query using a server-side cursor.
+            Rows are fetched from server in blocks of @itersize, so they are never all in memory.
+            If @withhold, the cursor survives the commits of other queries executed while it is being read """
+
+        self.last_error = None
+        cursor = None
+        try:
+            self.check_cursor()
+            cursor_name = f"gw_cursor_{uuid.uuid4().hex}"
+            cursor = self.get_conn().cursor(cursor_name, cursor_factory=psycopg2.extras.DictCursor,
+                                            withhold=withhold)
+            cursor.itersize = itersize
+            cursor.execute(sql)
+            if withhold:
+                self.commit()
+            for row in cursor:
+                yield row
+        except Exception as e:
+            self.last_error = e
+        finally:
+            if cursor and not cursor.closed:
+                cursor.close()
+
+
     def get_row(self, sql, commit=False):
         """ Get single row from selected query """
 
         self.last_error = None
         row = None
         try:
-            self.cursor_execute(sql)
-            row = self.cursor.fetchone()
+            cursor = self.cursor_execute(sql)
+            row = cursor.fetchone()
             if commit:
                 self.commit()
         except Exception as e:
@@ -155,7 +364,7 @@ class PgDao(object):
         name = None
         try:
             self.check_cursor()
-            name = self.cursor.description[index][0]
+            name = self.get_cursor().description[index][0]
         except Exception as e:
             self.last_error = e
         finally:
@@ -168,7 +377,7 @@ class PgDao(object):
         total = None
         try:
             self.check_cursor()
-            total = len(self.cursor.description)
+            total = len(self.get_cursor().description)
         except Exception as e:
             self.last_error = e
         finally:
@@ -199,8 +408,8 @@ class PgDao(object):
         self.last_error = None
         value = None
         try:
-            self.cursor_execute(sql)
-            value = self.cursor.fetchone()
+            cursor = self.cursor_execute(sql)
+            value = cursor.fetchone()
             if commit:
                 self.commit()
         except Exception as e:
@@ -213,28 +422,87 @@ class PgDao(object):
     def get_rowcount(self):
         """ Returns number of rows of current query """
         self.check_cursor()
-        return self.cursor.rowcount
+        return self.get_cursor().rowcount
 
 
     def commit(self):
         """ Commit current database transaction """
         self.check_cursor()
-        self.conn.commit()
+        self.get_conn().commit()
 
 
     def rollback(self):
         """ Rollback current database transaction """
         self.check_cursor()
-        self.conn.rollback()
+        self.get_conn().rollback()
 
 
-    def copy_expert(self, sql, csv_file):
-        """ Dumps contents of the query to selected CSV file """
+    def copy_expert(self, sql, csv_file, size=8192):
+        """ Execute COPY statement @sql dumping contents of the query to selected CSV file (COPY ... TO STDOUT)
+            or loading it from selected file object (COPY ... FROM STDIN), reading it in blocks of @size """
 
+        self.last_error = None
         try:
-            self.cursor.copy_expert(sql, csv_file)
+            self.check_cursor()
+            self.get_cursor().copy_expert(sql, csv_file, size)
             return None
         except Exception as e:
+            self.last_error = e
+            # A failed COPY aborts the transaction: leave the connection usable for the following queries
+            try:
+                self.rollback()
+            except Exception:
+                pass
             return e
 
 
+class PgCopyReader(object):
+    """ File-like object that feeds COPY ... FROM STDIN from an iterable of lines.
+        Lines are consumed on demand, so only the block requested by the cursor is held in memory """
+
+    def __init__(self, lines, progress_callback=None):
+
+        self.lines = iter(lines)
+        self.buffer = ""
+        self.progress_callback = progress_callback
+        self.rows = 0
+
+
+    def read(self, size=-1):
+
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                line = next(self.lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+
+        data = "".join(chunks)
+        if size < 0:
+            self.buffer = ""
+        else:
+            data, self.buffer = data[:size], data[size:]
+        if self.progress_callback:
+            self.progress_callback(self.rows)
+
+        return data
+
+
+def copy_escape(value):
+    """ Return @value escaped for COPY text format. None is written as NULL (\\N) """
+
+    if value is None:
+        return "\\N"
+
+    value = str(value)
+    if '\\' in value:
+        value = value.replace('\\', '\\\\')
+    if '\t' in value or '\n' in value or '\r' in value:
+        value = value.replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return value
+
+
@@ -17,7 +17,7 @@ from . import global_vars
 from .core.load_project import LoadProject
 from .core.admin import GwAdmin
 from .dao.controller import DaoController
-from .lib.qgis_tools import get_value_from_metadata
+from .lib.qgis_tools import get_value_from_metadata, qgis_close_layer_registry
 
 
 class Giswater(QObject):
@@ -249,6 +249,9 @@ class Giswater(QObject):
         # Remove Giswater dockers
         self.remove_dockers()
 
+        # Stop listening to signals of the project: module is removed or project layers will be indexed again
+        qgis_close_layer_registry()
+
         # Save toolbar position after unload plugin
         try:
             self.save_toolbars_position()
@@ -5,8 +5,8 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
-from qgis.core import QgsExpressionContextUtils, QgsProject, QgsSnappingConfig, QgsVectorLayer, QgsPointLocator, \
-    QgsSnappingUtils, QgsTolerance, QgsPointXY, QgsFeatureRequest
+from qgis.core import QgsDataSourceUri, QgsExpressionContextUtils, QgsProject, QgsSnappingConfig, QgsVectorLayer, \
+    QgsPointLocator, QgsSnappingUtils, QgsTolerance, QgsPointXY, QgsFeatureRequest, QgsLayerTree
 
 from qgis.PyQt.QtWidgets import QDockWidget
 
@@ -14,9 +14,30 @@ from qgis.PyQt.QtCore import QPoint
 
 import configparser
 import os.path
+from collections import namedtuple
+from functools import partial
+
 from .. import global_vars
 
 
+# Layers of current project indexed by (schema, table), kept current by signals of QgsProject.
+# See functions qgis_init_layer_registry and qgis_get_layer_by_tablename. Slots connected to signals of each layer
+# are kept by layer id in 'connected', so they can be disconnected by qgis_close_layer_registry
+layer_registry = {'initialized': False, 'layers': {}, 'tables': {}, 'layer_keys': {}, 'connected': {},
+                  'main_schema': None}
+
+# Layers of the layer tree in TOC order, with their visible and editable ones, kept current by signals of the layer
+# tree and of the layers. See functions qgis_get_visible_layers and qgis_get_editable_layers
+layer_tree_cache = {'initialized': False, 'layers': None, 'visible': set(), 'editable': set(), 'connected': {},
+                    'visible_layers': {}, 'editable_layers': None}
+
+# Parsed data source of a layer. Values not set in the data source are None
+LayerSource = namedtuple('LayerSource', ['db', 'host', 'port', 'user', 'password', 'service', 'schema', 'table',
+                                         'key', 'srid', 'geometry_column', 'sql'])
+# Parsed data sources of the layers of current project by layer id. See function qgis_get_layer_descriptor
+layer_sources = {}
+
+
 def get_value_from_metadata(parameter, default_value):
     """ Get @parameter from metadata.txt file """
 
@@ -88,6 +109,40 @@ def qgis_get_layers():
     return layers
 
 
+def qgis_get_layer_descriptor(layer):
+    """ Get parsed data source of @layer (LayerSource).
+        Layers of the project are cached by layer id until they are removed or their data source changes """
+
+    if not layer_registry['initialized']:
+        qgis_init_layer_registry()
+
+    layer_id = layer.id()
+    layer_source = layer_sources.get(layer_id)
+    if layer_source is not None:
+        return layer_source
+
+    provider = layer.dataProvider()
+    uri = provider.dataSourceUri() if provider else layer.source()
+    layer_source = qgis_parse_layer_source(uri)
+    # Only layers of the project, because signals of the project invalidate the cache
+    if QgsProject.instance().mapLayer(layer_id) is not None:
+        layer_sources[layer_id] = layer_source
+
+    return layer_source
+
+
+def qgis_parse_layer_source(uri):
+    """ Parse data source @uri of a layer
+    :return: (LayerSource)
+    """
+
+    uri = QgsDataSourceUri(uri)
+    values = [uri.database(), uri.host(), uri.port(), uri.username(), uri.password(), uri.service(), uri.schema(),
+              uri.table(), uri.keyColumn().replace('"', ''), uri.srid(), uri.geometryColumn(), uri.sql()]
+
+    return LayerSource(*[value if value != '' else None for value in values])
+
+
 def qgis_get_layer_source(layer):
     """ Get database connection paramaters of @layer """
 
@@ -98,48 +153,12 @@ def qgis_get_layer_source(layer):
     if layer is None:
         return layer_source
 
-    # Get dbname, host, port, user and password
-    uri = layer.dataProvider().dataSourceUri()
-    pos_db = uri.find('dbname=')
-    pos_host = uri.find(' host=')
-    pos_port = uri.find(' port=')
-    pos_user = uri.find(' user=')
-    pos_password = uri.find(' password=')
-    pos_sslmode = uri.find(' sslmode=')
-    pos_key = uri.find(' key=')
-    if pos_db != -1 and pos_host != -1:
-        uri_db = uri[pos_db + 8:pos_host - 1]
-        layer_source['db'] = uri_db
-    if pos_host != -1 and pos_port != -1:
-        uri_host = uri[pos_host + 6:pos_port]
-        layer_source['host'] = uri_host
-    if pos_port != -1:
-        if pos_user != -1:
-            pos_end = pos_user
-        elif pos_sslmode != -1:
-            pos_end = pos_sslmode
-        elif pos_key != -1:
-            pos_end = pos_key
-        else:
-            pos_end = pos_port + 10
-        uri_port = uri[pos_port + 6:pos_end]
-        layer_source['port'] = uri_port
-    if pos_user != -1 and pos_password != -1:
-        uri_user = uri[pos_user + 7:pos_password - 1]
-        layer_source['user'] = uri_user
-    if pos_password != -1 and pos_sslmode != -1:
-        uri_password = uri[pos_password + 11:pos_sslmode - 1]
-        layer_source['password'] = uri_password
-
-        # Get schema and table or view name
-    pos_table = uri.find('table=')
-    pos_end_schema = uri.rfind('.')
-    pos_fi = uri.find('" ')
-    if pos_table != -1 and pos_fi != -1:
-        uri_schema = uri[pos_table + 6:pos_end_schema]
-        uri_table = uri[pos_end_schema + 2:pos_fi]
-        layer_source['schema'] = uri_schema
-        layer_source['table'] = uri_table
+    descriptor = qgis_get_layer_descriptor(layer)
+    for key in ('db', 'table', 'service', 'host', 'port', 'user', 'password'):
+        layer_source[key] = getattr(descriptor, key)
+    # Schema between double quotes, as written in the data source
+    if descriptor.schema is not None and descriptor.table is not None:
+        layer_source['schema'] = f'"{descriptor.schema}"'
 
     return layer_source
 
@@ -150,15 +169,11 @@ def qgis_get_layer_source_table_name(layer):
     if layer is None:
         return None
 
-    uri_table = None
-    uri = layer.dataProvider().dataSourceUri().lower()
-    pos_ini = uri.find('table=')
-    pos_end_schema = uri.rfind('.')
-    pos_fi = uri.find('" ')
-    if pos_ini != -1 and pos_fi != -1:
-        uri_table = uri[pos_end_schema + 2:pos_fi]
+    uri_table = qgis_get_layer_descriptor(layer).table
+    if uri_table is None:
+        return None
 
-    return uri_table
+    return uri_table.lower()
 
 
 def qgis_get_layer_schema(layer):
@@ -167,16 +182,11 @@ def qgis_get_layer_schema(layer):
     if layer is None:
         return None
 
-    table_schema = None
-    uri = layer.dataProvider().dataSourceUri().lower()
-
-    pos_ini = uri.find('table=')
-    pos_end_schema = uri.rfind('.')
-    pos_fi = uri.find('" ')
-    if pos_ini != -1 and pos_fi != -1:
-        table_schema = uri[pos_ini + 7:pos_end_schema - 1]
+    descriptor = qgis_get_layer_descriptor(layer)
+    if descriptor.schema is None or descriptor.table is None:
+        return None
 
-    return table_schema
+    return descriptor.schema.lower()
 
 
 def qgis_get_layer_primary_key(layer=None):
@@ -187,33 +197,46 @@ def qgis_get_layer_primary_key(layer=None):
         layer = global_vars.iface.activeLayer()
     if layer is None:
         return uri_pk
-    uri = layer.dataProvider().dataSourceUri().lower()
-    pos_ini = uri.find('key=')
-    pos_end = uri.rfind('srid=')
-    if pos_ini != -1:
-        uri_pk = uri[pos_ini + 5:pos_end - 2]
+
+    uri_pk = qgis_get_layer_descriptor(layer).key
+    if uri_pk is not None:
+        uri_pk = uri_pk.lower()
 
     return uri_pk
 
 
 def qgis_get_layer_by_tablename(tablename, show_warning=False, log_info=False):
-    """ Iterate over all layers and get the one with selected @tablename """
-
-    # Check if we have any layer loaded
-    layers = qgis_get_layers()
-    if len(layers) == 0:
-        return None
-
-    # Iterate over all layers
+    """ Get the first layer in TOC with selected @tablename, looking it up in the layer registry """
+
+    if not layer_registry['initialized']:
+        qgis_init_layer_registry()
+
+    # Layers with the same table name, from main schema if defined
+    main_schema = layer_registry['main_schema']
+    if main_schema is None:
+        main_schema = get_project_variable('gwMainSchema') or ''
+        layer_registry['main_schema'] = main_schema
+    if main_schema in ('', None):
+        keys = layer_registry['tables'].get(tablename, [])
+    else:
+        keys = [(main_schema, tablename)]
+    candidate_ids = []
+    for key in keys:
+        candidate_ids.extend(layer_registry['layers'].get(key, []))
+
+    # Only layers in the layer tree. If there are several, get the first one in TOC order
+    project = QgsProject.instance()
+    root = project.layerTreeRoot()
+    candidates = [project.mapLayer(layer_id) for layer_id in candidate_ids if root.findLayer(layer_id)]
     layer = None
-    project_vars = get_qgis_project_variables()
-    main_schema = project_vars['main_schema']
-    for cur_layer in layers:
-        uri_table = qgis_get_layer_source_table_name(cur_layer)
-        table_schema = qgis_get_layer_schema(cur_layer)
-        if (uri_table is not None and uri_table == tablename) and main_schema in ('', None, table_schema):
-            layer = cur_layer
-            break
+    if len(candidates) == 1:
+        layer = candidates[0]
+    elif candidates:
+        candidate_ids = [candidate.id() for candidate in candidates]
+        for cur_layer in qgis_get_layers():
+            if cur_layer.id() in candidate_ids:
+                layer = cur_layer
+                break
 
     if layer is None and show_warning:
         pass
@@ -226,6 +249,259 @@ def qgis_get_layer_by_tablename(tablename, show_warning=False, log_info=False):
     return layer
 
 
+def qgis_init_layer_registry():
+    """ Index layers of current project by (schema, table) and keep the index current with signals of QgsProject """
+
+    project = QgsProject.instance()
+    if not layer_registry['initialized']:
+        project.layersAdded.connect(qgis_register_layers)
+        project.layersRemoved.connect(qgis_unregister_layers)
+        project.customVariablesChanged.connect(qgis_reset_layer_registry_schema)
+        project.readProject.connect(qgis_reset_layer_registry_schema)
+        layer_registry['initialized'] = True
+
+    layer_registry['layers'] = {}
+    layer_registry['tables'] = {}
+    layer_registry['layer_keys'] = {}
+    layer_registry['main_schema'] = None
+    layer_sources.clear()
+    qgis_register_layers(list(project.mapLayers().values()))
+
+
+def qgis_close_layer_registry():
+    """ Disconnect layer registry and layer tree cache from signals of QgsProject, its layer tree and its layers.
+        Called when plugin is unloaded, so no function of this module is called afterwards """
+
+    project = QgsProject.instance()
+    if layer_registry['initialized']:
+        qgis_disconnect_signal(project, 'layersAdded', qgis_register_layers)
+        qgis_disconnect_signal(project, 'layersRemoved', qgis_unregister_layers)
+        qgis_disconnect_signal(project, 'customVariablesChanged', qgis_reset_layer_registry_schema)
+        qgis_disconnect_signal(project, 'readProject', qgis_reset_layer_registry_schema)
+        layer_registry['initialized'] = False
+
+    if layer_tree_cache['initialized']:
+        root = project.layerTreeRoot()
+        qgis_disconnect_signal(root, 'visibilityChanged', qgis_update_layer_tree_visibility)
+        qgis_disconnect_signal(root, 'addedChildren', qgis_reset_layer_tree_cache)
+        qgis_disconnect_signal(root, 'removedChildren', qgis_reset_layer_tree_cache)
+        layer_tree_cache['initialized'] = False
+
+    for layer, slot in layer_registry['connected'].values():
+        qgis_disconnect_signal(layer, 'dataSourceChanged', slot)
+    for layer, slot in layer_tree_cache['connected'].values():
+        qgis_disconnect_signal(layer, 'readOnlyChanged', slot)
+
+    layer_registry.update({'layers': {}, 'tables': {}, 'layer_keys': {}, 'connected': {}, 'main_schema': None})
+    layer_tree_cache.update({'layers': None, 'visible': set(), 'editable': set(), 'connected': {},
+                             'visible_layers': {}, 'editable_layers': None})
+    layer_sources.clear()
+
+
+def qgis_disconnect_signal(obj, signal_name, slot):
+    """ Disconnect @slot from signal @signal_name of @obj, if it's still connected and @obj still exists """
+
+    try:
+        getattr(obj, signal_name).disconnect(slot)
+    except (AttributeError, TypeError, RuntimeError):
+        pass
+
+
+def qgis_reset_layer_registry_schema(*args):
+    """ Main schema is read again from project variables on next lookup """
+
+    layer_registry['main_schema'] = None
+
+
+def qgis_register_layers(layers):
+    """ Add @layers to the layer registry """
+
+    for layer in layers:
+        if layer.id() in layer_registry['layer_keys']:
+            continue
+        try:
+            table = qgis_get_layer_source_table_name(layer)
+            schema = qgis_get_layer_schema(layer)
+        except AttributeError:
+            continue
+        layer_registry['layer_keys'][layer.id()] = (schema, table)
+        if table is None:
+            continue
+        key = (schema, table)
+        layer_registry['layers'].setdefault(key, []).append(layer.id())
+        keys = layer_registry['tables'].setdefault(table, [])
+        if key not in keys:
+            keys.append(key)
+        # Data source of the layer can be changed without removing it from the project
+        if hasattr(layer, 'dataSourceChanged') and layer.id() not in layer_registry['connected']:
+            slot = partial(qgis_update_layer_registry, layer)
+            layer.dataSourceChanged.connect(slot)
+            layer_registry['connected'][layer.id()] = (layer, slot)
+
+
+def qgis_unregister_layers(layer_ids):
+    """ Remove layers with @layer_ids from the layer registry """
+
+    for layer_id in layer_ids:
+        layer_registry['connected'].pop(layer_id, None)
+        layer_sources.pop(layer_id, None)
+        schema_table = layer_registry['layer_keys'].pop(layer_id, None)
+        if schema_table is None or schema_table[1] is None:
+            continue
+        layer_ids = layer_registry['layers'].get(schema_table, [])
+        if layer_id in layer_ids:
+            layer_ids.remove(layer_id)
+        if layer_ids:
+            continue
+        del layer_registry['layers'][schema_table]
+        keys = layer_registry['tables'].get(schema_table[1], [])
+        if schema_table in keys:
+            keys.remove(schema_table)
+        if not keys:
+            layer_registry['tables'].pop(schema_table[1], None)
+
+
+def qgis_update_layer_registry(layer):
+    """ Index @layer again after its data source has changed """
+
+    try:
+        layer_id = layer.id()
+    except RuntimeError:
+        return
+    # Signal dataSourceChanged is still connected
+    connected = layer_registry['connected'].get(layer_id)
+    qgis_unregister_layers([layer_id])
+    if connected:
+        layer_registry['connected'][layer_id] = connected
+    qgis_register_layers([layer])
+    qgis_reset_layer_tree_cache()
+
+
+def qgis_get_visible_layers(as_list=False):
+    """ Return string as {...} or [...] with name of table in DB of all visible layer in TOC.
+        Result is kept until visibility of any layer or the layer tree changes """
+
+    key = 'list' if as_list else 'array'
+    visible_layers = layer_tree_cache['visible_layers'].get(key)
+    if visible_layers is not None:
+        return visible_layers
+
+    tables = [f'"{table_name}"' for layer_id, table_name, is_db_layer in qgis_get_layer_tree_layers()
+              if is_db_layer and layer_id in layer_tree_cache['visible']]
+    if as_list:
+        visible_layers = '[' + ', '.join(tables) + ']'
+    else:
+        visible_layers = '{' + ', '.join(tables) + '}'
+    layer_tree_cache['visible_layers'][key] = visible_layers
+    return visible_layers
+
+
+def qgis_get_editable_layers():
+    """ Return string as {...}  with name of table in DB of all editable layer in TOC.
+        Result is kept until any layer is set read-only or the layer tree changes """
+
+    editable_layers = layer_tree_cache['editable_layers']
+    if editable_layers is not None:
+        return editable_layers
+
+    tables = [f'"{table_name}"' for layer_id, table_name, is_db_layer in qgis_get_layer_tree_layers()
+              if layer_id in layer_tree_cache['editable']]
+    editable_layers = '{' + ', '.join(tables) + '}'
+    layer_tree_cache['editable_layers'] = editable_layers
+    return editable_layers
+
+
+def qgis_get_layer_tree_layers():
+    """ Return list of tuples (layer_id, table_name, is_db_layer) of the layers in TOC order.
+        The list is only built again when layers are added, removed or moved in the layer tree """
+
+    if not layer_tree_cache['initialized']:
+        qgis_init_layer_tree_cache()
+    if layer_tree_cache['layers'] is not None:
+        return layer_tree_cache['layers']
+
+    layers = []
+    visible = set()
+    editable = set()
+    project = QgsProject.instance()
+    layer_ids = set(project.mapLayers().keys())
+    connected_layers = layer_tree_cache['connected']
+    layer_tree_cache['connected'] = {layer_id: connected for layer_id, connected in connected_layers.items()
+                                     if layer_id in layer_ids}
+    for node in project.layerTreeRoot().findLayers():
+        layer = node.layer()
+        if layer is None:
+            continue
+        layer_id = layer.id()
+        table_name = qgis_get_layer_source_table_name(layer)
+        # TODO:: Find differences between PostgreSQL and query layers, and replace this if condition.
+        provider = layer.dataProvider()
+        table = provider.dataSourceUri() if provider else layer.source()
+        is_db_layer = 'SELECT row_number() over ()' not in str(table) and 'srid' in str(table)
+        layers.append((layer_id, table_name, is_db_layer))
+        if node.itemVisibilityChecked():
+            visible.add(layer_id)
+        if not layer.isReadOnly():
+            editable.add(layer_id)
+        if hasattr(layer, 'readOnlyChanged') and layer_id not in layer_tree_cache['connected']:
+            slot = partial(qgis_update_layer_tree_editable, layer)
+            layer.readOnlyChanged.connect(slot)
+            layer_tree_cache['connected'][layer_id] = (layer, slot)
+
+    layer_tree_cache['layers'] = layers
+    layer_tree_cache['visible'] = visible
+    layer_tree_cache['editable'] = editable
+    return layers
+
+
+def qgis_init_layer_tree_cache():
+    """ Keep the layer tree cache current with signals of the layer tree """
+
+    root = QgsProject.instance().layerTreeRoot()
+    root.visibilityChanged.connect(qgis_update_layer_tree_visibility)
+    root.addedChildren.connect(qgis_reset_layer_tree_cache)
+    root.removedChildren.connect(qgis_reset_layer_tree_cache)
+    layer_tree_cache['initialized'] = True
+    qgis_reset_layer_tree_cache()
+
+
+def qgis_reset_layer_tree_cache(*args):
+    """ Layer tree has changed. Its layers are listed again on next call to qgis_get_layer_tree_layers """
+
+    layer_tree_cache['layers'] = None
+    layer_tree_cache['visible_layers'] = {}
+    layer_tree_cache['editable_layers'] = None
+
+
+def qgis_update_layer_tree_visibility(node):
+    """ Update visible layers after check state of layer tree @node has changed """
+
+    if layer_tree_cache['layers'] is None or not QgsLayerTree.isLayer(node):
+        return
+
+    if node.itemVisibilityChecked():
+        layer_tree_cache['visible'].add(node.layerId())
+    else:
+        layer_tree_cache['visible'].discard(node.layerId())
+    layer_tree_cache['visible_layers'] = {}
+
+
+def qgis_update_layer_tree_editable(layer):
+    """ Update editable layers after @layer has been set read-only or editable """
+
+    try:
+        layer_id = layer.id()
+        read_only = layer.isReadOnly()
+    except RuntimeError:
+        return
+
+    if read_only:
+        layer_tree_cache['editable'].discard(layer_id)
+    else:
+        layer_tree_cache['editable'].add(layer_id)
+    layer_tree_cache['editable_layers'] = None
+
+
 def qgis_manage_snapping_layer(layername, snapping_type=0, tolerance=15.0):
     """ Manage snapping of @layername """
 
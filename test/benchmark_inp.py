@@ -0,0 +1,78 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+import time
+
+# Modules are imported from the plugin folder, so the benchmark can be run from any folder:
+#   python test/benchmark_inp.py [num_lines]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.inp_tools import read_inp_rows
+from dao.pg_dao import PgCopyReader, copy_escape
+
+
+# Number of columns csv1, csv2... of table 'temp_csv'
+NUM_COLUMNS = 20
+
+
+def create_inp_file(filepath, num_lines):
+    """ Write a synthetic EPANET INP file of @num_lines lines into @filepath """
+
+    sections = ("[JUNCTIONS]", "[PIPES]", "[COORDINATES]")
+    with open(filepath, 'w') as inp_file:
+        inp_file.write("[TITLE]\n")
+        line = 1
+        section = 0
+        while line < num_lines:
+            inp_file.write(f"\n{sections[section % 3]}\n")
+            inp_file.write(";ID              \tElevation   \tDemand      \tPattern\n")
+            line += 3
+            for i in range(min(5000, num_lines - line)):
+                inp_file.write(f" N{section}_{i:<12}\t{i * 0.013:10.3f}\t{i * 0.5:10.2f}\tPAT_1  \t;\n")
+                line += 1
+            section += 1
+
+
+def benchmark_inp(num_lines=500000):
+
+    folder = tempfile.mkdtemp()
+    filepath = os.path.join(folder, 'benchmark.inp')
+    print(f"Creating INP file with {num_lines} lines: {filepath}")
+    create_inp_file(filepath, num_lines)
+    print(f"File size: {os.path.getsize(filepath) / 1048576:.1f} MB")
+
+    def get_copy_lines(inp_file):
+        for read_size, target, values in read_inp_rows(inp_file):
+            line = [copy_escape(value) for value in values]
+            line.extend(["\\N"] * (NUM_COLUMNS - len(values)))
+            yield f"239\t{copy_escape(target)}\t" + "\t".join(line) + "\n"
+
+    # Encode rows as they would be sent to the server by COPY, without connecting to any database
+    start = time.perf_counter()
+    size = 0
+    with open(filepath, 'r') as inp_file:
+        reader = PgCopyReader(get_copy_lines(inp_file))
+        data = reader.read(65536)
+        while data:
+            size += len(data)
+            data = reader.read(65536)
+    elapsed = time.perf_counter() - start
+    print(f"Encoded {reader.rows} rows ({size / 1048576:.1f} MB) in {elapsed:.2f} seconds "
+          f"({reader.rows / elapsed:.0f} rows/s)")
+
+    os.remove(filepath)
+    os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark_inp(int(sys.argv[1]))
+    else:
+        benchmark_inp()
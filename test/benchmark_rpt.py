@@ -0,0 +1,68 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+import time
+
+# Modules are imported from the plugin folder, so the benchmark can be run from any folder:
+#   python test/benchmark_rpt.py [num_lines]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.rpt_tools import get_rpt_targets, read_rpt_rows, rpt_row_to_json
+
+
+# Same format as rows of table 'config_fprocess' (tablename, target)
+TARGETS = [('rpt_node', '{Node Results}'), ('rpt_arc', '{Link Results}'), ('rpt_runoff_quant', '{Runoff Quantity}')]
+
+
+def create_rpt_file(filepath, num_lines):
+    """ Write a synthetic SWMM report of @num_lines lines into @filepath """
+
+    sections = ("Node Results", "Link Results", "Runoff Quantity")
+    with open(filepath, 'w') as rpt_file:
+        rpt_file.write("  EPA STORM WATER MANAGEMENT MODEL - VERSION 5.0 (Build 5.0.022)\n")
+        line = 1
+        section = 0
+        while line < num_lines:
+            rpt_file.write(f"  <<< {sections[section % 3]} at 12:00:00 >>>\n")
+            rpt_file.write("  ----------------------------------------------------------------\n")
+            line += 2
+            for i in range(min(5000, num_lines - line)):
+                rpt_file.write(f"  NODE_{i:<10}  12:00:00  {i * 0.013:10.3f}  {i * 0.5:10.2f}  0.45-12.30  0.000\n")
+                line += 1
+            section += 1
+
+
+def benchmark_rpt(num_lines=2000000):
+
+    folder = tempfile.mkdtemp()
+    filepath = os.path.join(folder, 'benchmark.rpt')
+    print(f"Creating RPT file with {num_lines} lines: {filepath}")
+    create_rpt_file(filepath, num_lines)
+    print(f"File size: {os.path.getsize(filepath) / 1048576:.1f} MB")
+
+    targets = get_rpt_targets(TARGETS)
+    start = time.perf_counter()
+    num_rows = 0
+    with open(filepath, 'r') as rpt_file:
+        for read_size, target, col40, values in read_rpt_rows(rpt_file, targets):
+            rpt_row_to_json(target, col40, values)
+            num_rows += 1
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {num_rows} rows in {elapsed:.2f} seconds ({num_rows / elapsed:.0f} rows/s)")
+
+    os.remove(filepath)
+    os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark_rpt(int(sys.argv[1]))
+    else:
+        benchmark_rpt()
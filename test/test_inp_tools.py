@@ -0,0 +1,61 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import unittest
+
+# Modules are imported from the plugin folder:
+#   python -m unittest discover -s test -p "test_*_tools.py"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.inp_tools import read_inp_rows, split_inp_row
+
+
+INP_LINES = ("[TITLE]\n"
+             "\n"
+             "[JUNCTIONS]\n"
+             ";;Id  Elevation\n"
+             ";;---- ----------\n"
+             "J1  10.5\t''  ;\n")
+
+
+class TestInpTools(unittest.TestCase):
+
+    def test_split_inp_row(self):
+
+        self.assertEqual(split_inp_row("J1  10.5\t2.0 ;", '[JUNCTIONS]'), ['J1', '10.5', '2.0'])
+        # Comments are kept as a single value
+        self.assertEqual(split_inp_row(";Junction of the main street", '[JUNCTIONS]'),
+                         [';Junction of the main street'])
+        # Separator lines are skipped
+        self.assertEqual(split_inp_row(";;------ ----", '[JUNCTIONS]'), [])
+
+
+    def test_split_inp_row_sections(self):
+
+        self.assertEqual(split_inp_row("RULE R1 IF NODE J1 DEPTH > 2", '[RULES]'),
+                         ['RULE R1 IF NODE J1 DEPTH > 2'])
+        self.assertEqual(split_inp_row("MONTHLY 1.0 2.0", '[EVAPORATION]'), ['MONTHLY', '1.0 2.0'])
+
+
+    def test_read_inp_rows(self):
+
+        rows = list(read_inp_rows(io.StringIO(INP_LINES)))
+
+        self.assertEqual([row[1:] for row in rows], [
+            ('[TITLE]', ['[TITLE]']),
+            ('[JUNCTIONS]', ['[JUNCTIONS]']),
+            ('[JUNCTIONS]', [';;Id  Elevation']),
+            ('[JUNCTIONS]', ['J1', '10.5', None])])
+        # Read size is the number of characters read until the end of each row
+        self.assertEqual(rows[-1][0], len(INP_LINES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import sys
+import unittest
+
+# Modules are imported from the plugin folder:
+#   python -m unittest discover -s test -p "test_*_tools.py"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.rpt_tools import get_rpt_targets, read_rpt_rows, rpt_row_to_json
+
+
+# Same format as rows of table 'config_fprocess' (tablename, target)
+TARGETS = [('rpt_node', '{Node Depth}'), ('rpt_arc', '{Link Flow, Conduit}')]
+
+RPT_LINES = ("  EPA STORM WATER MANAGEMENT MODEL - VERSION 5.0 (Build 5.0.022)\n"
+             "  ******************\n"
+             "  Node Depth Summary\n"
+             "  ----------------------------------------\n"
+             "\n"
+             "  J1  JUNCTION  0.013  0.45\n"
+             "  Link Flow  at  12:00:00\n"
+             "  C1  CONDUIT  1.5  ''\n")
+
+
+class TestRptTools(unittest.TestCase):
+
+    def read_rows(self, text):
+        return list(read_rpt_rows(io.StringIO(text), get_rpt_targets(TARGETS)))
+
+
+    def test_get_rpt_targets(self):
+
+        targets = get_rpt_targets(TARGETS)
+        self.assertEqual(targets, {'Node Depth': (1, 'rpt_node'), 'Link Flow': (2, 'rpt_arc'),
+                                   'Conduit': (3, 'rpt_arc')})
+
+
+    def test_read_rpt_rows(self):
+
+        rows = self.read_rows(RPT_LINES)
+
+        # Separator and blank lines are skipped
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][1:3], ('null', 'null'))
+        self.assertEqual(rows[1][1:], ("'rpt_node'", 'null', ['Node', 'Depth', 'Summary']))
+        self.assertEqual(rows[2][1:], ("'rpt_node'", 'null', ['J1', 'JUNCTION', '0.013', '0.45']))
+        self.assertEqual(rows[3][1:3], ("'rpt_arc'", "'12:00:00'"))
+        # Quoted empty values are null
+        self.assertEqual(rows[4][1:], ("'rpt_arc'", "'12:00:00'", ['C1', 'CONDUIT', '1.5', None]))
+        # Read size is the number of characters read until the end of each row
+        self.assertEqual(rows[-1][0], len(RPT_LINES))
+
+
+    def test_read_rpt_rows_overlapped_negative(self):
+
+        rows = self.read_rows("  Node Depth Summary\n  J1  0.45-12.30  1.0\n")
+
+        self.assertEqual(rows[1][3], ['J1', '0.45', '-12.30', '1.0'])
+
+
+    def test_read_rpt_rows_overlapped_decimal(self):
+
+        with self.assertRaises(ValueError):
+            self.read_rows("  Node Depth Summary\n  J1  1234.56789.12\n")
+
+
+    def test_rpt_row_to_json(self):
+
+        row = json.loads(rpt_row_to_json("'rpt_node'", 'null', ['J1', None]))
+        self.assertEqual(row, {'target': "'rpt_node'", 'col40': 'null', 'col1': 'J1', 'col2': None})
+
+
+if __name__ == '__main__':
+    unittest.main()